@@ -0,0 +1,147 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+import game_map
+
+#Tile kind codes stored in ArrayGrid.kinds
+EMPTY = 0
+ROCK = 1
+RESOURCE = 2
+RESOURCE_CELL = 3
+OUTPOST = 4
+OTHER = 5
+
+KIND_BY_TYPE = {
+	"Rock": ROCK,
+	"Resource": RESOURCE,
+	"ResourceCell": RESOURCE_CELL,
+	"Outpost": OUTPOST,
+}
+
+NO_ENTITY = -1
+
+class GridMapView(Mapping):
+	#Read only stand in for Grid.map, so code that walks the dict keeps working
+	def __init__(self, grid):
+		self.grid = grid
+	def __getitem__(self, pt):
+		return self.grid.get_tile(pt)
+	def __iter__(self):
+		return iter(self.grid.points())
+	def __len__(self):
+		return (self.grid.xm + 1) * (self.grid.ym + 1)
+
+class ArrayGrid(game_map.Grid):
+	#Grid backed by dense arrays, indexed [y, x].
+	#Rocks are only a kind code, every other tile is a rich object in entities, found through entity_ids.
+	def _init_storage(self):
+		self.width = self.xm + 1
+		self._attach_kinds(np.zeros((self.ym + 1, self.xm + 1), dtype = np.uint8))
+	def _attach_kinds(self, kinds):
+		#Take over an existing kinds array, for instance one mapped from a map file.
+		#Only rocks are derived from it, every other tile still has to be set with its object.
+		rocks = kinds == ROCK
+		self.kinds = kinds
+		self.route_costs = np.where(rocks, 0, 1).astype(np.uint8)
+		#Whether the tile itself allows routes, in_grid is checked separately
+		self.route_allowed = ~rocks
+		#route_allowed and in_grid together, with a border of one point that never allows routes,
+		#so route_neighbours finds the four neighbours at fixed offsets without bounds checks. A byte a point.
+		self.route_mask = np.zeros((self.ym + 2, self.xm + 2), dtype = np.uint8)
+		self.route_mask[1:-1, 1:-1] = self.route_allowed[:self.ym, :self.xm]
+		self.supports_outpost = np.zeros(kinds.shape, dtype = np.bool_)
+		self.entity_ids = np.full(kinds.shape, NO_ENTITY, dtype = np.int32)
+		self.entities = []
+		self.free_entity_ids = []
+
+		#Flat views for fast scalar access from python
+		self._kinds = memoryview(self.kinds.reshape(-1))
+		self._route_costs = memoryview(self.route_costs.reshape(-1))
+		self._route_allowed = memoryview(self.route_allowed.reshape(-1))
+		self._route_mask = memoryview(self.route_mask.reshape(-1))
+		self._supports_outpost = memoryview(self.supports_outpost.reshape(-1))
+		self._entity_ids = memoryview(self.entity_ids.reshape(-1))
+	@property
+	def map(self):
+		return GridMapView(self)
+	def _index(self, pt):
+		x,y = pt
+		if x < 0 or y < 0 or x > self.xm or y > self.ym:
+			raise KeyError(pt)
+		return y * self.width + x
+	def points(self):
+		return ((x, y) for y in range(self.ym + 1) for x in range(self.xm + 1))
+	def get_tile(self, pt):
+		i = self._index(pt)
+		kind = self._kinds[i]
+		if kind == EMPTY:
+			return None
+		if kind == ROCK:
+			return game_map.ROCK_TILE
+		return self.entities[self._entity_ids[i]]
+	def _store_tile(self, pt, item):
+		i = self._index(pt)
+		entity_id = self._entity_ids[i]
+		if entity_id != NO_ENTITY:
+			self.entities[entity_id] = None
+			self.free_entity_ids.append(entity_id)
+			self._entity_ids[i] = NO_ENTITY
+		if item is None:
+			self._kinds[i] = EMPTY
+			self._route_costs[i] = 1
+			self._set_route_allowed(pt, i, True)
+			self._supports_outpost[i] = False
+			return
+		kind = KIND_BY_TYPE.get(item.type, OTHER)
+		self._kinds[i] = kind
+		allowed = item.allows_route()
+		self._set_route_allowed(pt, i, allowed)
+		self._route_costs[i] = item.get_route_cost() if allowed else 0
+		self._supports_outpost[i] = item.supports_outpost()
+		if kind != ROCK:
+			if self.free_entity_ids:
+				entity_id = self.free_entity_ids.pop()
+				self.entities[entity_id] = item
+			else:
+				entity_id = len(self.entities)
+				self.entities.append(item)
+			self._entity_ids[i] = entity_id
+	def _set_route_allowed(self, pt, i, allowed):
+		self._route_allowed[i] = allowed
+		if self.in_grid(pt):
+			x,y = pt
+			self._route_mask[(y + 1) * (self.xm + 2) + x + 1] = allowed
+	def is_route_allowed(self, pt):
+		return self.in_grid(pt) and self._route_allowed[self._index(pt)]
+	def get_route_cost(self, pt):
+		return self._route_costs[self._index(pt)]
+	def route_neighbours(self, pt):
+		#The border of the route mask is never allowed, so the neighbours need no bounds checks
+		x,y = pt
+		xm = self.xm
+		if not (0 <= x < xm and 0 <= y < self.ym):
+			return super().route_neighbours(pt)
+		mask = self._route_mask
+		width = xm + 2
+		i = (y + 1) * width + x + 1
+		found = []
+		if mask[i - width]:
+			found.append((x, y - 1))
+		if mask[i + 1]:
+			found.append((x + 1, y))
+		if mask[i + width]:
+			found.append((x, y + 1))
+		if mask[i - 1]:
+			found.append((x - 1, y))
+		return found
+	def supporting_neighbour_counts(self, xs, ys):
+		#4-neighbour stencil over the supports mask, evaluated only at the given points.
+		#Neighbours outside in_grid are not counted, same as get_neighbouring_points.
+		mask = self.supports_outpost
+		counts = np.zeros(len(xs), dtype = np.int64)
+		counts += (xs > 0) & mask[ys, np.maximum(xs - 1, 0)]
+		counts += (xs + 1 < self.xm) & mask[ys, np.minimum(xs + 1, self.xm)]
+		counts += (ys > 0) & mask[np.maximum(ys - 1, 0), xs]
+		counts += (ys + 1 < self.ym) & mask[np.minimum(ys + 1, self.ym), xs]
+		return counts
@@ -0,0 +1,64 @@
+import sys
+import time
+import tracemalloc
+
+import array_grid
+import chunked_grid
+import game_map
+
+#Time and memory to the first frame, generating the whole map against generating chunks as they are looked at,
+#then the cost of route lookups over the same block of loaded points
+#usage: python bench_chunks.py [xm ym ...]
+
+DEFAULT_SIZES = [(400, 200), (800, 400), (100000, 100000)]
+#Bigger maps take too long to generate whole
+FULL_LIMIT = 800 * 400
+SEED = 1
+BLOCK = 128
+
+def measure(build):
+	tracemalloc.start()
+	start = time.perf_counter()
+	grid = build()
+	seconds = time.perf_counter() - start
+	used = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return seconds, used, grid
+
+def lookups(grid, points):
+	#What a route search asks of every point it reaches
+	for pt in points:
+		for n in grid.get_neighbouring_points(pt):
+			if grid.is_route_allowed(n):
+				grid.get_route_cost(n)
+
+def time_lookups(grid, x0, y0):
+	points = [(x, y) for y in range(y0, y0 + BLOCK) for x in range(x0, x0 + BLOCK)]
+	#Once to load the chunks
+	lookups(grid, points)
+	start = time.perf_counter()
+	lookups(grid, points)
+	return (time.perf_counter() - start) / len(points) * 1e6
+
+def block_origin(grid):
+	x, y = grid.start_location
+	return max(0, min(x - BLOCK // 2, grid.xm - BLOCK)), max(0, min(y - BLOCK // 2, grid.ym - BLOCK))
+
+def run(sizes):
+	print("{:>14} {:>10} {:>10} {:>10} {:>10} {:>12} {:>12}".format("map", "full s", "full MB", "chunked s", "chunked MB",
+		"full us/pt", "chunked us/pt"))
+	for xm, ym in sizes:
+		chunked_s, chunked_bytes, chunked = measure(lambda: chunked_grid.ChunkedGrid.create(xm, ym, SEED))
+		chunked_us = time_lookups(chunked, *block_origin(chunked))
+		row = ["{}x{}".format(xm, ym), "-", "-", "{:.3f}".format(chunked_s), "{:.2f}".format(chunked_bytes / 1e6), "-",
+			"{:.2f}".format(chunked_us)]
+		if xm * ym <= FULL_LIMIT:
+			full_s, full_bytes, full = measure(lambda: game_map.get_grid(xm, ym, array_grid.ArrayGrid, SEED))
+			row[1:3] = ["{:.3f}".format(full_s), "{:.2f}".format(full_bytes / 1e6)]
+			row[5] = "{:.2f}".format(time_lookups(full, *block_origin(full)))
+			del full
+		print("{:>14} {:>10} {:>10} {:>10} {:>10} {:>12} {:>12}".format(*row))
+
+if __name__=="__main__":
+	args = [int(arg) for arg in sys.argv[1:]]
+	run(list(zip(args[::2], args[1::2])) or DEFAULT_SIZES)
@@ -0,0 +1,66 @@
+import sys
+import copy
+import time
+
+import game_map
+from game_map import av, directions
+
+#Dead end pruning on corridor heavy maps, the old full rescan against the worklist pruner
+#usage: python bench_mapgen.py [width height ...]
+
+DEFAULT_SIZES = [(40, 20), (80, 40), (160, 80)]
+FAILED_ATTEMPTS = 500
+MIN_ROOM_DIM = 3
+ROOM_VAR = 5
+
+def legacy_prune_dead_ends(m, open_points):
+	#Dead end removal as getMap used to do it, every round rescans every open point
+	dead_ends = set()
+	for point in open_points:
+		ns = [av(point, dir) for dir in directions if not m.spot_empty(av(point,dir))]
+		if len(ns) == 3:
+			x,y = point
+			m.grid[y][x] = "#"
+			dead_ends.add((x,y))
+	while len(dead_ends):
+		for de in dead_ends:
+			open_points.discard(de)
+		dead_ends = set()
+		for point in open_points:
+			ns = [av(point, dir) for dir in directions if not m.spot_empty(av(point,dir))]
+			if len(ns) >= 3:
+				x,y = point
+				m.grid[y][x] = "#"
+				dead_ends.add((x,y))
+
+def carve(width, height, seed):
+	#Rooms and straight biased mazes, no doors, so every maze is a tree of dead ends
+	parameters = game_map.MapParameters(failed_attempts = FAILED_ATTEMPTS, bias_straight = True,
+		min_room_dim = MIN_ROOM_DIM, room_variation = ROOM_VAR)
+	generator = game_map.MapGenerator(seed, parameters)
+	m = game_map.Map(width, height)
+	rooms = generator.carve_rooms(m)
+	generator.carve_mazes(m, len(rooms))
+	return m, generator.collect_open_points(m)
+
+def time_prune(prune, m, open_points):
+	start = time.perf_counter()
+	prune(m, open_points)
+	return time.perf_counter() - start
+
+def run(sizes):
+	print("{:>9} {:>8} {:>8} {:>11} {:>11} {:>8}".format("map", "open", "pruned", "rescan ms", "worklist ms", "speedup"))
+	for width, height in sizes:
+		m, open_points = carve(width, height, width * height)
+		legacy_map, legacy_points = copy.deepcopy(m), set(open_points)
+		open_count = len(open_points)
+		legacy_time = time_prune(legacy_prune_dead_ends, legacy_map, legacy_points)
+		worklist_time = time_prune(game_map.prune_dead_ends, m, open_points)
+		assert str(legacy_map) == str(m) and legacy_points == open_points
+		print("{:>9} {:>8} {:>8} {:>11.1f} {:>11.1f} {:>7.1f}x".format(
+			"{}x{}".format(m.xm, m.ym), open_count, open_count - len(open_points),
+			legacy_time * 1000, worklist_time * 1000, legacy_time / worklist_time))
+
+if __name__=="__main__":
+	args = [int(arg) for arg in sys.argv[1:]]
+	run(list(zip(args[::2], args[1::2])) or DEFAULT_SIZES)
@@ -0,0 +1,44 @@
+import sys
+import time
+
+import game_map
+
+#Maze carving in MapGenerator, every maze start picked from a full rescan of the align points as makeMaze does
+#on its own, against the MazeStartCandidates list that is kept up to date while the map is cleared
+#usage: python bench_mazes.py [width height ...]
+
+DEFAULT_SIZES = [(16, 16), (40, 20), (80, 40), (160, 80)]
+SEED = 1
+
+class RescanGenerator(game_map.MapGenerator):
+	def carve_mazes(self, m, first_zone_id):
+		mazes = []
+		more = True
+		while more:
+			more = game_map.makeMaze(m, self.rng, self.parameters.bias_straight)
+			if more:
+				m.mark_zone(more.points, first_zone_id + len(mazes))
+				mazes.append(more)
+		return mazes
+
+def time_mazes(generator_class, width, height):
+	generator = generator_class(SEED, game_map.MapParameters())
+	m = game_map.Map(width, height)
+	rooms = generator.carve_rooms(m)
+	start = time.perf_counter()
+	mazes = generator.carve_mazes(m, len(rooms))
+	return time.perf_counter() - start, len(mazes), str(m)
+
+def run(sizes):
+	print("{:>9} {:>8} {:>11} {:>13} {:>8}".format("map", "mazes", "rescan ms", "candidates ms", "speedup"))
+	for width, height in sizes:
+		rescan_time, maze_count, rescan_map = time_mazes(RescanGenerator, width, height)
+		candidates_time, _, candidates_map = time_mazes(game_map.MapGenerator, width, height)
+		#Same draws from the same rng, so the same mazes
+		assert rescan_map == candidates_map
+		print("{:>9} {:>8} {:>11.1f} {:>13.1f} {:>7.1f}x".format("{}x{}".format(2 * width + 1, 2 * height + 1),
+			maze_count, rescan_time * 1000, candidates_time * 1000, rescan_time / candidates_time))
+
+if __name__=="__main__":
+	args = [int(arg) for arg in sys.argv[1:]]
+	run(list(zip(args[::2], args[1::2])) or DEFAULT_SIZES)
@@ -0,0 +1,74 @@
+import sys
+import tracemalloc
+
+import array_grid
+import game_map
+
+#Memory held by a built grid, per point, with one rock object per wall cell as before against the
+#shared rock tile and against ArrayGrid
+#usage: python bench_memory.py [xm ym ...]
+
+DEFAULT_SIZES = [(90, 20), (400, 200), (1000, 1000)]
+SEED = 1
+
+class LegacyRock(object):
+	#Rock as it was, a dict backed object with its own position and type per wall cell
+	def __init__(self, position):
+		self.position = position
+		self.type = "Rock"
+	def allows_route(self):
+		return False
+	def supports_outpost(self):
+		return False
+
+class LegacyResource(object):
+	def __init__(self, position, amount, cluster):
+		self.amount = amount
+		self.cluster = cluster
+		self.position = position
+		self.type = "Resource"
+	def allows_route(self):
+		return False
+	def supports_outpost(self):
+		return False
+
+def build_legacy_grid(mp, xm, ym):
+	grid = game_map.Grid(xm, ym)
+	for y in range(len(mp.grid)):
+		for x in range(len(mp.grid[y])):
+			if mp.grid[y][x] == "#":
+				grid.add_tile(LegacyRock((x,y)), (x,y))
+	for cluster in mp.clusters:
+		rc = game_map.ResourceCluster()
+		for pt, amount in cluster:
+			resource = LegacyResource(pt, amount, rc)
+			rc.add_resource(resource)
+			grid.add_tile(resource, pt)
+	return grid
+
+def measure(build):
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	grid = build()
+	used = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+	return used, grid
+
+def run(sizes):
+	print("{:>10} {:>10} {:>12} {:>12} {:>12}".format("map", "walls", "legacy B/pt", "shared B/pt", "array B/pt"))
+	for xm, ym in sizes:
+		mp = game_map.MapGenerator(SEED).generate(xm // 2, ym // 2)
+		points = (xm + 1) * (ym + 1)
+		walls = sum(row.count("#") for row in mp.grid)
+		legacy, grid = measure(lambda: build_legacy_grid(mp, xm, ym))
+		del grid
+		shared, grid = measure(lambda: game_map.build_grid(mp, xm, ym))
+		del grid
+		array, grid = measure(lambda: game_map.build_grid(mp, xm, ym, array_grid.ArrayGrid))
+		del grid
+		print("{:>10} {:>10} {:>12.1f} {:>12.1f} {:>12.1f}".format(
+			"{}x{}".format(xm, ym), walls, legacy / points, shared / points, array / points))
+
+if __name__=="__main__":
+	args = [int(arg) for arg in sys.argv[1:]]
+	run(list(zip(args[::2], args[1::2])) or DEFAULT_SIZES)
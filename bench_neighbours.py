@@ -0,0 +1,74 @@
+import sys
+import time
+import tracemalloc
+
+import array_grid
+import chunked_grid
+import game_map
+
+#Neighbour queries per second, worked out per call with the old in_grid against the current bounds checks and
+#ArrayGrid's padded route mask, both for the plain neighbours and for the route allowed ones every search expands.
+#Next to them the bytes a point in_grid kept for neighbour lookups, and what a table of neighbour tuples would take.
+#usage: python bench_neighbours.py [xm ym ...]
+
+DEFAULT_SIZES = [(90, 20), (400, 200)]
+SEED = 1
+ROUNDS = 5
+
+def legacy_in_grid(grid, pt):
+	x,y = pt
+	return not any([x >= grid.xm, x < 0, y >= grid.ym, y < 0])
+
+def legacy_neighbouring_points(grid, pt):
+	return [game_map.av(pt, dr) for dr in game_map.directions if legacy_in_grid(grid, game_map.av(pt, dr))]
+
+def legacy_route_neighbours(grid, pt):
+	#is_route_allowed with the old in_grid
+	return [n for n in legacy_neighbouring_points(grid, pt) if legacy_in_grid(grid, n) and grid._tile_allows_route(n)]
+
+def neighbour_bytes(grid):
+	#Memory held for neighbour lookups, only ArrayGrid.route_mask
+	if isinstance(grid, array_grid.ArrayGrid):
+		return grid.route_mask.nbytes
+	return 0
+
+def tuple_table_bytes(xm, ym):
+	#Point -> tuple of its neighbours for every point in_grid, one tuple per point shared by the neighbour tuples
+	tracemalloc.start()
+	rows = [[(x, y) for x in range(xm)] for y in range(ym)]
+	table = {}
+	for y, row in enumerate(rows):
+		for x, pt in enumerate(row):
+			table[pt] = tuple(n for n in (rows[y - 1][x] if y > 0 else None, row[x + 1] if x + 1 < xm else None,
+				rows[y + 1][x] if y + 1 < ym else None, row[x - 1] if x > 0 else None) if n is not None)
+	size = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return size
+
+def queries_per_second(query, grid, points):
+	start = time.perf_counter()
+	for _ in range(ROUNDS):
+		for pt in points:
+			query(grid, pt)
+	return ROUNDS * len(points) / (time.perf_counter() - start)
+
+def run(sizes):
+	print("{:>10} {:>11} {:>14} {:>14} {:>14} {:>14} {:>8} {:>12}".format("map", "grid", "old points/s", "new points/s",
+		"old routes/s", "new routes/s", "B/pt", "tuples B/pt"))
+	for xm, ym in sizes:
+		tuples_per_point = tuple_table_bytes(xm, ym) / (xm * ym)
+		for grid_class in (game_map.Grid, array_grid.ArrayGrid, chunked_grid.ChunkedGrid):
+			grid = game_map.get_grid(xm, ym, grid_class, SEED)
+			points = [pt for pt in grid.points() if grid.in_grid(pt)]
+			rates = [
+				queries_per_second(legacy_neighbouring_points, grid, points),
+				queries_per_second(grid_class.get_neighbouring_points, grid, points),
+				queries_per_second(legacy_route_neighbours, grid, points),
+				queries_per_second(grid_class.route_neighbours, grid, points),
+			]
+			print("{:>10} {:>11} {:>14,.0f} {:>14,.0f} {:>14,.0f} {:>14,.0f} {:>8.1f} {:>12.1f}".format("{}x{}".format(xm, ym),
+				grid_class.__name__, *rates, neighbour_bytes(grid) / len(points), tuples_per_point))
+
+if __name__=="__main__":
+	args = [int(arg) for arg in sys.argv[1:]]
+	run(list(zip(args[::2], args[1::2])) or DEFAULT_SIZES)
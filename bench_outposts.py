@@ -0,0 +1,82 @@
+import sys
+import time
+import random
+
+import array_grid
+import game_map
+import game_state
+from game_parameters import *
+
+#Tick time of outpost income processing, per outpost loop against the batched update
+#usage: python bench_outposts.py [outpost counts...]
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+class LegacyOutpost(object):
+	#Outpost as it was before the store, plain attributes updated one outpost at a time.
+	#Its own type keeps it out of the registry and the store, it is kept in a plain list like it used to be.
+	__slots__ = ("position", "parameters", "health", "energy", "can_remove", "withering", "wither_energy", "supporting_neighbour_count")
+	type = "LegacyOutpost"
+	def __init__(self, position):
+		self.position = position
+		self.parameters = DEFAULT_PARAMETERS
+		self.health = OUTPOST_MAX_HEALTH
+		self.energy = 0
+		self.can_remove = False
+		self.withering = False
+		self.wither_energy = 0
+		self.supporting_neighbour_count = 0
+	def allows_route(self):
+		return True
+	def get_route_cost(self):
+		return 0
+	def supports_outpost(self):
+		return True
+	update_self = game_map.Outpost.update_self
+
+def legacy_process_incomes(gs):
+	for outpost in gs.game_map.legacy_outposts[:]:
+		outpost.update_self(len([obj for obj in gs.game_map.get_neighbouring_objects(outpost.position) if obj.supports_outpost()]))
+		if outpost.energy >= OUTPOST_MONEY_GAIN_ENERGY_COST:
+			outpost.energy -= OUTPOST_MONEY_GAIN_ENERGY_COST
+			gs.money += OUTPOST_MONEY_GAIN_AMOUNT
+		if outpost.can_remove:
+			gs.game_map.legacy_outposts.remove(outpost)
+			gs.game_map.remove_tile(outpost)
+
+def build_state(outpost_count, seed = 0, legacy = False):
+	#Square map mostly covered by outposts, some of them short of support so they wither
+	side = int((outpost_count / .8) ** .5) + 2
+	rng = random.Random(seed)
+	grid = array_grid.ArrayGrid(side, side)
+	if legacy:
+		grid.legacy_outposts = []
+	points = [(x, y) for y in range(side) for x in range(side)]
+	rng.shuffle(points)
+	for pt in points[:outpost_count]:
+		outpost = LegacyOutpost(pt) if legacy else game_map.Outpost(pt)
+		outpost.energy = rng.randrange(OUTPOST_MONEY_GAIN_ENERGY_COST)
+		if legacy:
+			grid.legacy_outposts.append(outpost)
+		grid.add_tile(outpost, pt)
+	return game_state.GameState((0, 0), grid)
+
+def time_ticks(process, gs, ticks):
+	start = time.perf_counter()
+	for _ in range(ticks):
+		process(gs)
+	return (time.perf_counter() - start) / ticks
+
+def run(sizes):
+	print("{:>10} {:>14} {:>14} {:>8}".format("outposts", "per outpost ms", "batched ms", "speedup"))
+	for size in sizes:
+		ticks = 3 if size < 1000000 else 1
+		legacy_gs = build_state(size, legacy = True)
+		legacy_ms = time_ticks(legacy_process_incomes, legacy_gs, ticks) * 1000
+		del legacy_gs
+		batched_gs = build_state(size)
+		batched_ms = time_ticks(game_state.GameState._process_incomes, batched_gs, ticks) * 1000
+		print("{:>10} {:>14.1f} {:>14.1f} {:>7.1f}x".format(size, legacy_ms, batched_ms, legacy_ms / batched_ms))
+
+if __name__=="__main__":
+	run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,145 @@
+import sys
+import time
+import random
+
+import array_grid
+import game_map
+import pathfinding
+
+#Nodes expanded and wall time of the route search on generated maps, old search against the current one,
+#first for one off queries, then for route previews: the cursor walking away from the selected cell a step
+#at a time, searched once a step. Previews use RouteSearch, which keeps its tree between the steps of a walk,
+#next to what the old search and a_star_search would take for the same steps.
+#Every search counts the points it takes off the frontier, the goal included, each once.
+#usage: python bench_pathfinding.py [queries per map]
+
+MAP_SIZES = [(90, 20), (160, 60), (240, 100)]
+DEFAULT_QUERIES = 50
+NETWORK_ROUTES = 5
+WALKS = 10
+WALK_STEPS = 40
+#Chance a step of a walk turns
+WALK_TURN = 0.3
+
+def legacy_search(grid, start, goal, stats):
+	#The search as it was: zero heuristic, stale heap entries expanded again
+	frontier = pathfinding.PriorityQueue()
+	frontier.put(start, 0)
+	came_from = {start: None}
+	cost_so_far = {start: 0}
+	expanded = set()
+	while not frontier.empty():
+		current = frontier.get()
+		expanded.add(current)
+		if current == goal:
+			break
+		allowed_next = [n for n in grid.get_neighbouring_points(current) if grid.is_route_allowed(n)]
+		for next in allowed_next:
+			new_cost = cost_so_far[current] + grid.get_route_cost(next)
+			if next not in cost_so_far or new_cost < cost_so_far[next]:
+				cost_so_far[next] = new_cost
+				frontier.put(next, new_cost)
+				came_from[next] = current
+	stats["expanded"] = stats.get("expanded", 0) + len(expanded)
+	return pathfinding.reconstruct_path(came_from, start, goal), cost_so_far.get(goal, 123456)
+
+def build_network(grid, start, rng):
+	#Lay a few outpost routes from the start cell so zero cost tiles matter
+	open_points = [pt for pt in grid.points() if grid.in_grid(pt) and grid.get_tile(pt) is None]
+	for _ in range(NETWORK_ROUTES):
+		path, cost = pathfinding.a_star_search(grid, start, rng.choice(open_points))
+		if not path:
+			continue
+		for pt in path:
+			if grid.get_tile(pt) is None:
+				outpost = game_map.Outpost(pt)
+				grid.add_tile(outpost, pt)
+
+def time_queries(search, grid, start, goals):
+	stats = {}
+	results = []
+	begin = time.perf_counter()
+	for goal in goals:
+		results.append(search(grid, start, goal, stats))
+	return time.perf_counter() - begin, stats["expanded"], results
+
+def cursor_walks(grid, start, rng):
+	#Cursor positions of walks from the selected cell, kept in_grid like the cursor
+	walks = []
+	for _ in range(WALKS):
+		pt = start
+		walk = []
+		step = rng.choice(game_map.directions)
+		for _ in range(WALK_STEPS):
+			if rng.random() < WALK_TURN:
+				step = rng.choice(game_map.directions)
+			moved = game_map.av(pt, step)
+			if grid.in_grid(moved):
+				pt = moved
+			walk.append(pt)
+		walks.append(walk)
+	return walks
+
+def time_walks(search, grid, start, walks):
+	#search(grid, start, goal, stats) once for every step of every walk
+	stats = {}
+	costs = []
+	begin = time.perf_counter()
+	for walk in walks:
+		for goal in walk:
+			costs.append(search(grid, start, goal, stats)[1])
+	return time.perf_counter() - begin, stats["expanded"], costs
+
+def time_route_search_walks(grid, start, walks):
+	#A tree per walk, as a preview keeps one while the same cell is selected
+	expanded = 0
+	costs = []
+	begin = time.perf_counter()
+	for walk in walks:
+		route_search = pathfinding.RouteSearch(grid, start)
+		for goal in walk:
+			costs.append(route_search.search(goal)[1])
+		expanded += len(route_search.settled)
+	return time.perf_counter() - begin, expanded, costs
+
+def run(queries):
+	previews = []
+	print("{:>9} {:>8} {:>14} {:>14} {:>11} {:>11}".format("map", "network", "old expanded", "new expanded", "old ms", "new ms"))
+	for xm, ym in MAP_SIZES:
+		random.seed(xm * ym)
+		grid = game_map.get_grid(xm, ym, array_grid.ArrayGrid)
+		start = grid.player_cells[0].position
+		rng = random.Random(xm * ym)
+		for network in (False, True):
+			if network:
+				build_network(grid, start, rng)
+			open_points = [pt for pt in grid.points() if grid.in_grid(pt) and grid.is_route_allowed(pt)]
+			goals = [rng.choice(open_points) for _ in range(queries)]
+			old_time, old_expanded, old_results = time_queries(legacy_search, grid, start, goals)
+			new_time, new_expanded, new_results = time_queries(pathfinding.a_star_search, grid, start, goals)
+			#Both searches are optimal, the paths may differ on ties but the costs may not
+			assert [cost for path, cost in old_results] == [cost for path, cost in new_results]
+			print("{:>9} {:>8} {:>14} {:>14} {:>11.1f} {:>11.1f}".format(
+				"{}x{}".format(xm, ym), "yes" if network else "no",
+				old_expanded // queries, new_expanded // queries,
+				old_time * 1000 / queries, new_time * 1000 / queries))
+			#Walked now, the next pass lays its network on this grid
+			walks = cursor_walks(grid, start, rng)
+			old_time, old_expanded, old_costs = time_walks(legacy_search, grid, start, walks)
+			a_star_time, a_star_expanded, a_star_costs = time_walks(pathfinding.a_star_search, grid, start, walks)
+			tree_time, tree_expanded, tree_costs = time_route_search_walks(grid, start, walks)
+			assert old_costs == a_star_costs == tree_costs
+			previews.append(("{}x{}".format(xm, ym), "yes" if network else "no",
+				old_expanded, a_star_expanded, tree_expanded, old_time, a_star_time, tree_time))
+	steps = WALKS * WALK_STEPS
+	print()
+	print("Route previews, a search a cursor step, per step")
+	print("{:>9} {:>8} {:>13} {:>13} {:>13} {:>9} {:>9} {:>9}".format("map", "network", "old expanded", "A* expanded",
+		"tree expanded", "old ms", "A* ms", "tree ms"))
+	for name, network, *measured in previews:
+		expanded, times = measured[:3], measured[3:]
+		print("{:>9} {:>8} {:>13} {:>13} {:>13} {:>9.2f} {:>9.2f} {:>9.2f}".format(name, network,
+			*[count // steps for count in expanded], *[seconds * 1000 / steps for seconds in times]))
+
+if __name__=="__main__":
+	run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_QUERIES)
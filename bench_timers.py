@@ -0,0 +1,44 @@
+import sys
+import time
+
+import bench_outposts
+import outpost_timers
+
+#Tick time once outposts have settled, every outpost stepped on every tick against event timers,
+#then fast forwarding over idle ticks
+#usage: python bench_timers.py [outpost counts...]
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+TICKS = 100
+FAST_FORWARD_TICKS = 10000
+
+def settled_state(size, event_timers):
+	gs = bench_outposts.build_state(size)
+	if event_timers:
+		outpost_timers.enable(gs.game_map, gs.parameters)
+	#The first ticks remove the outposts that die straight away and step everything once under the timers
+	for _ in range(2):
+		gs.tick()
+	return gs
+
+def time_ticks(gs, ticks):
+	start = time.perf_counter()
+	for _ in range(ticks):
+		gs.tick()
+	return (time.perf_counter() - start) / ticks
+
+def run(sizes):
+	print("{:>10} {:>14} {:>14} {:>8} {:>18}".format("outposts", "every tick ms", "events ms", "speedup",
+		"{} ticks ff ms".format(FAST_FORWARD_TICKS)))
+	for size in sizes:
+		ticks = TICKS if size < 1000000 else TICKS // 10
+		batched_ms = time_ticks(settled_state(size, False), ticks) * 1000
+		gs = settled_state(size, True)
+		event_ms = time_ticks(gs, ticks) * 1000
+		start = time.perf_counter()
+		gs.fast_forward(FAST_FORWARD_TICKS)
+		fast_forward_ms = (time.perf_counter() - start) * 1000
+		print("{:>10} {:>14.2f} {:>14.3f} {:>7.1f}x {:>18.1f}".format(size, batched_ms, event_ms, batched_ms / event_ms, fast_forward_ms))
+
+if __name__=="__main__":
+	run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
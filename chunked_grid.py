@@ -0,0 +1,310 @@
+import heapq
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+
+import array_grid
+import game_map
+
+#Grid for worlds too big to generate up front. The world is split into CHUNK_SIZE square chunks and each one is
+#generated from the world seed the first time anything in it is looked at, so memory and startup follow the part
+#of the world that has been visited rather than its area.
+#Every chunk is its own small map from MapGenerator. A chunk owns its west and north wall, and opens a gate in
+#each at a point that only depends on the seed and the wall, so the chunks either side of a wall agree on it
+#without looking at each other. Each chunk carves its gates through to its biggest open area and fills any
+#ground still cut off with rock, so every open point of the world can be routed to from every other.
+#Chunks nobody changed are evicted least recently used first once more than max_chunks are loaded, and simply
+#generated again when next needed. A chunk is pinned for good once a tile in it or next to it is set, or a
+#point in it is marked dirty, which covers outposts, resource cells and resources being drawn down.
+#Tiles from a chunk that is not pinned are only good until it is evicted, keep positions rather than tiles.
+#The resources of a chunk are in the registry while it is loaded, so resource_clusters only lists the clusters of
+#loaded chunks. points() walks the whole world, so snapshots and map files are only practical for small worlds.
+#Reading a point can load a chunk, and the runtime's planner thread searches routes while the main thread ticks,
+#so loading, eviction, pinning and setting tiles happen under the grid's lock. The caches of the last chunk looked
+#at are single (key, value) pairs, so a thread never sees one chunk's key with another's tiles.
+
+CHUNK_SHIFT = 5
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+DEFAULT_MAX_CHUNKS = 256
+#Chunks looked at around the middle of the world for a start location, in rings
+START_SEARCH_RINGS = 8
+
+def chunk_seed(seed, *key):
+	#Seeds for chunks and gates, independent of PYTHONHASHSEED
+	digest = hashlib.blake2b(repr((seed,) + key).encode("ascii"), digest_size = 8).digest()
+	return int.from_bytes(digest, "little")
+
+_index_neighbours = {}
+
+def index_neighbours(width, height):
+	#Tile index -> indices of its neighbours in N E S W order, in a chunk cut to width x height by the world edge
+	key = (width, height)
+	table = _index_neighbours.get(key)
+	if table is None:
+		table = [()] * (CHUNK_SIZE * CHUNK_SIZE)
+		for y in range(height):
+			for x in range(width):
+				i = y * CHUNK_SIZE + x
+				table[i] = tuple(n for n, inside in ((i - CHUNK_SIZE, y > 0), (i + 1, x + 1 < width),
+					(i + CHUNK_SIZE, y + 1 < height), (i - 1, x > 0)) if inside)
+		_index_neighbours[key] = table
+	return table
+
+class Chunk(object):
+	__slots__ = ("key", "tiles", "clusters")
+	def __init__(self, key, tiles, clusters):
+		self.key = key
+		#CHUNK_SIZE * CHUNK_SIZE tiles, indexed local y * CHUNK_SIZE + local x
+		self.tiles = tiles
+		self.clusters = clusters
+
+class ChunkedGrid(game_map.Grid):
+	generates_lazily = True
+	def __init__(self, xm, ym, seed = None, parameters = None, max_chunks = DEFAULT_MAX_CHUNKS):
+		if seed is None:
+			seed = random.SystemRandom().randrange(1 << 32)
+		self.seed = seed
+		if parameters is None:
+			parameters = game_map.MapParameters.random(random.Random(seed))
+		#Map parameters every chunk is generated with
+		self.parameters = parameters
+		self.max_chunks = max_chunks
+		super().__init__(xm, ym)
+
+	@classmethod
+	def create(cls, xm, ym, seed = None, parameters = None, max_chunks = DEFAULT_MAX_CHUNKS):
+		#New world with its starting cell, the counterpart of game_map.get_grid
+		grid = cls(xm, ym, seed, parameters, max_chunks)
+		grid.place_start()
+		return grid
+
+	def _init_storage(self):
+		#Unpinned chunks in least recently used order, and pinned ones which are never evicted
+		self.chunks = OrderedDict()
+		self.pinned_chunks = {}
+		self.chunks_generated = 0
+		self.chunks_evicted = 0
+		#Lookups mostly stay in the chunk of the last one, so that chunk's key and tiles are kept at hand
+		self._last = (None, None)
+		#Neighbour tables by chunk in least recently used order, and the key and table of the last lookup
+		self._lock = threading.RLock()
+
+	@property
+	def map(self):
+		return array_grid.GridMapView(self)
+	def points(self):
+		#Every point of the world, only sensible for small ones
+		return ((x, y) for y in range(self.ym + 1) for x in range(self.xm + 1))
+	def loaded_chunk_count(self):
+		return len(self.chunks) + len(self.pinned_chunks)
+
+	def _chunk(self, key):
+		with self._lock:
+			chunk = self.pinned_chunks.get(key)
+			if chunk is not None:
+				return chunk
+			chunk = self.chunks.get(key)
+			if chunk is not None:
+				self.chunks.move_to_end(key)
+				return chunk
+			chunk = self._generate_chunk(key)
+			self.chunks[key] = chunk
+			for rc in chunk.clusters:
+				for resource in rc.resources:
+					self.registry.add(resource)
+			while len(self.chunks) > self.max_chunks:
+				evicted_key, evicted = self.chunks.popitem(last = False)
+				self.chunks_evicted += 1
+				for rc in evicted.clusters:
+					for resource in rc.resources:
+						self.registry.remove(resource)
+				if evicted_key == self._last[0]:
+					self._last = (None, None)
+			return chunk
+
+	def _tiles(self, x, y):
+		if x < 0 or y < 0 or x > self.xm or y > self.ym:
+			raise KeyError((x, y))
+		key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+		last_key, tiles = self._last
+		if key != last_key:
+			#Set under the lock, so an eviction in between can not leave the cache on evicted tiles
+			with self._lock:
+				tiles = self._chunk(key).tiles
+				self._last = (key, tiles)
+		return tiles
+
+	def get_tile(self, pt):
+		x,y = pt
+		return self._tiles(x, y)[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+	def _set_tile(self, pt, item):
+		#The registry changes along with the tile, and chunk loads on other threads change it too
+		with self._lock:
+			super()._set_tile(pt, item)
+	def _store_tile(self, pt, item):
+		x,y = pt
+		with self._lock:
+			#Tiles next to this one may now be referred to, resource cells keep the cluster they were built on.
+			#Pinned first, so the tile goes into the copy of the chunk that stays.
+			for nx, ny in ((x, y), (x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+				if 0 <= nx <= self.xm and 0 <= ny <= self.ym:
+					self.pin((nx, ny))
+			self._tiles(x, y)[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)] = item
+	def neighbouring_resource(self, pt):
+		#Resources are only registered while their chunk is loaded
+		x,y = pt
+		for nx, ny in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+			if 0 <= nx <= self.xm and 0 <= ny <= self.ym:
+				self._tiles(nx, ny)
+		return super().neighbouring_resource(pt)
+	def mark_dirty(self, pt):
+		self.dirty_points.add(pt)
+		self.pin(pt)
+
+	def pin(self, pt):
+		#Keeps the chunk holding pt loaded from now on
+		x,y = pt
+		key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+		with self._lock:
+			if key not in self.pinned_chunks:
+				self.pinned_chunks[key] = self._chunk(key)
+				del self.chunks[key]
+
+	def _generate_chunk(self, key):
+		cx, cy = key
+		generator = game_map.MapGenerator(chunk_seed(self.seed, cx, cy), self.parameters)
+		#A map of CHUNK_SIZE + 1 points a side, its east and south wall belong to the next chunks over
+		m = generator.generate_terrain(CHUNK_SIZE // 2, CHUNK_SIZE // 2)
+		tiles = [None] * (CHUNK_SIZE * CHUNK_SIZE)
+		for y in range(CHUNK_SIZE):
+			row = m.grid[y]
+			for x in range(CHUNK_SIZE):
+				if row[x] == "#":
+					tiles[y * CHUNK_SIZE + x] = game_map.ROCK_TILE
+		resource_indices = set(y * CHUNK_SIZE + x for cluster in m.clusters for (x, y), _ in cluster)
+		self._connect(cx, cy, tiles, resource_indices)
+
+		ox, oy = cx << CHUNK_SHIFT, cy << CHUNK_SHIFT
+		clusters = []
+		for cluster in m.clusters:
+			rc = game_map.ResourceCluster()
+			for (x, y), amount in cluster:
+				#Unless a gate had to be carved through it
+				if y * CHUNK_SIZE + x in resource_indices:
+					resource = game_map.Resource((ox + x, oy + y), amount, rc)
+					rc.add_resource(resource)
+					tiles[y * CHUNK_SIZE + x] = resource
+			if rc.resources:
+				clusters.append(rc)
+		self.chunks_generated += 1
+		return Chunk(key, tiles, clusters)
+
+	def _gate(self, cx, cy, wall):
+		#Odd offset along the west or north wall of chunk (cx, cy), where room and maze rows and columns run.
+		#Walls cut short by the edge of the world keep their gate inside it, None if there is no room for one.
+		if wall == "west":
+			span = min(CHUNK_SIZE, self.ym - (cy << CHUNK_SHIFT))
+		else:
+			span = min(CHUNK_SIZE, self.xm - (cx << CHUNK_SHIFT))
+		if span < 2:
+			return None
+		return 2 * (chunk_seed(self.seed, cx, cy, wall) % (span // 2)) + 1
+
+	def _connect(self, cx, cy, tiles, resource_indices):
+		#Carves each gate through to the biggest open area, fewest rocks first and resources only when nothing
+		#else gets there, then fills open areas still cut off from it. Works on tile indices, resource_indices
+		#loses the resources carved through.
+		width = min(CHUNK_SIZE, self.xm - (cx << CHUNK_SHIFT))
+		height = min(CHUNK_SIZE, self.ym - (cy << CHUNK_SHIFT))
+		neighbours = index_neighbours(width, height)
+		def is_open(i):
+			return tiles[i] is None and i not in resource_indices
+		indices = [y * CHUNK_SIZE + x for y in range(height) for x in range(width)]
+		#Open areas as they were generated, by label
+		labels = {}
+		areas = []
+		for i in indices:
+			if i not in labels and is_open(i):
+				labels[i] = len(areas)
+				found = [i]
+				stack = [i]
+				while stack:
+					for n in neighbours[stack.pop()]:
+						if n not in labels and is_open(n):
+							labels[n] = len(areas)
+							found.append(n)
+							stack.append(n)
+				areas.append(found)
+		main = set(max(areas, key = len)) if areas else set()
+		joined = set([labels[next(iter(main))]]) if main else set()
+		def carve_to_main(gate):
+			#Cheapest path from the gate, carved open and joined to main with every area it runs through
+			costs = {gate: 0}
+			came_from = {gate: None}
+			queue = [(0, gate)]
+			current = gate
+			while queue and main:
+				cost, current = heapq.heappop(queue)
+				if current in main:
+					break
+				if cost > costs[current]:
+					continue
+				for n in neighbours[current]:
+					if is_open(n):
+						step = 0
+					elif n in resource_indices:
+						step = CHUNK_SIZE * CHUNK_SIZE
+					else:
+						step = 1
+					if cost + step < costs.get(n, float("inf")):
+						costs[n] = cost + step
+						came_from[n] = current
+						heapq.heappush(queue, (cost + step, n))
+			while current is not None:
+				tiles[current] = None
+				resource_indices.discard(current)
+				main.add(current)
+				for n in (current,) + neighbours[current]:
+					label = labels.get(n)
+					if label is not None and label not in joined:
+						joined.add(label)
+						main.update(areas[label])
+				current = came_from[current]
+
+		west = self._gate(cx, cy, "west")
+		north = self._gate(cx, cy, "north")
+		east = self._gate(cx + 1, cy, "west")
+		south = self._gate(cx, cy + 1, "north")
+		for x, y in ((0, west), (north, 0), (CHUNK_SIZE - 1, east), (south, CHUNK_SIZE - 1)):
+			if x is not None and y is not None and x < width and y < height:
+				carve_to_main(y * CHUNK_SIZE + x)
+		for i in labels:
+			if i not in main:
+				tiles[i] = game_map.ROCK_TILE
+
+	def place_start(self):
+		#Starting cell next to a cluster in the chunks around the middle of the world, picked by the seed
+		rng = random.Random(chunk_seed(self.seed, "start"))
+		mx, my = (self.xm // 2) >> CHUNK_SHIFT, (self.ym // 2) >> CHUNK_SHIFT
+		last_cx, last_cy = self.xm >> CHUNK_SHIFT, self.ym >> CHUNK_SHIFT
+		for ring in range(START_SEARCH_RINGS):
+			keys = [(cx, cy) for cy in range(my - ring, my + ring + 1) for cx in range(mx - ring, mx + ring + 1)
+				if max(abs(cx - mx), abs(cy - my)) == ring and 0 <= cx <= last_cx and 0 <= cy <= last_cy]
+			clusters = [rc for key in keys for rc in self._chunk(key).clusters]
+			candidates = []
+			for rc in clusters:
+				points = set(resource.position for resource in rc.resources)
+				for x, y in sorted(points):
+					for pt in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+						if pt not in points and self.in_grid(pt) and self.get_tile(pt) is None:
+							candidates.append((pt, rc))
+			if candidates:
+				break
+		else:
+			raise ValueError("No resources near the middle of the world to start on")
+		start_location, cluster = rng.choice(candidates)
+		starting_cell = game_map.ResourceCell(start_location, cluster)
+		self._set_tile(start_location, starting_cell)
+		self.start_location = start_location
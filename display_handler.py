@@ -1,4 +1,5 @@
 import curses
+import instrumentation
 import state_constants
 
 WRITE_DEBUG = True
@@ -6,55 +7,90 @@ WRITE_DEBUG = True
 #A_TOP, A_VERTICAL have no effect
 INJURED_ATTR = curses.A_LEFT | curses.A_UNDERLINE
 
+#Tile types drawn above route attempts
+ROUTE_ATTEMPT_COVERING_TYPES = ("ResourceCell", "Outpost")
+
+#Cells kept between the cursor and the edge of the view before it scrolls
+VIEWPORT_MARGIN = 3
+
+class Viewport(object):
+	#The part of the map shown in the game window, with its top left corner at (x0, y0).
+	#Once the cursor comes within VIEWPORT_MARGIN of an edge the view recentres on it, so it scrolls rarely.
+	def __init__(self, width, height, xm, ym):
+		self.width = min(width, xm)
+		self.height = min(height, ym)
+		self.xm = xm
+		self.ym = ym
+		self.x0 = 0
+		self.y0 = 0
+	def _scroll(self, origin, size, extent, c):
+		margin = min(VIEWPORT_MARGIN, (size - 1) // 2)
+		if origin + margin <= c < origin + size - margin:
+			return origin
+		return max(0, min(c - size // 2, extent - size))
+	def follow(self, pt):
+		#Returns whether the view moved
+		x,y = pt
+		x0 = self._scroll(self.x0, self.width, self.xm, x)
+		y0 = self._scroll(self.y0, self.height, self.ym, y)
+		moved = x0 != self.x0 or y0 != self.y0
+		self.x0, self.y0 = x0, y0
+		return moved
+	def contains(self, pt):
+		x,y = pt
+		return self.x0 <= x < self.x0 + self.width and self.y0 <= y < self.y0 + self.height
+	def points(self):
+		return ((x, y) for y in range(self.y0, self.y0 + self.height) for x in range(self.x0, self.x0 + self.width))
+	def to_window(self, pt):
+		x,y = pt
+		return x - self.x0, y - self.y0
+
 class DisplayHandler(object):
 	def __init__(self, game_state, game_window, detail_window):
 		self.game_state = game_state
 		self.game_window = game_window
 		self.detail_window = detail_window
+		height, width = game_window.getmaxyx()
+		self.viewport = Viewport(width, height, game_state.game_map.xm, game_state.game_map.ym)
+		
+		#Incremental drawing state, the first frame draws everything
+		self.full_redraw = True
+		self.drawn_route_points = set()
+		self.drawn_cursor = None
+		self.detail_lines = {}
 
 	def display_update(self):
-		#update bottom to top
+		game_map = self.game_state.game_map
+		viewport = self.viewport
+		dirty_points = game_map.pop_dirty_points()
+		#Off screen cells are never drawn, scrolling redraws the whole view
+		if viewport.follow(self.game_state.cursor):
+			self.full_redraw = True
 		
-		#Draw terrain first
-		for pt in self.game_state.game_map.map.keys():
-			x,y = pt
-			try:
-				displaych, color_pair_index, apply_injured = self.game_state.game_map.get_tile_display(pt)
-				self.game_window.addch(y, x, displaych, curses.color_pair(color_pair_index))
-			except curses.error:
-				pass
-
-		#Route attempts must go above ground
+		route_tiles = {}
 		for ra in self.game_state.route_attempts:
-			
 			for rat in ra.attempt_tiles:
-				displaych, color_pair_index, apply_injured = rat.get_display()
-				x,y = rat.position
-				try:
-					self.game_window.addch(y, x, displaych, curses.color_pair(color_pair_index))
-				except curses.error:
-					pass
+				if viewport.contains(rat.position):
+					route_tiles[rat.position] = rat
+		
+		#Only redraw cells whose tile changed, route attempts that appeared or vanished, and the old and new cursor
+		if self.full_redraw:
+			points_to_draw = viewport.points()
+			self.full_redraw = False
+		else:
+			points_to_draw = set(pt for pt in dirty_points if viewport.contains(pt))
+			points_to_draw.update(self.drawn_route_points.symmetric_difference(route_tiles))
+			if self.drawn_cursor is not None:
+				points_to_draw.add(self.drawn_cursor)
+			points_to_draw.add(self.game_state.cursor)
+		cells_drawn = 0
+		for pt in points_to_draw:
+			self.draw_point(pt, route_tiles)
+			cells_drawn += 1
+		instrumentation.profiler.count("cells_drawn", cells_drawn)
+		self.drawn_route_points = set(route_tiles)
+		self.drawn_cursor = self.game_state.cursor
 		
-		#Draw cells a second time to fix z order, this is annoying.
-		for cell in self.game_state.game_map.player_cells:
-			x,y = cell.position
-			try:
-				displaych, color_pair_index, apply_injured = cell.get_display()
-				if displaych:
-					self.game_window.addch(y, x, displaych, curses.color_pair(color_pair_index))
-			except curses.error:
-				pass
-				
-		for cell in self.game_state.game_map.outposts:
-			x,y = cell.position
-			try:
-				displaych, color_pair_index, apply_injured = cell.get_display()
-				if displaych:
-					self.game_window.addch(y, x, displaych, curses.color_pair(color_pair_index))
-					if apply_injured:
-						self.add_attr(cell.position, INJURED_ATTR)
-			except curses.error:
-				pass
 		#End by setting cursor
 		
 		self.write_tile_desc(self.game_state.game_map.get_tile_description(self.game_state.cursor))
@@ -63,23 +99,45 @@ class DisplayHandler(object):
 		self.write_helptext2(state_constants.STATE_HELPTEXT2_DICT.get(self.game_state.state_type, ""))
 		self.write_money(state_constants.MONEY_DISPLAY_TEXT.format(self.game_state.money))
 		self.write_debug("LastOp: [{0}] | CurrState: [{1}]".format(self.game_state.last_op, self.game_state.state_type))
+		if instrumentation.profiler.enabled:
+			self.write_profile(instrumentation.profiler.summary())
 		#if self.game_state.game_map.get_tile(self.game_state.cursor):
 		#	self.write_debug("Current tile type is " + str(type(self.game_state.game_map.get_tile(self.game_state.cursor))))
 		#else:
 		#	self.write_debug("")
 		
 		
-		cursx,cursy = self.game_state.cursor
+		cursx,cursy = viewport.to_window(self.game_state.cursor)
 		cursor_char = self.game_window.inch(cursy, cursx)
 		cursor_attrs = cursor_char & curses.A_ATTRIBUTES
 		self.game_window.chgat(cursy, cursx, 1, curses.A_BLINK | cursor_attrs)
 
 		self.game_window.refresh()
 		self.detail_window.refresh()
+	def draw_point(self, pt, route_tiles):
+		#Z order is terrain, then route attempts, then cells and outposts
+		tile = self.game_state.game_map.get_tile(pt)
+		rat = route_tiles.get(pt)
+		if rat is not None and (tile is None or tile.type not in ROUTE_ATTEMPT_COVERING_TYPES):
+			displaych, color_pair_index, apply_injured = rat.get_display()
+		else:
+			displaych, color_pair_index, apply_injured = self.game_state.game_map.get_tile_display(pt)
+		x,y = self.viewport.to_window(pt)
+		try:
+			self.game_window.addch(y, x, displaych, curses.color_pair(color_pair_index))
+			if apply_injured:
+				self.add_attr((x, y), INJURED_ATTR)
+		except curses.error:
+			pass
 	def write_detail_window_line(self, lineno, str):
+		#Skip lines whose text has not changed since they were last written
+		if self.detail_lines.get(lineno) == str:
+			return
+		self.detail_lines[lineno] = str
 		self.detail_window.move(lineno, 0)
 		self.detail_window.clrtoeol()
-		self.detail_window.addstr(lineno, 0, str)
+		#Cut to the window width, which follows the terminal
+		self.detail_window.addstr(lineno, 0, str[:self.detail_window.getmaxyx()[1] - 1])
 	def write_tile_desc(self, str):
 		self.write_detail_window_line(0, str)
 	def write_action_desc(self, str):
@@ -93,7 +151,11 @@ class DisplayHandler(object):
 	def write_debug(self, str):
 		if WRITE_DEBUG:
 			self.write_detail_window_line(7, str)
+	def write_profile(self, str):
+		#p50/p99 frame timings
+		self.write_detail_window_line(5, str)
 	def add_attr(self, pos, attr):
+		#pos is in window coordinates
 		x,y = pos
 		curr_chr = self.game_window.inch(y,x)
 		curr_attrs = curr_chr & curses.A_ATTRIBUTES
@@ -0,0 +1,172 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+import outpost_store
+
+#Entities on a grid by kind and by position. Grid._set_tile keeps it in step with the tiles, so whatever places
+#a tile registers it, and removing the tile drops it again.
+#Every kind is an insertion ordered dict of position -> entity, so adding, finding and removing an entity is
+#constant time and walking a kind follows the order entities were added, like the lists this replaces.
+#For every point the registry also counts the resources and the tiles that support outposts next to it,
+#so "is there a resource next to the cursor" and "how many supporting neighbours" are one lookup each.
+#Neighbours outside in_grid are not counted, same as Grid.get_neighbouring_points.
+#Outposts are kept in the grid's OutpostStore as well, which holds their state.
+
+#Kinds the registry keeps, rocks are terrain and left out
+REGISTERED_TYPES = ("Resource", "ResourceCell", "Outpost")
+
+#Same order as game_map.directions, N E S W
+NEIGHBOUR_OFFSETS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+class EntityView(Sequence):
+	#Read only live view of a dict of entities, in the order they were added.
+	#Indexing goes through a list and a key -> index dict built on first use, the registry drops them on changes.
+	def __init__(self, entities, key):
+		self._entities = entities
+		#The dict key of an entity
+		self._key = key
+		self._list = None
+		self._indices = None
+	def changed(self):
+		self._list = None
+		self._indices = None
+	def __len__(self):
+		return len(self._entities)
+	def __iter__(self):
+		return iter(self._entities.values())
+	def __getitem__(self, index):
+		if self._list is None:
+			self._list = list(self._entities.values())
+		return self._list[index]
+	def __contains__(self, entity):
+		return self._entities.get(self._key(entity)) is entity
+	def index(self, entity):
+		if entity not in self:
+			raise ValueError("{0} is not registered".format(entity))
+		if self._indices is None:
+			self._indices = {key: i for i, key in enumerate(self._entities)}
+		return self._indices[self._key(entity)]
+
+def _position(entity):
+	return entity.position
+
+class EntityRegistry(object):
+	def __init__(self, grid):
+		self.grid = grid
+		self.by_kind = {kind: {} for kind in REGISTERED_TYPES}
+		#Clusters by id, in the order their first resource was added, and how many of their resources are registered
+		self.clusters = {}
+		self.cluster_resource_counts = {}
+		#Point -> number of registered neighbours, points with none are left out
+		self.resource_neighbours = {}
+		self.support_neighbours = {}
+		#Resource cell positions as an (n, 2) array for distance queries, gathered again after cells change
+		self._cell_positions = None
+		self.outposts = outpost_store.OutpostStore()
+		self.player_cells = EntityView(self.by_kind["ResourceCell"], _position)
+		self.resources = EntityView(self.by_kind["Resource"], _position)
+		self.resource_clusters = EntityView(self.clusters, id)
+		self.views = {"ResourceCell": self.player_cells, "Resource": self.resources, "Outpost": None}
+
+	def _changed(self, kind):
+		view = self.views[kind]
+		if view is not None:
+			view.changed()
+
+	def _count(self, counts, pt, delta):
+		if not self.grid.in_grid(pt):
+			return
+		x,y = pt
+		for dx, dy in NEIGHBOUR_OFFSETS:
+			neighbour = (x + dx, y + dy)
+			count = counts.get(neighbour, 0) + delta
+			if count:
+				counts[neighbour] = count
+			else:
+				del counts[neighbour]
+
+	def add(self, entity):
+		entities = self.by_kind.get(entity.type)
+		if entities is None:
+			return
+		pt = entity.position
+		entities[pt] = entity
+		self._changed(entity.type)
+		if entity.type == "Resource":
+			cluster_id = id(entity.cluster)
+			if cluster_id not in self.clusters:
+				self.clusters[cluster_id] = entity.cluster
+				self.cluster_resource_counts[cluster_id] = 0
+				self.resource_clusters.changed()
+			self.cluster_resource_counts[cluster_id] += 1
+			self._count(self.resource_neighbours, pt, 1)
+		elif entity.type == "Outpost" and entity.store is None:
+			self.outposts.append(entity)
+		elif entity.type == "ResourceCell":
+			self._cell_positions = None
+		if entity.supports_outpost():
+			self._count(self.support_neighbours, pt, 1)
+
+	def remove(self, entity):
+		entities = self.by_kind.get(entity.type)
+		if entities is None or entities.get(entity.position) is not entity:
+			return
+		pt = entity.position
+		del entities[pt]
+		self._changed(entity.type)
+		if entity.type == "Resource":
+			cluster_id = id(entity.cluster)
+			self.cluster_resource_counts[cluster_id] -= 1
+			if not self.cluster_resource_counts[cluster_id]:
+				del self.clusters[cluster_id]
+				del self.cluster_resource_counts[cluster_id]
+				self.resource_clusters.changed()
+			self._count(self.resource_neighbours, pt, -1)
+		elif entity.type == "Outpost" and entity.store is self.outposts:
+			#Dead outposts usually left the store in bulk already
+			self.outposts.remove(entity)
+		elif entity.type == "ResourceCell":
+			self._cell_positions = None
+		if entity.supports_outpost():
+			self._count(self.support_neighbours, pt, -1)
+
+	def remove_at(self, pt):
+		#Drops whatever is registered at pt
+		for entities in self.by_kind.values():
+			entity = entities.get(pt)
+			if entity is not None:
+				self.remove(entity)
+				return
+
+	def at(self, kind, pt):
+		#Entity of that kind at pt, or None
+		return self.by_kind[kind].get(pt)
+
+	def has_neighbouring_resource(self, pt):
+		return pt in self.resource_neighbours
+
+	def neighbouring_resource(self, pt):
+		#First resource next to pt in N E S W order, or None
+		if pt not in self.resource_neighbours:
+			return None
+		resources = self.by_kind["Resource"]
+		for neighbour in self.grid.get_neighbouring_points(pt):
+			resource = resources.get(neighbour)
+			if resource is not None:
+				return resource
+		return None
+
+	def supporting_neighbour_count(self, pt):
+		return self.support_neighbours.get(pt, 0)
+
+	def nearest_cell_distance(self, point):
+		#Manhattan distance from point to the nearest resource cell
+		cells = self.by_kind["ResourceCell"]
+		if not cells:
+			return float("inf")
+		if self._cell_positions is None:
+			self._cell_positions = np.array(list(cells), dtype = np.int64).reshape(-1, 2)
+		x,y = point
+		positions = self._cell_positions
+		return int((np.abs(positions[:, 0] - x) + np.abs(positions[:, 1] - y)).min())
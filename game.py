@@ -1,21 +1,55 @@
+import random
+import argparse
 import curses
 import time
 
-import game_map
+import array_grid
+import chunked_grid
 import display_constants
 import display_handler
 import input_retrieval
-import game_state
+import instrumentation
+import journal
+import map_format
+import outpost_timers
+import runtime
+import simulation
 from game_parameters import FPS
 
+#New maps with more points than this are generated chunk by chunk as they are explored, a whole map that size
+#takes seconds to generate up front
+CHUNKED_GRID_POINTS = 1 << 18
+
 class Game(object):
-	def __init__(self, xm, ym):
+	def __init__(self, xm, ym, map_path = None, journal_path = None, profile_path = None, sync_loop = False, event_timers = False,
+			grid_class = array_grid.ArrayGrid):
+		if map_path is not None:
+			#The map file decides the size
+			self.game_state = simulation.load_game_state(map_path)
+			xm, ym = self.game_state.game_map.xm, self.game_state.game_map.ym
+		elif journal_path is not None:
+			#Journals replay from the map seed
+			self.game_state = simulation.create_game_state(xm, ym, grid_class, seed = random.SystemRandom().randrange(1 << 32))
+		else:
+			self.game_state = simulation.create_game_state(xm, ym, grid_class)
+		if event_timers:
+			outpost_timers.enable(self.game_state.game_map, self.game_state.parameters)
 		self.game_xm = xm
 		self.game_ym = ym
-		cursor = (0, 0)
-		grid = game_map.get_grid(xm, ym)
-		cursor = grid.player_cells[0].position
-		self.game_state = game_state.GameState(cursor, grid)
+		self.journal_path = journal_path
+		self.journal = None if journal_path is None else journal.Journal.for_game_state(self.game_state)
+		self.simulation = simulation.Simulation(self.game_state, self.journal)
+		#Where to dump frame timings on quit, when profiling
+		self.profile_path = profile_path
+		#Run the plain single threaded loop instead of the asyncio runtime
+		self.sync_loop = sync_loop
+
+	def finish(self):
+		if self.journal is not None:
+			self.journal.finish(self.simulation)
+			self.journal.save(self.journal_path)
+		if self.profile_path:
+			instrumentation.profiler.dump(self.profile_path)
 
 	def gameLoop(self, main_scr):
 		curses.start_color()
@@ -30,41 +64,99 @@ class Game(object):
 		main_scr.nodelay(1)
 		currtime = time.time()
 		
-		game_border = main_scr.subwin(self.game_ym + 2, self.game_xm + 2, 0, 0)
+		#Maps bigger than the terminal are shown through a view that scrolls with the cursor,
+		#leaving room for the borders and the detail window
+		lines, cols = main_scr.getmaxyx()
+		view_xm = max(1, min(self.game_xm, cols - 2))
+		view_ym = max(1, min(self.game_ym, lines - 12))
+		game_border = main_scr.subwin(view_ym + 2, view_xm + 2, 0, 0)
 		game_border.box()
-		game_window = main_scr.subwin(self.game_ym, self.game_xm, 1, 1)
+		game_window = main_scr.subwin(view_ym, view_xm, 1, 1)
 		#self.game_window = game_window
 
-		detail_border = main_scr.subwin(10, self.game_xm + 2, self.game_ym + 2, 0)
+		detail_border = main_scr.subwin(10, view_xm + 2, view_ym + 2, 0)
 		detail_border.box()
-		detail_window = main_scr.subwin(8, self.game_xm, self.game_ym + 3, 1)
+		detail_window = main_scr.subwin(8, view_xm, view_ym + 3, 1)
 		#self.detail_window = detail_window
 		dh = display_handler.DisplayHandler(self.game_state, game_window, detail_window)
+		
+		input_source = input_retrieval.make_input(main_scr)
+		if not self.sync_loop:
+			#Route previews searched in the background depend on timing, so journaled games search in line
+			runtime.GameRuntime(self.simulation, dh, input_source, main_scr.refresh,
+				defer_route_search = self.journal is None).run()
+			self.finish()
+			return
+		
+		#Game time advances in fixed ticks, the screen is drawn once per frame and whenever keys come in
+		clock = simulation.RealTimeClock(self.game_state.parameters.tick_rate, currtime)
 
 		# Game Loop
 		while True:
-			lastFrame = currtime
 			currtime = time.time()
+			profiler = instrumentation.profiler
+			profiler.start_frame()
 			
-			op = input_retrieval.get_input_op()
-			if op == input_retrieval.QUIT:
+			with profiler.phase("input"):
+				ops = [op for op in input_source.get_input_ops() if op != input_retrieval.NOP]
+			if input_retrieval.QUIT in ops:
+				self.simulation.apply_ops(ops[:ops.index(input_retrieval.QUIT)])
+				self.finish()
 				break
 			
-			self.game_state.update(op)
+			with profiler.phase("update"):
+				#Keys act right away rather than waiting for the next tick
+				self.simulation.apply_ops(ops)
+				for _ in range(clock.due_ticks(currtime)):
+					self.simulation.step()
 
 			#game_window.erase()
 			#detail_window.erase()
 			#Display updates
-			dh.display_update()
-			
-			main_scr.refresh()
-			sleepTime = 1./FPS - (time.time() - lastFrame)
-			if sleepTime > 0:
-				time.sleep(sleepTime)
+			with profiler.phase("render"):
+				dh.display_update()
+				main_scr.refresh()
+			profiler.end_frame()
+			#Sleep until the next frame or tick is due, waking early for input
+			now = time.time()
+			input_source.wait(min(currtime + 1./FPS - now, clock.time_until_next_tick(now)))
+
 
+def parse_size(text):
+	try:
+		xm, ym = [int(v) for v in text.lower().split("x")]
+	except ValueError:
+		raise argparse.ArgumentTypeError("map size must be XMxYM, like 90x20, not {!r}".format(text))
+	if xm < 1 or ym < 1:
+		raise argparse.ArgumentTypeError("map size must be positive, not {!r}".format(text))
+	return xm, ym
 
 def startGame():
-	game = Game(90, 20)
+	parser = argparse.ArgumentParser()
+	parser.add_argument("map", nargs = "?", help = "map file written by map_format.py")
+	parser.add_argument("--journal", help = "record every op to this file, replay it with journal.py")
+	parser.add_argument("--profile", nargs = "?", const = "", metavar = "FILE",
+		help = "show frame timings, and dump them to FILE on quit")
+	parser.add_argument("--sync-loop", action = "store_true", help = "run the single threaded game loop")
+	parser.add_argument("--event-timers", action = "store_true", help = "only step outposts when they have something due")
+	parser.add_argument("--size", type = parse_size, default = (90, 20),
+		help = "map size as XMxYM, maps bigger than the terminal scroll")
+	parser.add_argument("--chunked", action = "store_true",
+		help = "generate the map chunk by chunk as it is explored, the default above {} points".format(CHUNKED_GRID_POINTS))
+	args = parser.parse_args()
+	xm, ym = args.size
+	grid_class = array_grid.ArrayGrid
+	if args.map is None and (args.chunked or xm * ym > CHUNKED_GRID_POINTS):
+		grid_class = chunked_grid.ChunkedGrid
+		if args.journal is not None:
+			#journal.replay plays the seed on an ArrayGrid, which lays the map out differently
+			parser.error("journaled games are played on whole maps, of at most {} points".format(CHUNKED_GRID_POINTS))
+	if args.map is not None and args.journal is not None and map_format.read_seed(args.map) is None:
+		#journal.replay generates the map again from its seed
+		parser.error("journaled games replay from the map seed, {} was saved without one".format(args.map))
+	if args.profile is not None:
+		instrumentation.enable()
+	game = Game(xm, ym, args.map, args.journal, args.profile, args.sync_loop, args.event_timers, grid_class)
 	curses.wrapper(game.gameLoop)
 
 
@@ -1,10 +1,15 @@
 import random
 import math
+import heapq
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from time import sleep
 
 import display_constants
 import state_constants
 import game_parameters
+import entity_registry
+import outpost_store
 
 Z = (0, 0)
 N = (0, -1)
@@ -22,14 +27,19 @@ BIAS_STRAIGHT = False
 MIN_ROOM_DIM = 3
 ROOM_VAR = 5
 
+NO_ZONE = -1
+
 WRITE_MAP_SETTINGS = False
 ANIMATE = False and __name__=="__main__"
 
+#Entity classes are slotted and keep their type on the class, grids hold a lot of them
+
 class ResourceCell(object):
+	__slots__ = ("position", "cluster")
+	type = "ResourceCell"
 	def __init__(self, position, cluster):
 		self.position = position
 		self.cluster = cluster
-		self.type = "ResourceCell"
 	def get_description(self):
 		return "Resource Cell. Neighbouring Resource Cluster: {:0=3d}".format(self.cluster.get_total_amount())
 	def get_display(self):
@@ -45,9 +55,9 @@ class ResourceCell(object):
 	
 
 class Rock(object):
-	def __init__(self, position):
-		self.position = position
-		self.type = "Rock"
+	#Rocks are all alike, so every wall cell shares the ROCK_TILE flyweight and a rock has no position
+	__slots__ = ()
+	type = "Rock"
 	def get_description(self):
 		return "Rock"
 	def get_display(self):
@@ -59,12 +69,15 @@ class Rock(object):
 	def attempt_select(self):
 		return False
 
+ROCK_TILE = Rock()
+
 class Resource(object):
+	__slots__ = ("amount", "cluster", "position")
+	type = "Resource"
 	def __init__(self, position, amount, cluster):
 		self.amount = amount
 		self.cluster = cluster
 		self.position = position
-		self.type = "Resource"
 	def get_description(self):
 		return "Resource: {0:0=2d}. Cluster: {1:0=3d}".format(self.amount, self.cluster.get_total_amount())
 	def get_display(self):
@@ -79,35 +92,101 @@ class Resource(object):
 class ResourceCluster(object):
 	def __init__(self):
 		self.resources = []
+		self.total_amount = 0
+		#Max heap of (-amount, index in resources) over resources with something left.
+		#Ties go to the earlier resource, like max() over the list.
+		self._heap = []
+	def add_resource(self, resource):
+		self.resources.append(resource)
+		self.total_amount += resource.amount
+		if resource.amount > 0:
+			heapq.heappush(self._heap, (-resource.amount, len(self.resources) - 1))
 	def get_total_amount(self):
-		return sum([r.amount for r in self.resources])
+		return self.total_amount
 	def get_description(self):
 		return "Resource Cluster: {}".format(self.get_total_amount())
 	def attempt_select(self):
 		return False
 	def remove_amount(self, amount_to_remove):
-		if amount_to_remove > self.get_total_amount():
-			return False
-		amount_left_to_remove = amount_to_remove
-		while amount_left_to_remove > 0:
-			if amount_left_to_remove > 10:
-				step = 10
-			else:
-				step = amount_left_to_remove
-			amount_left_to_remove -= 10
-			amount_left_in_step = step
-			while amount_left_in_step > 0:
-				highest_resource = max(self.resources, key = lambda p: p.amount)
-				amount_removing_from_highest_resource = min(amount_left_in_step, highest_resource.amount)
-				highest_resource.amount -= amount_removing_from_highest_resource
-				amount_left_in_step -= amount_removing_from_highest_resource
-		return True
+		return self.remove_amounts([amount_to_remove])[0]
+	def remove_amounts(self, amounts_to_remove):
+		#Withdraws for several constructions in one pass over the heap, the same as remove_amount for each in order.
+		#A construction is paid in full or not at all. Each one is paid in steps of 10, the last one 1 to 10,
+		#every step from the resource with the most left. Returns whether each was paid.
+		results = []
+		#Runs of (step, count) for the constructions that are paid
+		runs = []
+		total_amount = self.total_amount
+		for amount in amounts_to_remove:
+			if amount > total_amount:
+				results.append(False)
+				continue
+			results.append(True)
+			if amount > 0:
+				total_amount -= amount
+				tens = (amount - 1) // 10
+				for step, count in ((10, tens), (amount - 10 * tens, 1)):
+					if not count:
+						continue
+					if runs and runs[-1][0] == step:
+						runs[-1] = (step, runs[-1][1] + count)
+					else:
+						runs.append((step, count))
+		self.total_amount = total_amount
+		for step, count in runs:
+			self._remove_steps(step, count)
+		return results
+	def _remove_steps(self, step, count):
+		heap = self._heap
+		resources = self.resources
+		last_index = None
+		while count:
+			index = heap[0][1]
+			resource = resources[index]
+			amount = resource.amount
+			if amount >= step:
+				#A resource still on top after a step usually has a lead, then it takes full steps for as long as
+				#it stays on top in one go
+				steps = 1
+				if index == last_index and count > 1:
+					steps = min(count, amount // step)
+					if len(heap) > 1:
+						second = heap[1]
+						if len(heap) > 2 and heap[2] < second:
+							second = heap[2]
+						lead = amount + second[0]
+						if lead % step == 0 and index < second[1]:
+							steps = min(steps, lead // step + 1)
+						else:
+							steps = min(steps, (lead - 1) // step + 1)
+				resource.amount = amount - steps * step
+				count -= steps
+				last_index = index
+				if resource.amount > 0:
+					heapq.heapreplace(heap, (-resource.amount, index))
+				else:
+					heapq.heappop(heap)
+				continue
+			#A step bigger than the top resource takes it all and goes on to the next
+			left = step
+			while left > 0:
+				index = heap[0][1]
+				resource = resources[index]
+				taken = min(left, resource.amount)
+				resource.amount -= taken
+				left -= taken
+				if resource.amount > 0:
+					heapq.heapreplace(heap, (-resource.amount, index))
+				else:
+					heapq.heappop(heap)
+			count -= 1
 		
 
 class RouteAttemptTile(object):
+	__slots__ = ("position",)
+	type = "RouteAttemptTile"
 	def __init__(self, position):
 		self.position = position
-		self.type = "RouteAttemptTile"
 	def get_description(self):
 		return ""
 	def get_display(self):
@@ -118,20 +197,62 @@ class RouteAttemptTile(object):
 		return False
 
 class RouteAttempt(object):
+	__slots__ = ("attempt_tiles",)
 	def __init__(self, attempt_tiles):
 		self.attempt_tiles = attempt_tiles
 		
+def _outpost_column(name, convert):
+	#Reads and writes the outpost's row in its store, or its own values while it is not in one
+	def get(self):
+		if self.store is None:
+			return self.detached[name]
+		if self.store.timers is not None:
+			self.store.timers.materialize([self.slot])
+		return convert(self.store.columns[name][self.slot])
+	def set(self, value):
+		if self.store is None:
+			self.detached[name] = value
+		elif self.store.timers is not None:
+			self.store.timers.materialize([self.slot])
+			self.store.columns[name][self.slot] = value
+			self.store.timers.touched(self.slot)
+		else:
+			self.store.columns[name][self.slot] = value
+	return property(get, set)
+
 class Outpost(object):
-	def __init__(self, position):
+	#A view on one slot of an OutpostStore once added to a grid's outposts
+	__slots__ = ("position", "parameters", "max_health", "store", "slot", "detached")
+	type = "Outpost"
+	def __init__(self, position, parameters = game_parameters.DEFAULT_PARAMETERS):
 		self.position = position
-		self.type = "Outpost"
-		self.max_health = game_parameters.OUTPOST_MAX_HEALTH
-		self.health = self.max_health
-		self.energy = 0
-		self.can_remove = False
-		self.withering = False
-		self.wither_energy = 0
-		self.supporting_neighbour_count = 0
+		#Rules of the game the outpost is in, a game_parameters.GameParameters
+		self.parameters = parameters
+		self.max_health = parameters.outpost_max_health
+		self.store = None
+		self.slot = None
+		self.detached = {
+			"health": self.max_health,
+			"energy": 0,
+			"can_remove": False,
+			"withering": False,
+			"wither_energy": 0,
+			"supporting_neighbour_count": 0,
+		}
+	health = _outpost_column("health", int)
+	energy = _outpost_column("energy", int)
+	can_remove = _outpost_column("can_remove", bool)
+	withering = _outpost_column("withering", bool)
+	wither_energy = _outpost_column("wither_energy", int)
+	supporting_neighbour_count = _outpost_column("supporting_neighbour_count", int)
+	def attach(self, store, slot):
+		self.store = store
+		self.slot = slot
+		self.detached = None
+	def detach(self):
+		self.detached = {name: getattr(self, name) for name in outpost_store.COLUMN_TYPES}
+		self.store = None
+		self.slot = None
 	def get_description(self):
 		if self.withering:
 			title = "Withering Outpost"
@@ -140,8 +261,8 @@ class Outpost(object):
 		return "{} {:2}/{:2} | Support {} | Energy {}".format(title, self.health, self.max_health, self.supporting_neighbour_count, self.energy)
 	def get_display(self):
 		display_colour = display_constants.PLAYER_COLOR_PAIR_INDEX
-		is_injured = self.health < game_parameters.OUTPOST_MAX_HEALTH
-		if self.health < game_parameters.OUTPOST_MAX_HEALTH // 2:
+		is_injured = self.health < self.max_health
+		if self.health < self.max_health // 2:
 			return '.', display_colour, is_injured
 		return ':', display_colour, is_injured
 	def allows_route(self):
@@ -155,36 +276,76 @@ class Outpost(object):
 	def update_self(self, neighbour_count):
 		self.energy += 1
 		self.supporting_neighbour_count = neighbour_count
-		if (not self.withering) and (self.supporting_neighbour_count < game_parameters.OUTPOST_REQUIRED_SUPPORT):
+		if (not self.withering) and (self.supporting_neighbour_count < self.parameters.outpost_required_support):
 			self.withering = True
-		elif self.withering and (self.supporting_neighbour_count >= game_parameters.OUTPOST_REQUIRED_SUPPORT):
+		elif self.withering and (self.supporting_neighbour_count >= self.parameters.outpost_required_support):
 			self.withering = False
 			self.wither_energy = 0
 		if self.withering:
 			self.wither_energy += 1
-			if self.wither_energy >= game_parameters.OUTPOST_WITHER_ENERGY_COST:
-				self.wither_energy -= game_parameters.OUTPOST_WITHER_ENERGY_COST
+			if self.wither_energy >= self.parameters.outpost_wither_energy_cost:
+				self.wither_energy -= self.parameters.outpost_wither_energy_cost
 				self.health -= 1
 		if self.health < 1:
 			self.can_remove = True
 			self.energy = 0
 
+def route_cost_of(tile):
+	#Cost of routing through a tile, infinite if it blocks routes
+	if tile is None:
+		return 1
+	if not tile.allows_route():
+		return float("inf")
+	return tile.get_route_cost()
+
 class Grid(object):
 	def __init__(self, xm, ym):
 		self.xm = xm
 		self.ym = ym
 		
+		#Resources, cells and outposts by kind and position, kept in step by _set_tile
+		self.registry = entity_registry.EntityRegistry(self)
+		self._init_storage()
+		#Points whose display may have changed since the last frame
+		self.dirty_points = set()
+		#Bumped on every tile change, so cached searches can tell the map changed
+		self.version = 0
+		#Version of the last change to each point that has ever changed
+		self.cell_versions = {}
+		#Version of the last change that made a point cheaper or opened it to routes
+		self.shortcut_version = 0
+		#Grid version at the last change to an entity that left its tile in place, like a resource drawn down
+		self.entity_versions = {}
+		#Every changed point in order when set to a list, see outpost_timers
+		self.change_log = None
+
+	def _init_storage(self):
 		self.map = {}
-		for y in range(ym + 1):
-			for x in range(xm + 1):
+		for y in range(self.ym + 1):
+			for x in range(self.xm + 1):
 				self.map[(x, y)] = None
-		self.resource_clusters = []
-		self.player_cells = []
-		self.outposts = []
-
+	def _store_tile(self, pt, item):
+		self.map[pt] = item
+	def _set_tile(self, pt, item):
+		#Grid classes store tiles in _store_tile, the registry is updated here for all of them
+		self._store_tile(pt, item)
+		self.registry.remove_at(pt)
+		if item is not None:
+			self.registry.add(item)
+	@property
+	def player_cells(self):
+		return self.registry.player_cells
+	@property
+	def resource_clusters(self):
+		return self.registry.resource_clusters
+	@property
+	def outposts(self):
+		return self.registry.outposts
+	def points(self):
+		return self.map.keys()
 	def in_grid(self, pt):
 		x,y = pt
-		return not any([x >= self.xm, x < 0, y >= self.ym, y < 0])
+		return 0 <= x < self.xm and 0 <= y < self.ym
 	def get_tile(self, pt):
 		return self.map[pt]
 	def get_tile_description(self, pt):
@@ -194,13 +355,32 @@ class Grid(object):
 		else:
 			return tile.get_description()
 	def add_tile(self, item, pt):
-		if self.map[pt] is None:
-			self.map[pt] = (item)
+		if self.get_tile(pt) is None:
+			self._set_tile(pt, item)
+			self._record_change(pt, None, item)
+			self.mark_dirty(pt)
 		else:
 			raise ValueError("Point {0} already has tile".format(pt))
 	def remove_tile(self, item):
 		pt = item.position
-		self.map[pt] = None
+		self._set_tile(pt, None)
+		self._record_change(pt, item, None)
+		self.mark_dirty(pt)
+	def _record_change(self, pt, old_tile, new_tile):
+		self.version += 1
+		self.cell_versions[pt] = self.version
+		if self.change_log is not None:
+			self.change_log.append(pt)
+		if route_cost_of(new_tile) < route_cost_of(old_tile):
+			self.shortcut_version = self.version
+	def record_entity_change(self, pt):
+		self.entity_versions[pt] = self.version
+	def mark_dirty(self, pt):
+		self.dirty_points.add(pt)
+	def pop_dirty_points(self):
+		dirty_points = self.dirty_points
+		self.dirty_points = set()
+		return dirty_points
 	def get_tile_display(self, pt):
 		tile = self.get_tile(pt)
 		if tile is None:
@@ -220,20 +400,78 @@ class Grid(object):
 			return tl.get_route_cost()
 		else:
 			return 1
+	def _tile_allows_route(self, pt):
+		#is_route_allowed for a point known to be in_grid
+		tl = self.get_tile(pt)
+		return tl.allows_route() if tl else True
 	def get_neighbouring_points(self, pt):
-		return [av(pt, dr) for dr in directions if self.in_grid(av(pt, dr))]
+		#Neighbours in_grid in N E S W order, checked against the bounds directly so nothing is kept per point
+		x,y = pt
+		xm, ym = self.xm, self.ym
+		if not (0 <= x < xm and 0 <= y < ym):
+			return [n for n in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)) if self.in_grid(n)]
+		found = []
+		if y > 0:
+			found.append((x, y - 1))
+		if x + 1 < xm:
+			found.append((x + 1, y))
+		if y + 1 < ym:
+			found.append((x, y + 1))
+		if x > 0:
+			found.append((x - 1, y))
+		return found
+	def route_neighbours(self, pt):
+		#Neighbours of pt that allow routes, what every search expands
+		return [n for n in self.get_neighbouring_points(pt) if self._tile_allows_route(n)]
 	def get_neighbouring_objects(self, p1):
 		return [self.get_tile(p2) for p2 in self.get_neighbouring_points(p1) if self.get_tile(p2)]
+	def neighbouring_resource(self, pt):
+		#First resource next to pt in N E S W order, or None
+		return self.registry.neighbouring_resource(pt)
+	def count_supporting_neighbours(self, pt):
+		return self.registry.supporting_neighbour_count(pt)
+	def supporting_neighbour_counts(self, xs, ys):
+		return [self.count_supporting_neighbours((int(x), int(y))) for x, y in zip(xs, ys)]
+
 
 
+class MapParameters(object):
+	def __init__(self, door_threshold = DOOR_THRES, roughness_threshold = ROUGH_THRES, failed_attempts = FAILED_ATTEMPTS,
+			bias_straight = BIAS_STRAIGHT, min_room_dim = MIN_ROOM_DIM, room_variation = ROOM_VAR):
+		self.door_threshold = door_threshold
+		self.roughness_threshold = roughness_threshold
+		self.failed_attempts = failed_attempts
+		self.bias_straight = bias_straight
+		self.min_room_dim = min_room_dim
+		self.room_variation = room_variation
+	@classmethod
+	def random(cls, rng = random):
+		door_threshold = rng.random()*.9 + .1
+		roughness_threshold = rng.random() * .3
+		failed_attempts = rng.randint(0, 200)
+		bias_straight = rng.randint(0, 1)
+		min_room_dim = rng.randint(3, 4)
+		room_variation = rng.randint(3, 5)
+		return cls(door_threshold, roughness_threshold, failed_attempts, bias_straight, min_room_dim, room_variation)
+	def describe(self):
+		return [
+			"Door threshold: " + str(self.door_threshold),
+			"Roughness threshold: " + str(self.roughness_threshold),
+			"Allowed failed room attempts: " + str(self.failed_attempts),
+			"Staight line bias? " + str(self.bias_straight),
+			"Min room dim: " + str(self.min_room_dim),
+			"Room variation: " + str(self.room_variation),
+		]
 
-def set_constants():
-	DOOR_THRES = random.random()*.9 + .1
-	ROUGH_THRES = random.random() * .3
-	FAILED_ATTEMPTS = random.randint(0, 200)
-	BIAS_STRAIGHT = random.randint(0, 1)
-	MIN_ROOM_DIM = random.randint(3, 4)
-	ROOM_VAR = random.randint(3, 5)
+def set_constants(rng = random):
+	global DOOR_THRES, ROUGH_THRES, FAILED_ATTEMPTS, BIAS_STRAIGHT, MIN_ROOM_DIM, ROOM_VAR
+	parameters = MapParameters.random(rng)
+	DOOR_THRES = parameters.door_threshold
+	ROUGH_THRES = parameters.roughness_threshold
+	FAILED_ATTEMPTS = parameters.failed_attempts
+	BIAS_STRAIGHT = parameters.bias_straight
+	MIN_ROOM_DIM = parameters.min_room_dim
+	ROOM_VAR = parameters.room_variation
 	
 	#DOOR_THRES = 0.32234678069988054
 	#ROUGH_THRES = 0.14971437014511607
@@ -242,30 +480,7 @@ def set_constants():
 	#MIN_ROOM_DIM = 1
 	#ROOM_VAR = 0
 	
-	if WRITE_MAP_SETTINGS:
-		with open("lastmapsettings.txt", "w+") as f:
-			f.write("\n".join([
-			
-				"Door threshold: " + str(DOOR_THRES),
-				"Roughness threshold: " + str(ROUGH_THRES),
-				"Allowed failed room attempts: " + str(FAILED_ATTEMPTS),
-				"Staight line bias? " + str(BIAS_STRAIGHT),
-				"Min room dim: " + str(MIN_ROOM_DIM),
-				"Room variation: " + str(ROOM_VAR),			
-			]))
-			
-	if __name__ == "__main__":
-		print("\n".join([
-			
-				"Door threshold: " + str(DOOR_THRES),
-				"Roughness threshold: " + str(ROUGH_THRES),
-				"Allowed failed room attempts: " + str(FAILED_ATTEMPTS),
-				"Staight line bias? " + str(BIAS_STRAIGHT),
-				"Min room dim: " + str(MIN_ROOM_DIM),
-				"Room variation: " + str(ROOM_VAR),
-			]))
-			
-	return DOOR_THRES,ROUGH_THRES,FAILED_ATTEMPTS,BIAS_STRAIGHT,MIN_ROOM_DIM,ROOM_VAR
+	return parameters
 
 
 
@@ -287,7 +502,15 @@ class Room(object):
 		self.width = width
 		self.height = height
 		self.merged = False
-		self.neighbours = set([av(pt, dir) for pt in self.points for dir in directions if av(pt, dir) not in self.points])
+		#Most rooms tried never fit, so their neighbours are only worked out when asked for
+		self._neighbours = None
+	@property
+	def neighbours(self):
+		if self._neighbours is None:
+			points = self.points
+			point_set = set(points)
+			self._neighbours = set([av(pt, dir) for pt in points for dir in directions if av(pt, dir) not in point_set])
+		return self._neighbours
 	@property
 	def nw(self):
 		return (self.x, self.y)
@@ -319,6 +542,12 @@ class Map(object):
 		self.grid = []
 		for i in range(self.ym):
 			self.grid.append(["#" for _ in range(self.xm)])
+		#Index into the zone list (rooms then mazes) of the zone each point was carved for
+		self.zone_ids = []
+		for i in range(self.ym):
+			self.zone_ids.append([NO_ZONE for _ in range(self.xm)])
+		#Set while mazes are carved, see MazeStartCandidates
+		self.maze_start_candidates = None
 		
 	def __str__(self):
 		return "\n".join("".join(i) for i in self.grid)
@@ -338,6 +567,8 @@ class Map(object):
 	def clear(self, point):
 		x,y = point
 		self.grid[y][x] = " "
+		if self.maze_start_candidates is not None:
+			self.maze_start_candidates.point_cleared(point)
 		
 	def fill(self, point):
 		x,y = point
@@ -372,18 +603,91 @@ class Map(object):
 			return False
 		
 		
+	def mark_zone(self, points, zone_id):
+		for x,y in points:
+			self.zone_ids[y][x] = zone_id
+	
+	def get_neighbouring_zones(self, point):
+		zone_ids = set()
+		for direction in directions:
+			one = av(point, direction)
+			if one in self:
+				x,y = one
+				if self.zone_ids[y][x] != NO_ZONE:
+					zone_ids.add(self.zone_ids[y][x])
+		return zone_ids
+		
 	def get_align_points(self):
 		return [(2 * x + 1, 2 * y + 1) for x in range(self.width) for y in range(self.height)]
 	def get_off_points(self):
 		return [(2 * x, 2 * y) for x in range(self.width) for y in range(self.height)]
 
-def makeMaze(mp):
-	options = [p for p in mp.get_align_points() if (not mp.spot_empty(p)) and mp.pt_has_avail_path(p) ]
+class MazeStartCandidates(object):
+	#The align points makeMaze could start from, in get_align_points order, kept up to date as the map is cleared.
+	#Clearing only ever removes candidates, so only points near a cleared point are rechecked.
+	#Supports len() and indexing, so random.choice picks exactly what it would from the full list.
+	def __init__(self, mp):
+		self.mp = mp
+		self.points = mp.get_align_points()
+		self.indices = dict((pt, i) for i, pt in enumerate(self.points))
+		self.valid = [self.is_candidate(pt) for pt in self.points]
+		self.count = sum(self.valid)
+		#Fenwick tree over valid, 1 based
+		n = len(self.points)
+		self.tree = [0] + [int(v) for v in self.valid]
+		for i in range(1, n + 1):
+			parent = i + (i & -i)
+			if parent <= n:
+				self.tree[parent] += self.tree[i]
+		self.top_bit = 1
+		while self.top_bit * 2 <= n:
+			self.top_bit *= 2
+	def is_candidate(self, point):
+		return (not self.mp.spot_empty(point)) and self.mp.pt_has_avail_path(point)
+	def __len__(self):
+		return self.count
+	def __getitem__(self, k):
+		if k < 0 or k >= self.count:
+			raise IndexError(k)
+		#Find the (k+1)th valid point
+		pos = 0
+		remaining = k + 1
+		step = self.top_bit
+		while step:
+			if pos + step < len(self.tree) and self.tree[pos + step] < remaining:
+				pos += step
+				remaining -= self.tree[pos]
+			step //= 2
+		return self.points[pos]
+	def point_cleared(self, point):
+		#A candidate depends on itself and the two points beyond it in each direction
+		affected = [point]
+		for direction in directions:
+			one = av(point, direction)
+			affected.append(one)
+			affected.append(av(one, direction))
+		for pt in affected:
+			i = self.indices.get(pt)
+			if i is not None and self.valid[i] and not self.is_candidate(pt):
+				self.valid[i] = False
+				self.count -= 1
+				i += 1
+				while i < len(self.tree):
+					self.tree[i] -= 1
+					i += i & -i
+
+def makeMaze(mp, rng = random, bias_straight = None):
+	if bias_straight is None:
+		bias_straight = BIAS_STRAIGHT
+	if mp.maze_start_candidates is not None:
+		options = mp.maze_start_candidates
+	else:
+		options = [p for p in mp.get_align_points() if (not mp.spot_empty(p)) and mp.pt_has_avail_path(p) ]
 	
 	if not options:
 		return False
 	
-	start = random.choice(options)
+	start = rng.choice(options)
 	
 	active = set([start])
 	clear_points = set([start])
@@ -403,10 +707,10 @@ def makeMaze(mp):
 			
 		if len(valid):
 			
-			if lastDirection and lastDirection in valid and BIAS_STRAIGHT:# and random.random() < .9:
+			if lastDirection and lastDirection in valid and bias_straight:# and random.random() < .9:
 				chosen = lastDirection
 			else:
-				chosen = random.choice(valid)
+				chosen = rng.choice(valid)
 			lastDirection = chosen
 			one = av(curr, chosen)
 			two = av(one, chosen)
@@ -426,169 +730,231 @@ def makeMaze(mp):
 	#	mp.grid[y][x] = "h"
 
 
-		
-def getMap(wdth, ht):
-	DOOR_THRES,ROUGH_THRES,FAILED_ATTEMPTS,BIAS_STRAIGHT,MIN_ROOM_DIM,ROOM_VAR = set_constants()
-
-
-
-	m = Map(wdth, ht)
-	if ANIMATE:
-		print(m)
-		print("\nClearing...")
-	failed_attempts = FAILED_ATTEMPTS
-	rooms = []
-	mazes = []
-	while failed_attempts > 0:
-		rx = 2 * random.randint(1, m.width) - 1
-		ry = 2 * random.randint(1, m.height) - 1
-		width = 2 * random.randint(MIN_ROOM_DIM, MIN_ROOM_DIM + ROOM_VAR) - 1
-		height = 2 * random.randint(MIN_ROOM_DIM, MIN_ROOM_DIM + ROOM_VAR) - 1
-		rm = Room(rx, ry, width, height)
-		if m.add_room(rm):
-			rooms.append(rm)
-		else:
-			failed_attempts -= 1
-	more = True
-	while more:
-		#print("Making maze...")
-		more = makeMaze(m)
-		mt = str(more)
-		#print("More was " + mt)
-		#if more:
-			#print(len(more.points))
-			#print(more.points)
-		if more:
-			mazes.append(more)
-	zones = rooms + mazes
-	m.rooms = rooms
-	if ANIMATE:
-		print("\nCleared.\n")
-		print(m)
-		print("\n")
-	#for point in mazes[0].points:
-	#	x,y = point
-	#	m.grid[y][x] = "o"
-	#for point in mazes[0].neighbours:
-	#	x,y = point
-	#	m.grid[y][x] = "."
-	#for point in rooms[0].points:
-	#	x,y = point
-	#	m.grid[y][x] = "o"
-	potential_doors = dict()
-	for point in m.get_off_points():
+
+def count_walls(m, point):
+	return len([dir for dir in directions if not m.spot_empty(av(point, dir))])
+
+def prune_dead_ends(m, open_points):
+	#Fill in open points with three or more walled sides until none are left, discarding them from open_points.
+	#Filling a point can only turn its neighbours into dead ends, so only they are rechecked.
+	#Pruning only starts if some point has exactly three walls, points walled in on all four sides alone stay open.
+	if not any(count_walls(m, point) == 3 for point in open_points):
+		return
+	worklist = deque(point for point in open_points if count_walls(m, point) >= 3)
+	while worklist:
+		point = worklist.popleft()
+		if point not in open_points or count_walls(m, point) < 3:
+			continue
 		x,y = point
-		nzs = set([zn for zn in zones for dr in directions if point in zn.neighbours])
-		if not m.spot_empty(point) and len(nzs) == 2:
-			potential_doors[point] = nzs
-			#m.grid[y][x] = "&" #str(len(nzs))[-1]
-	start = zones[0]
-	working = set([start])
-	while len(working):
-		curr = working.pop()
-		curr.merged = True
+		m.grid[y][x] = "#"
+		open_points.discard(point)
 		if ANIMATE:
-			for pt in curr.points:
-				px,py = pt
-				m.grid[py][px] = "."
-		for pt in curr.neighbours:
-			if pt in potential_doors:
-				oz = [z for z in potential_doors[pt] if z != curr][0]
-				if not oz.merged and not(oz in working and random.random() < DOOR_THRES):
-					working.add(oz)
-					px,py = pt
-					m.grid[py][px] = "_"
-					if ANIMATE:
-						print(m)
-						delay_func()
-					
-	if ANIMATE:
-		gap_func()
-	open_points = set()
-	for y,row in enumerate(m.grid):
-		for x in range(len(row)):
-			if row[x] != "#":
-				open_points.add((x,y))
-				row[x] = " "
-	if ANIMATE:
-		print()
-		print(m)
-		gap_func()
-	dead_ends = set()
+			print(m)
+			delay_func()
+		for dir in directions:
+			neighbour = av(point, dir)
+			if neighbour in open_points:
+				worklist.append(neighbour)
+		
+class MapGenerator(object):
+	#Generates maps from an explicit seed and parameters, the same seed and parameters always give the same map.
+	#Parameters are drawn from the seed when not given.
+	def __init__(self, seed = None, parameters = None, rng = None):
+		if rng is None:
+			if seed is None:
+				seed = random.SystemRandom().randrange(1 << 32)
+			rng = random.Random(seed)
+		self.seed = seed
+		self.rng = rng
+		if parameters is None:
+			parameters = MapParameters.random(rng)
+		self.parameters = parameters
+		
+	def describe(self):
+		return ["Seed: " + str(self.seed)] + self.parameters.describe()
+	
+	def generate(self, wdth, ht):
+		if WRITE_MAP_SETTINGS:
+			with open("lastmapsettings.txt", "w+") as f:
+				f.write("\n".join(self.describe()))
+		if __name__ == "__main__":
+			print("\n".join(self.describe()))
+		
+		m = self.generate_terrain(wdth, ht)
+		m.start_location = self.pick_start_location(m)
+		m.seed = self.seed
+		m.parameters = self.parameters
+		if ANIMATE:
+			print()
+			print(m)
+		return m
 	
+	def generate_terrain(self, wdth, ht):
+		#Everything but the start location, which needs a map with at least one cluster
+		m = Map(wdth, ht)
+		if ANIMATE:
+			print(m)
+			print("\nClearing...")
+		rooms = self.carve_rooms(m)
+		mazes = self.carve_mazes(m, len(rooms))
+		zones = rooms + mazes
+		m.rooms = rooms
+		if ANIMATE:
+			print("\nCleared.\n")
+			print(m)
+			print("\n")
+		self.open_doors(m, zones)
+		if ANIMATE:
+			gap_func()
+		open_points = self.collect_open_points(m)
+		if ANIMATE:
+			print()
+			print(m)
+			gap_func()
+		prune_dead_ends(m, open_points)
+		if ANIMATE:
+			gap_func()
+		self.roughen(m, open_points)
+		m.clusters = self.place_resources(m, rooms)
+		return m
 	
-	for point in open_points:
-		ns = [av(point, dir) for dir in directions if not m.spot_empty(av(point,dir))]
-		if len(ns) == 3:
-			x,y=point
-			m.grid[y][x] = "#"
-			dead_ends.add((x,y))
-			
+	def carve_rooms(self, m):
+		rng = self.rng
+		parameters = self.parameters
+		failed_attempts = parameters.failed_attempts
+		rooms = []
+		while failed_attempts > 0:
+			rx = 2 * rng.randint(1, m.width) - 1
+			ry = 2 * rng.randint(1, m.height) - 1
+			width = 2 * rng.randint(parameters.min_room_dim, parameters.min_room_dim + parameters.room_variation) - 1
+			height = 2 * rng.randint(parameters.min_room_dim, parameters.min_room_dim + parameters.room_variation) - 1
+			rm = Room(rx, ry, width, height)
+			if m.add_room(rm):
+				m.mark_zone(rm.points, len(rooms))
+				rooms.append(rm)
+			else:
+				failed_attempts -= 1
+		return rooms
 	
-	while len(dead_ends):
-		for de in dead_ends:
-			open_points.discard(de)
-		dead_ends = set()
+	def carve_mazes(self, m, first_zone_id):
+		mazes = []
+		m.maze_start_candidates = MazeStartCandidates(m)
+		more = True
+		while more:
+			more = makeMaze(m, self.rng, self.parameters.bias_straight)
+			if more:
+				m.mark_zone(more.points, first_zone_id + len(mazes))
+				mazes.append(more)
+		m.maze_start_candidates = None
+		return mazes
+	
+	def open_doors(self, m, zones):
+		#Zones are tracked by index, so the merge order can't depend on object ids
+		potential_doors = dict()
+		for point in m.get_off_points():
+			if m.spot_empty(point):
+				continue
+			nzs = m.get_neighbouring_zones(point)
+			if len(nzs) == 2:
+				potential_doors[point] = nzs
+		working = set([0])
+		while len(working):
+			curr = working.pop()
+			zones[curr].merged = True
+			if ANIMATE:
+				for pt in zones[curr].points:
+					px,py = pt
+					m.grid[py][px] = "."
+			for pt in zones[curr].neighbours:
+				if pt in potential_doors:
+					oz = [z for z in potential_doors[pt] if z != curr][0]
+					if not zones[oz].merged and not(oz in working and self.rng.random() < self.parameters.door_threshold):
+						working.add(oz)
+						px,py = pt
+						m.grid[py][px] = "_"
+						if ANIMATE:
+							print(m)
+							delay_func()
+	
+	def collect_open_points(self, m):
+		open_points = set()
+		for y,row in enumerate(m.grid):
+			for x in range(len(row)):
+				if row[x] != "#":
+					open_points.add((x,y))
+					row[x] = " "
+		return open_points
+	
+	def roughen(self, m, open_points):
 		for point in open_points:
-			ns = [av(point, dir) for dir in directions if not m.spot_empty(av(point,dir))]
-			if len(ns) >= 3:
-				x,y=point
-				m.grid[y][x] = "#"
-				dead_ends.add((x,y))
-				if ANIMATE:
-					print(m)
-					delay_func()
-	if ANIMATE:
-		gap_func()
-	for point in open_points:
-		for dir in directions:
-			if not m.spot_empty(av(point, dir)):
-				if random.random() < ROUGH_THRES:
-					m.clear(av(point,dir))
-					if ANIMATE:
-						print(m)
-						delay_func()
-			
-	#SET RESOURCES
-	clusters = []
-	for rm in rooms:
-		available_points = rm.get_non_boundary_points()
-		if len(available_points) < 4:
-			continue
-		else:
-			cluster = []
-			cluster_size = random.randint(4, min(8, len(available_points)))
-			cluster_points = []
-			cluster_points.append(random.choice(available_points))
-			
-			while len(cluster_points) < cluster_size:
-				neighbours = set([av(pt, dir) for pt in cluster_points for dir in directions if av(pt, dir) not in cluster_points and av(pt, dir) in available_points])
-				cluster_points.append(random.choice(list(neighbours)))
+			for dir in directions:
+				if not m.spot_empty(av(point, dir)):
+					if self.rng.random() < self.parameters.roughness_threshold:
+						m.clear(av(point,dir))
+						if ANIMATE:
+							print(m)
+							delay_func()
 	
-			for pt in cluster_points:
-				x,y = pt
-				cluster.append((pt, random.randint(20, 99)))
-			clusters.append(cluster)
-	m.clusters = clusters
+	def place_resources(self, m, rooms):
+		rng = self.rng
+		clusters = []
+		for rm in rooms:
+			available_points = rm.get_non_boundary_points()
+			if len(available_points) < 4:
+				continue
+			else:
+				cluster = []
+				cluster_size = rng.randint(4, min(8, len(available_points)))
+				cluster_points = []
+				cluster_points.append(rng.choice(available_points))
+				
+				while len(cluster_points) < cluster_size:
+					neighbours = set([av(pt, dir) for pt in cluster_points for dir in directions if av(pt, dir) not in cluster_points and av(pt, dir) in available_points])
+					cluster_points.append(rng.choice(list(neighbours)))
+		
+				for pt in cluster_points:
+					cluster.append((pt, rng.randint(20, 99)))
+				clusters.append(cluster)
+		return clusters
 	
-	#PICK PLAYER STARTING LOCATION
-	starting_cluster = random.choice(m.clusters)
-	starting_cluster_points = [r[0] for r in starting_cluster]
-	neighbours = set([av(pt, dir) for pt in starting_cluster_points for dir in directions if av(pt, dir) not in starting_cluster_points])
-	m.start_location = random.choice(list(neighbours))
-	if ANIMATE:
-		print()
-		print(m)
-	return m
-
-def get_grid(xm, ym):
-	grid = Grid(xm , ym)
+	def pick_start_location(self, m):
+		starting_cluster = self.rng.choice(m.clusters)
+		starting_cluster_points = [r[0] for r in starting_cluster]
+		neighbours = set([av(pt, dir) for pt in starting_cluster_points for dir in directions if av(pt, dir) not in starting_cluster_points])
+		return self.rng.choice(list(neighbours))
+
+def getMap(wdth, ht):
+	#Unseeded generation from the global random module
+	return MapGenerator(parameters = set_constants(), rng = random).generate(wdth, ht)
+
+def _generate_map_job(job):
+	seed, wdth, ht, parameters = job
+	return MapGenerator(seed, parameters).generate(wdth, ht)
+
+def generate_maps(seeds, wdth, ht, parameters = None, processes = None):
+	#Generates one map per seed across a pool of processes, returned in seed order
+	jobs = [(seed, wdth, ht, parameters) for seed in seeds]
+	with ProcessPoolExecutor(max_workers = processes) as executor:
+		return list(executor.map(_generate_map_job, jobs))
+
+def get_grid(xm, ym, grid_class = Grid, seed = None, parameters = None):
+	if getattr(grid_class, "generates_lazily", False):
+		#Grids that generate their map as it is looked at, see chunked_grid
+		return grid_class.create(xm, ym, seed, parameters)
+	if seed is None and parameters is None:
+		mp = getMap(xm // 2, ym // 2)
+	else:
+		mp = MapGenerator(seed, parameters).generate(xm // 2, ym // 2)
+	return build_grid(mp, xm, ym, grid_class)
+
+def build_grid(mp, xm, ym, grid_class = Grid):
+	grid = grid_class(xm , ym)
 	
-	mp = getMap(xm // 2, ym // 2)
+	#A new grid has no history to record, so tiles go straight into storage
 	for y in range(len(mp.grid)):
 		for x in range(len(mp.grid[y])):
 			if mp.grid[y][x] == "#":
-				grid.add_tile(Rock((x,y)), (x,y))
+				grid._set_tile((x,y), ROCK_TILE)
 	
 	for cluster in mp.clusters:
 		rc = ResourceCluster()
@@ -596,17 +962,15 @@ def get_grid(xm, ym):
 			pt, amount = rec
 			x,y = pt
 			resource = Resource(pt, amount, rc)
-			rc.resources.append(resource)
-			grid.add_tile(resource, (x,y))
-		grid.resource_clusters.append(rc)
+			rc.add_resource(resource)
+			grid._set_tile((x,y), resource)
 
-	start_neighbours = grid.get_neighbouring_objects(mp.start_location)
-	start_resource = next(t for t in start_neighbours if t.type == "Resource")
+	start_resource = grid.neighbouring_resource(mp.start_location)
 	starting_cell = ResourceCell(mp.start_location, start_resource.cluster)
-	grid.player_cells.append(starting_cell)
-	grid.add_tile(starting_cell, mp.start_location)
+	grid._set_tile(mp.start_location, starting_cell)
 	#TODO remove
 	grid.start_location = mp.start_location
+	grid.seed = mp.seed
 	return grid
 
 if __name__=="__main__":
@@ -619,7 +983,8 @@ if __name__=="__main__":
 	r1 = Resource(p1, 50, rc)
 	r2 = Resource(p2, 35, rc)
 	r3 = Resource(p3, 6, rc)
-	rc.resources = [r1, r2, r3]
+	for r in [r1, r2, r3]:
+		rc.add_resource(r)
 	print(rc.get_total_amount())
 	print([r.amount for r in rc.resources])
 	print(rc.remove_amount(10))
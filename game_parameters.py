@@ -1,12 +1,71 @@
 FPS = 10
+#Simulation ticks per second of game time, independent of how often the screen is drawn
+TICK_RATE = 10
 
 RESOURCE_CELL_RESOURCE_COST = 150
 
 OUTPOST_CREATION_RESOURCE_COST = 10
 OUTPOST_MAX_HEALTH = 10
 OUTPOST_MONEY_GAIN_INTERVAL = 3
-OUTPOST_MONEY_GAIN_ENERGY_COST = OUTPOST_MONEY_GAIN_INTERVAL * FPS
+OUTPOST_MONEY_GAIN_ENERGY_COST = OUTPOST_MONEY_GAIN_INTERVAL * TICK_RATE
 OUTPOST_MONEY_GAIN_AMOUNT = 1
 OUTPOST_REQUIRED_SUPPORT = 2
 OUTPOST_WITHER_INTERVAL = 4
-OUTPOST_WITHER_ENERGY_COST = OUTPOST_WITHER_INTERVAL * FPS
\ No newline at end of file
+OUTPOST_WITHER_ENERGY_COST = OUTPOST_WITHER_INTERVAL * TICK_RATE
+
+#The game rules above as one object, so several configurations can be played side by side.
+#Games take a GameParameters, the module constants are the defaults.
+PARAMETER_NAMES = [
+	"tick_rate",
+	"resource_cell_resource_cost",
+	"outpost_creation_resource_cost",
+	"outpost_max_health",
+	"outpost_money_gain_interval",
+	"outpost_money_gain_amount",
+	"outpost_required_support",
+	"outpost_wither_interval",
+]
+
+def _whole_number(name, value):
+	#Every rule counts ticks, money or tiles. A float that is a whole number is taken as that int.
+	if isinstance(value, float) and value.is_integer():
+		return int(value)
+	if isinstance(value, bool) or not isinstance(value, int):
+		raise ValueError("Game parameter {} must be a whole number, not {!r}".format(name, value))
+	return value
+
+class GameParameters(object):
+	def __init__(self, tick_rate = TICK_RATE, resource_cell_resource_cost = RESOURCE_CELL_RESOURCE_COST,
+			outpost_creation_resource_cost = OUTPOST_CREATION_RESOURCE_COST, outpost_max_health = OUTPOST_MAX_HEALTH,
+			outpost_money_gain_interval = OUTPOST_MONEY_GAIN_INTERVAL, outpost_money_gain_amount = OUTPOST_MONEY_GAIN_AMOUNT,
+			outpost_required_support = OUTPOST_REQUIRED_SUPPORT, outpost_wither_interval = OUTPOST_WITHER_INTERVAL):
+		self.tick_rate = tick_rate
+		self.resource_cell_resource_cost = resource_cell_resource_cost
+		self.outpost_creation_resource_cost = outpost_creation_resource_cost
+		self.outpost_max_health = outpost_max_health
+		self.outpost_money_gain_interval = outpost_money_gain_interval
+		self.outpost_money_gain_amount = outpost_money_gain_amount
+		self.outpost_required_support = outpost_required_support
+		self.outpost_wither_interval = outpost_wither_interval
+		for name in PARAMETER_NAMES:
+			setattr(self, name, _whole_number(name, getattr(self, name)))
+	@property
+	def outpost_money_gain_energy_cost(self):
+		return self.outpost_money_gain_interval * self.tick_rate
+	@property
+	def outpost_wither_energy_cost(self):
+		return self.outpost_wither_interval * self.tick_rate
+	def as_dict(self):
+		return {name: getattr(self, name) for name in PARAMETER_NAMES}
+	@classmethod
+	def from_dict(cls, values):
+		unknown = set(values) - set(PARAMETER_NAMES)
+		if unknown:
+			raise ValueError("Unknown game parameters: {}".format(", ".join(sorted(unknown))))
+		return cls(**values)
+	def replace(self, **changes):
+		values = self.as_dict()
+		values.update(changes)
+		return self.from_dict(values)
+
+DEFAULT_PARAMETERS = GameParameters()
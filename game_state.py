@@ -1,8 +1,9 @@
 import pathfinding
-import input_retrieval
+import input_constants
 import game_map
+import instrumentation
 from state_constants import *
-from game_parameters import *
+import game_parameters
 
 def mve(p1, p2):
 	x1,y1 = p1
@@ -11,9 +12,11 @@ def mve(p1, p2):
 
 
 class GameState(object):
-	def __init__(self, init_cursor, game_map):
+	def __init__(self, init_cursor, game_map, parameters = game_parameters.DEFAULT_PARAMETERS):
 		self.cursor = init_cursor
 		self.game_map = game_map
+		#game_parameters.GameParameters the game is played under
+		self.parameters = parameters
 		self.state_type = STANDARD
 		self.last_op = None
 		self.action_desc = ""
@@ -27,29 +30,93 @@ class GameState(object):
 		self.selected = None
 		#RESOURCE_CELL_SELECTED_ROUTE_CREATION fields
 		self.route_attempts = []
+		#Search tree from the selected cell, reused while the cursor moves
+		self.route_search = None
+		self.path_cache = pathfinding.PathCache(game_map)
+		#When set, route previews that miss the path cache are left as a (start, goal, grid version)
+		#request in pending_route for a planner to search off the main thread, see resolve_route
+		self.defer_route_search = False
+		self.pending_route = None
 	def updateCursor(self, dr):
 		old = self.cursor
 		result = mve(self.cursor, dr)
 		if self.game_map.in_grid(result):
 			self.cursor = result
 		return old, self.cursor
+	def _withdraw(self, cluster, amount):
+		amounts = [resource.amount for resource in cluster.resources]
+		if not cluster.remove_amount(amount):
+			return False
+		#Resource amounts are shown on the map, so any resource in the cluster may need a redraw
+		for resource, old_amount in zip(cluster.resources, amounts):
+			self.game_map.mark_dirty(resource.position)
+			if resource.amount != old_amount:
+				self.game_map.record_entity_change(resource.position)
+		return True
 	def _game_tick(self):
 		self._process_incomes()
 	def _process_incomes(self):
-		for outpost in self.game_map.outposts[:]:
-			outpost.update_self(len([obj for obj in self.game_map.get_neighbouring_objects(outpost.position) if obj.supports_outpost()]))
-			if outpost.energy >= OUTPOST_MONEY_GAIN_ENERGY_COST:
-				outpost.energy -= OUTPOST_MONEY_GAIN_ENERGY_COST
-				self.money += OUTPOST_MONEY_GAIN_AMOUNT
-			if outpost.can_remove:
-				self.game_map.outposts.remove(outpost)
+		if not self.game_map.outposts:
+			return
+		income_count, health_changed, dead_outposts = self.game_map.outposts.update(self.game_map, self.parameters)
+		self.money += income_count * self.parameters.outpost_money_gain_amount
+		for outpost in health_changed:
+			self.game_map.mark_dirty(outpost.position)
+		if dead_outposts:
+			#In bulk first, the registry leaves outposts already out of the store alone
+			self.game_map.outposts.remove_many(dead_outposts)
+			for outpost in dead_outposts:
 				self.game_map.remove_tile(outpost)
+	def _search_route(self, start, goal):
+		route = self.path_cache.lookup(start, goal)
+		if route is None:
+			if self.route_search is None or not self.route_search.is_current(self.game_map, start):
+				self.route_search = pathfinding.RouteSearch(self.game_map, start)
+			route = self.route_search.search(goal)
+			self.path_cache.store(start, goal, *route)
+		return route
+	def _show_route(self, route):
+		attempted_path_from_start, pathfinding_cost = route
+		if attempted_path_from_start:
+			path_from_start_tiles = []
+			for pt in attempted_path_from_start:
+				if not self.game_map.get_tile(pt):
+					path_from_start_tiles.append(game_map.RouteAttemptTile(pt))
+			attempted_start_route = game_map.RouteAttempt(path_from_start_tiles)
+			self.route_attempts.append(attempted_start_route)
+			self.action_desc = "About to create {0:0} route tiles, with cost {1:0} out of available {2:0}. PF Cost {3:0}".format(len(path_from_start_tiles), self.parameters.outpost_creation_resource_cost * len(path_from_start_tiles), self.selected.cluster.get_total_amount(), pathfinding_cost)
+			#print(attempted_path_from_start)
+	def resolve_route(self, request, route):
+		#Planner result for a pending request. Only shown if it is still wanted and the grid has not changed since,
+		#otherwise the request is renewed against the current grid. Returns whether the request was settled.
+		if request is not self.pending_route:
+			return True
+		start, goal, version = request
+		if version != self.game_map.version:
+			self.pending_route = (start, goal, self.game_map.version)
+			return False
+		self.pending_route = None
+		self.action_desc = ""
+		self.path_cache.store(start, goal, *route)
+		self._show_route(route)
+		return True
+	def resolve_pending_route(self):
+		#Search for a pending request right here
+		if self.pending_route is not None:
+			start, goal, version = self.pending_route
+			self.pending_route = None
+			self.action_desc = ""
+			with instrumentation.profiler.phase("pathfinding"):
+				self._show_route(self._search_route(start, goal))
 	def update(self, op):
-		if op != input_retrieval.NOP:
+		self.handle_op(op)
+		self.tick()
+	def handle_op(self, op):
+		if op != input_constants.NOP:
 			self.last_op = op
 		
 		if self.state_type in CURSOR_MOVE_STATES:
-			if op in input_retrieval.CARDDRS:
+			if op in input_constants.CARDDRS:
 			#Actual updates
 				self.updateCursor(op)
 
@@ -62,14 +129,25 @@ class GameState(object):
 			RESOURCE_CELL_SELECTED_OUTPOST_CREATION: _update_resource_cell_selected_outpost_creation,
 		}
 		dispatch_dict.get(self.state_type)(self, op)
-		
+	def tick(self):
 		if self.state_type in GAME_TICK_STATES:
 			self._game_tick()
+	def fast_forward(self, ticks):
+		#Same as ticks calls to tick, but idle ticks are skipped in bulk where the outposts allow it
+		if self.state_type not in GAME_TICK_STATES:
+			return
+		while ticks > 0:
+			skipped, income_count = self.game_map.outposts.skip_idle_ticks(ticks)
+			self.money += income_count * self.parameters.outpost_money_gain_amount
+			ticks -= skipped
+			if ticks > 0:
+				self._game_tick()
+				ticks -= 1
 
 
 ## HERE FOLLOWS GARBAGE PRIVATE METHODS FOR EACH STATE
 def _update_standard(self, op):
-	if op == input_retrieval.SELECT:
+	if op == input_constants.SELECT:
 		cursor_tile = self.game_map.get_tile(self.cursor)
 		if cursor_tile:
 			attempt_select_result = self.game_map.get_tile(self.cursor).attempt_select()
@@ -77,78 +155,83 @@ def _update_standard(self, op):
 				self.selected = self.game_map.get_tile(self.cursor)
 				self.state_type = attempt_select_result
 				return
-	elif op in input_retrieval.CARDDRS:
-		if any([obj.type == "Resource" for obj in self.game_map.get_neighbouring_objects(self.cursor)]
-				) and not self.game_map.get_tile(self.cursor):
-			self.neighbouring_resource = next(t for t in self.game_map.get_neighbouring_objects(self.cursor) if t.type == "Resource")
+	elif op in input_constants.CARDDRS:
+		neighbouring_resource = self.game_map.neighbouring_resource(self.cursor)
+		if neighbouring_resource is not None and not self.game_map.get_tile(self.cursor):
+			self.neighbouring_resource = neighbouring_resource
 			self.state_type = STANDARD_CONSTRUCTION_AVAILABLE
 def _update_standard_construction_available(self, op):
 	_update_standard(self, op)
 	
-	if op == input_retrieval.OPTION_1:
-		if self.neighbouring_resource.cluster.remove_amount(RESOURCE_CELL_RESOURCE_COST):
+	#The cursor may still be on the cell just built
+	if op == input_constants.OPTION_1 and not self.game_map.get_tile(self.cursor):
+		if self._withdraw(self.neighbouring_resource.cluster, self.parameters.resource_cell_resource_cost):
 			new_rc = game_map.ResourceCell(self.cursor, self.neighbouring_resource.cluster)
-			self.game_map.player_cells.append(new_rc)
 			self.game_map.add_tile(new_rc, self.cursor)
-	elif op in input_retrieval.CARDDRS:
-		if all([obj.type != "Resource" for obj in self.game_map.get_neighbouring_objects(self.cursor)]
-				) or self.game_map.get_tile(self.cursor):
+	elif op in input_constants.CARDDRS:
+		if self.game_map.neighbouring_resource(self.cursor) is None or self.game_map.get_tile(self.cursor):
 			self.neighbouring_resource = None
 			self.state_type = STANDARD
 
 def _update_resource_cell_selected(self, op):
-	if op == input_retrieval.CANCEL:
+	if op == input_constants.CANCEL:
 		self.selected = None
 		self.state_type = STANDARD
-	if op == input_retrieval.OPTION_1:
+	if op == input_constants.OPTION_1:
 		self.state_type = RESOURCE_CELL_SELECTED_ROUTE_CREATION
-	elif op == input_retrieval.OPTION_2:
+	elif op == input_constants.OPTION_2:
 		self.state_type = RESOURCE_CELL_SELECTED_OUTPOST_CREATION
 def _update_resource_cell_selected_route_creation(self, op):
-	if op == input_retrieval.CANCEL:
+	if op == input_constants.CANCEL:
 		self.route_attempts.clear()
+		self.route_search = None
+		self.pending_route = None
 		self.selected = None
 		self.action_desc = ""
 		self.state_type = STANDARD
 	#with resource cell selected, still only recalculate on cursor update
-	if op in input_retrieval.CARDDRS:
+	if op in input_constants.CARDDRS:
 		#Always clear attempts?
 		self.route_attempts.clear()
 		self.action_desc = ""
 		
-		attempted_path_from_start, pathfinding_cost = pathfinding.a_star_search(self.game_map, self.selected.position, self.cursor)
-		if attempted_path_from_start:
-			path_from_start_tiles = []
-			for pt in attempted_path_from_start:
-				if not self.game_map.get_tile(pt):
-					path_from_start_tiles.append(game_map.RouteAttemptTile(pt))
-			attempted_start_route = game_map.RouteAttempt(path_from_start_tiles)
-			self.route_attempts.append(attempted_start_route)
-			self.action_desc = "About to create {0:0} route tiles, with cost {1:0} out of available {2:0}. PF Cost {3:0}".format(len(path_from_start_tiles), OUTPOST_CREATION_RESOURCE_COST * len(path_from_start_tiles), self.selected.cluster.get_total_amount(), pathfinding_cost)
-			#print(attempted_path_from_start)
-	if op == input_retrieval.SELECT:
+		start = self.selected.position
+		self.pending_route = None
+		if self.defer_route_search:
+			route = self.path_cache.lookup(start, self.cursor)
+			if route is None:
+				self.pending_route = (start, self.cursor, self.game_map.version)
+				self.action_desc = "Searching for a route..."
+			else:
+				self._show_route(route)
+		else:
+			with instrumentation.profiler.phase("pathfinding"):
+				self._show_route(self._search_route(start, self.cursor))
+	if op == input_constants.SELECT:
+		#Confirm what the preview would have shown, even if the planner has not got to it yet
+		self.resolve_pending_route()
 		#Attempt route creation
 		if len(self.route_attempts):
 			ra = self.route_attempts[0]
-			route_creation_cost = len(ra.attempt_tiles) * OUTPOST_CREATION_RESOURCE_COST
-			if self.selected.cluster.remove_amount(route_creation_cost):
+			route_creation_cost = len(ra.attempt_tiles) * self.parameters.outpost_creation_resource_cost
+			if self._withdraw(self.selected.cluster, route_creation_cost):
 				for tile in ra.attempt_tiles:
-					outpost = game_map.Outpost(tile.position)
-					self.game_map.outposts.append(outpost)
+					outpost = game_map.Outpost(tile.position, self.parameters)
 					self.game_map.add_tile(outpost, outpost.position)
 			self.route_attempts.clear()
+			self.route_search = None
 			self.selected = None
 			self.action_desc = ""
 			self.state_type = STANDARD
 			
 def _update_resource_cell_selected_outpost_creation(self, op):
-	if op == input_retrieval.CANCEL:
+	if op == input_constants.CANCEL:
 		self.route_attempts.clear()
 		self.selected = None
 		self.action_desc = ""
 		self.state_type = STANDARD
 	#with resource cell selected, still only recalculate on cursor update
-	if op in input_retrieval.CARDDRS:
+	if op in input_constants.CARDDRS:
 		#Always clear attempts?
 		self.route_attempts.clear()
 		self.action_desc = ""
@@ -160,17 +243,16 @@ def _update_resource_cell_selected_outpost_creation(self, op):
 			self.route_attempts.append(ra)
 			
 			self.action_desc = "Will create outpost, with cost {} out of available {}.".format(
-			OUTPOST_CREATION_RESOURCE_COST , self.selected.cluster.get_total_amount())
+			self.parameters.outpost_creation_resource_cost , self.selected.cluster.get_total_amount())
 			#print(attempted_path_from_start)
-	if op == input_retrieval.SELECT:
+	if op == input_constants.SELECT:
 		#Attempt route creation
 		if len(self.route_attempts):
 			ra = self.route_attempts[0]
-			route_creation_cost = len(ra.attempt_tiles) * OUTPOST_CREATION_RESOURCE_COST
-			if self.selected.cluster.remove_amount(route_creation_cost):
+			route_creation_cost = len(ra.attempt_tiles) * self.parameters.outpost_creation_resource_cost
+			if self._withdraw(self.selected.cluster, route_creation_cost):
 				for tile in ra.attempt_tiles:
-					outpost = game_map.Outpost(tile.position)
-					self.game_map.outposts.append(outpost)
+					outpost = game_map.Outpost(tile.position, self.parameters)
 					self.game_map.add_tile(outpost, outpost.position)
 			self.route_attempts.clear()
 			#self.selected = None
@@ -0,0 +1,13 @@
+#enum constants
+N = (0, -1)
+S = (0, 1)
+E = (1, 0)
+W = (-1, 0)
+NOP = (0, 0)
+QUIT = "QUIT"
+SELECT = "ENTER"
+CANCEL = "ESCAPE"
+OPTION_1 = "1"
+OPTION_2 = "2"
+
+CARDDRS = [N, E, S, W]
@@ -1,16 +1,23 @@
-import msvcrt
-
-#enum constants
-N = (0, -1)
-S = (0, 1)
-E = (1, 0)
-W = (-1, 0)
-NOP = (0, 0)
-QUIT = "QUIT"
-SELECT = "ENTER"
-CANCEL = "ESCAPE"
-OPTION_1 = "1"
-OPTION_2 = "2"
+import sys
+import time
+import curses
+import selectors
+
+try:
+	import msvcrt
+except ImportError:
+	msvcrt = None
+
+from input_constants import *
+
+#Two input backends with the same interface:
+#get_input_ops() returns every op queued since the last call, wait(timeout) returns as soon as a key is pressed.
+#make_input picks msvcrt on Windows and curses with a selector on stdin elsewhere.
+
+#How often the msvcrt backend checks for a key while waiting
+POLL_INTERVAL = .005
+#Curses waits this long after an escape to tell it apart from an arrow key sequence
+ESCAPE_DELAY_MS = 25
 
 #motion
 ARROWOP = {b'H' : N,#"N",
@@ -21,8 +28,6 @@ ARROWOP = {b'H' : N,#"N",
 	b'I' : N,#"N",
 	}
 
-CARDDRS = [N, E, S, W]
-
 ASCII_OP_DICT = {
 	"1": OPTION_1,
 	"2": OPTION_2,
@@ -61,3 +66,61 @@ def get_input_op():
 	else:
 		op = NOP
 	return op 
+
+class MsvcrtInput(object):
+	def get_input_ops(self):
+		ops = []
+		while msvcrt.kbhit():
+			ops.append(get_input_op())
+		return ops
+	def wait(self, timeout):
+		#The console can't be waited on, so poll it in short slices
+		end = time.time() + timeout
+		while not msvcrt.kbhit():
+			remaining = end - time.time()
+			if remaining <= 0:
+				return False
+			time.sleep(min(remaining, POLL_INTERVAL))
+		return True
+
+CURSES_KEY_OPS = {
+	curses.KEY_UP: N,
+	curses.KEY_DOWN: S,
+	curses.KEY_RIGHT: E,
+	curses.KEY_LEFT: W,
+	curses.KEY_NPAGE: S,
+	curses.KEY_PPAGE: N,
+	curses.KEY_ENTER: SELECT,
+	10: SELECT,
+	13: SELECT,
+	27: CANCEL,
+	ord("Q"): QUIT,
+	ord("X"): QUIT,
+}
+CURSES_KEY_OPS.update((ord(ch), op) for ch, op in ASCII_OP_DICT.items())
+
+class CursesInput(object):
+	def __init__(self, window):
+		self.window = window
+		window.nodelay(1)
+		window.keypad(1)
+		if hasattr(curses, "set_escdelay"):
+			curses.set_escdelay(ESCAPE_DELAY_MS)
+		self.selector = selectors.DefaultSelector()
+		self.selector.register(sys.stdin, selectors.EVENT_READ)
+	def get_input_ops(self):
+		ops = []
+		key = self.window.getch()
+		while key != -1:
+			ops.append(CURSES_KEY_OPS.get(key, NOP))
+			key = self.window.getch()
+		return ops
+	def wait(self, timeout):
+		return bool(self.selector.select(max(timeout, 0)))
+	def fileno(self):
+		return sys.stdin.fileno()
+
+def make_input(window):
+	if msvcrt is not None:
+		return MsvcrtInput()
+	return CursesInput(window)
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+#Per phase frame timers and hot path counters.
+#Code reports to the module level profiler, which does nothing until enable() swaps in a FrameProfiler.
+#Always look it up as instrumentation.profiler, never import the name, or enable() is not seen.
+
+DEFAULT_WINDOW = 600
+SUMMARY_PHASES = ["frame", "input", "update", "render"]
+SUMMARY_COUNTERS = ["expanded", "cells_drawn", "outposts_ticked"]
+
+def percentile(sorted_samples, p):
+	if not sorted_samples:
+		return 0
+	return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * p / 100))]
+
+class NullProfiler(object):
+	enabled = False
+	_null_phase = nullcontext()
+	def phase(self, name):
+		return self._null_phase
+	def count(self, name, amount = 1):
+		pass
+	def start_frame(self):
+		pass
+	def end_frame(self):
+		pass
+	def summary(self):
+		return ""
+
+class _Phase(object):
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+	def __enter__(self):
+		self.start = time.perf_counter()
+	def __exit__(self, *exc_info):
+		elapsed = time.perf_counter() - self.start
+		with self.profiler.lock:
+			times = self.profiler.frame_times
+			times[self.name] = times.get(self.name, 0) + elapsed
+
+class FrameProfiler(object):
+	#Phase times and counters are summed over a frame, end_frame moves them into rolling windows.
+	#Phases may nest, each one is timed inclusive of what runs inside it.
+	#The frame phase runs from start_frame to end_frame, so it leaves out the sleep between frames.
+	#The runtime's planner thread counts while the main thread ends frames, so the sums of the current frame are
+	#only touched under the lock. Work from another thread goes to whichever frame is current when it is reported.
+	enabled = True
+	def __init__(self, window = DEFAULT_WINDOW):
+		self.window = window
+		self.lock = threading.Lock()
+		self.frame_times = {}
+		self.frame_counts = {}
+		#name -> deque of the last window frames, times in seconds
+		self.times = {}
+		self.counts = {}
+		self.frames = 0
+		self.frame_start = time.perf_counter()
+	def phase(self, name):
+		return _Phase(self, name)
+	def count(self, name, amount = 1):
+		with self.lock:
+			self.frame_counts[name] = self.frame_counts.get(name, 0) + amount
+	def start_frame(self):
+		self.frame_start = time.perf_counter()
+	def end_frame(self):
+		#Only the main thread ends frames and reads the rolling windows
+		with self.lock:
+			frame_times, frame_counts = self.frame_times, self.frame_counts
+			self.frame_times = {}
+			self.frame_counts = {}
+		frame_times["frame"] = time.perf_counter() - self.frame_start
+		self._push(self.times, frame_times)
+		self._push(self.counts, frame_counts)
+		self.frames += 1
+	def _push(self, history, values):
+		#Every known name gets a sample each frame, zero when it did not come up
+		for name in values:
+			if name not in history:
+				history[name] = deque([0] * min(self.frames, self.window), maxlen = self.window)
+		for name, samples in history.items():
+			samples.append(values.get(name, 0))
+	def percentiles(self, name, ps = (50, 99)):
+		history = self.times if name in self.times else self.counts
+		samples = sorted(history.get(name, ()))
+		return [percentile(samples, p) for p in ps]
+	def summary(self):
+		#p50/p99 per phase in ms, then p50 per counter
+		parts = []
+		for name in SUMMARY_PHASES:
+			if name in self.times:
+				p50, p99 = self.percentiles(name)
+				parts.append("{} {:.1f}/{:.1f}".format(name, p50 * 1000, p99 * 1000))
+		for name in SUMMARY_COUNTERS:
+			if name in self.counts:
+				parts.append("{} {}".format(name, self.percentiles(name, (50,))[0]))
+		return " ".join(parts)
+	def dump(self, path):
+		#One row per frame in the window, phase times in ms, then counters
+		time_names = sorted(self.times)
+		count_names = sorted(self.counts)
+		rows = [",".join([name + "_ms" for name in time_names] + count_names)]
+		columns = [[t * 1000 for t in self.times[name]] for name in time_names] + [list(self.counts[name]) for name in count_names]
+		for row in zip(*columns):
+			rows.append(",".join("{:.3f}".format(v) if isinstance(v, float) else str(v) for v in row))
+		with open(path, "w") as f:
+			f.write("\n".join(rows) + "\n")
+
+profiler = NullProfiler()
+
+def enable(window = DEFAULT_WINDOW):
+	global profiler
+	profiler = FrameProfiler(window)
+	return profiler
+
+def disable():
+	global profiler
+	profiler = NullProfiler()
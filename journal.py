@@ -0,0 +1,158 @@
+import sys
+import time
+import zlib
+import struct
+import hashlib
+
+import array_grid
+import game_parameters
+import outpost_timers
+import simulation
+import snapshot
+from input_constants import *
+
+#Op journals: every op a game applied, by tick, so the game can be replayed headless.
+#Layout, little endian: header, state hash, then one entry per op, a varint tick delta and an op code.
+#NOP is never stored, ticks without entries just advance.
+
+MAGIC = b"PSJN"
+#2: the parameters checksum is taken over GameParameters instead of the module constants
+FORMAT_VERSION = 2
+HAS_HASH = 1
+
+#magic, format version, flags, seed, xm, ym, parameters checksum, end tick. Seeds are signed like in map files.
+HEADER = struct.Struct("<4sHHqIIIQ")
+HASH_SIZE = 16
+
+OP_CODES = {N: 1, E: 2, S: 3, W: 4, SELECT: 5, CANCEL: 6, OPTION_1: 7, OPTION_2: 8}
+OPS_BY_CODE = {code: op for op, code in OP_CODES.items()}
+
+def parameters_checksum(parameters = game_parameters.DEFAULT_PARAMETERS):
+	#Replays only mean something under the game parameters they were recorded with
+	values = sorted(parameters.as_dict().items())
+	return zlib.crc32(repr(values).encode("ascii"))
+
+def state_hash(gs):
+	return hashlib.blake2b(snapshot.encode_snapshot(gs), digest_size = HASH_SIZE).digest()
+
+class Journal(object):
+	def __init__(self, seed, xm, ym, checksum = None):
+		if seed is None:
+			raise ValueError("Only games on seeded maps can be journaled")
+		self.seed = seed
+		self.xm = xm
+		self.ym = ym
+		self.checksum = parameters_checksum() if checksum is None else checksum
+		#(tick, op) in the order they were applied
+		self.entries = []
+		self.end_tick = 0
+		self.final_hash = None
+	@classmethod
+	def for_game_state(cls, gs):
+		return cls(gs.game_map.seed, gs.game_map.xm, gs.game_map.ym, parameters_checksum(gs.parameters))
+	def record(self, tick, op):
+		if op != NOP:
+			self.entries.append((tick, op))
+	def finish(self, simulation):
+		#Call when the game ends, replays are checked against the state at this point
+		self.end_tick = simulation.tick_count
+		#Replays search routes on the spot, so a preview the planner has not got to yet is settled here as well
+		simulation.game_state.resolve_pending_route()
+		self.final_hash = state_hash(simulation.game_state)
+	def ops_by_tick(self):
+		#One list of ops per tick up to end_tick, and a last one for ops applied after the final tick
+		tick_count = self.end_tick
+		if self.entries:
+			tick_count = max(tick_count, self.entries[-1][0])
+		ticks = [[] for _ in range(tick_count + 1)]
+		for tick, op in self.entries:
+			ticks[tick].append(op)
+		return ticks
+
+	def encode(self):
+		flags = HAS_HASH if self.final_hash is not None else 0
+		out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, flags, self.seed, self.xm, self.ym, self.checksum, self.end_tick))
+		out += self.final_hash or bytes(HASH_SIZE)
+		last_tick = 0
+		for tick, op in self.entries:
+			delta = tick - last_tick
+			last_tick = tick
+			while delta >= 0x80:
+				out.append(delta & 0x7f | 0x80)
+				delta >>= 7
+			out.append(delta)
+			out.append(OP_CODES[op])
+		return bytes(out)
+	@classmethod
+	def decode(cls, data):
+		magic, version, flags, seed, xm, ym, checksum, end_tick = HEADER.unpack_from(data)
+		if magic != MAGIC:
+			raise ValueError("Not a journal")
+		if version == 1:
+			raise ValueError("Journal was recorded before game rules were checksummed as GameParameters and can not be replayed")
+		if version != FORMAT_VERSION:
+			raise ValueError("Unsupported journal format version {0}".format(version))
+		journal = cls(seed, xm, ym, checksum)
+		journal.end_tick = end_tick
+		offset = HEADER.size
+		if flags & HAS_HASH:
+			journal.final_hash = bytes(data[offset:offset + HASH_SIZE])
+		offset += HASH_SIZE
+		tick = 0
+		while offset < len(data):
+			delta = 0
+			shift = 0
+			while data[offset] & 0x80:
+				delta |= (data[offset] & 0x7f) << shift
+				shift += 7
+				offset += 1
+			delta |= data[offset] << shift
+			tick += delta
+			journal.entries.append((tick, OPS_BY_CODE[data[offset + 1]]))
+			offset += 2
+		return journal
+	def save(self, path):
+		with open(path, "wb") as f:
+			f.write(self.encode())
+	@classmethod
+	def load(cls, path):
+		with open(path, "rb") as f:
+			return cls.decode(f.read())
+
+def replay(journal, grid_class = array_grid.ArrayGrid, event_timers = True, rules = game_parameters.DEFAULT_PARAMETERS):
+	#Replays the journal headless as fast as possible, runs of ticks without ops are fast forwarded.
+	#rules must be the game parameters it was recorded under.
+	#Returns the final game state and whether it matches the recorded hash, None when there is none.
+	if journal.checksum != parameters_checksum(rules):
+		raise ValueError("Journal was recorded with different game parameters")
+	gs = simulation.create_game_state(journal.xm, journal.ym, grid_class, seed = journal.seed, rules = rules)
+	if event_timers:
+		outpost_timers.enable(gs.game_map, gs.parameters)
+	sim = simulation.Simulation(gs)
+	ticks = journal.ops_by_tick()
+	idle = 0
+	for ops in ticks[:-1]:
+		if ops:
+			sim.fast_forward(idle)
+			idle = 0
+			sim.step(ops)
+		else:
+			idle += 1
+	sim.fast_forward(idle)
+	sim.apply_ops(ticks[-1])
+	if journal.final_hash is None:
+		return gs, None
+	return gs, state_hash(gs) == journal.final_hash
+
+if __name__=="__main__":
+	#usage: python journal.py journal_file
+	journal = Journal.load(sys.argv[1])
+	start = time.perf_counter()
+	gs, matches = replay(journal)
+	elapsed = time.perf_counter() - start
+	print("{} ticks, {} ops in {:.3f}s".format(journal.end_tick, len(journal.entries), elapsed))
+	if matches is None:
+		print("No final state recorded")
+	else:
+		print("Final state matches" if matches else "Final state DIFFERS")
+		sys.exit(0 if matches else 1)
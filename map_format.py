@@ -0,0 +1,113 @@
+import sys
+import mmap
+import struct
+
+import numpy as np
+
+import array_grid
+import game_map
+from array_grid import EMPTY, ROCK, RESOURCE, RESOURCE_CELL
+
+#Compact binary map files, loaded through mmap straight into grid arrays.
+#Layout, little endian: header, one kind byte per point in [y, x] order, then the resource table.
+#Only the map as generated is stored: rocks, resources with their clusters and the starting cell.
+
+MAGIC = b"PSMP"
+FORMAT_VERSION = 1
+HAS_SEED = 1
+
+#magic, version, flags, xm, ym, start x, start y, start cluster, resource count, cluster count, seed.
+#Seeds are signed, random.seed takes negative ones as well. Files from before read the same up to 2**63.
+HEADER = struct.Struct("<4sHHIIIIIIIq")
+RESOURCE_DTYPE = np.dtype([("x", "<u4"), ("y", "<u4"), ("cluster", "<u4"), ("amount", "<u2")])
+
+STORED_KINDS = np.array([EMPTY, ROCK, RESOURCE], dtype = np.uint8)
+
+def grid_kinds(grid):
+	#Kinds array of any grid, player built tiles are left out
+	if isinstance(grid, array_grid.ArrayGrid):
+		kinds = grid.kinds.copy()
+	else:
+		kinds = np.zeros((grid.ym + 1, grid.xm + 1), dtype = np.uint8)
+		for pt in grid.points():
+			tile = grid.get_tile(pt)
+			if tile is not None:
+				x,y = pt
+				kinds[y, x] = array_grid.KIND_BY_TYPE.get(tile.type, array_grid.OTHER)
+	kinds[~np.isin(kinds, STORED_KINDS)] = EMPTY
+	return kinds
+
+def save_map(grid, path):
+	start_cell = grid.player_cells[0]
+	kinds = grid_kinds(grid)
+	start_x, start_y = start_cell.position
+	kinds[start_y, start_x] = RESOURCE_CELL
+
+	resources = np.zeros(sum(len(rc.resources) for rc in grid.resource_clusters), dtype = RESOURCE_DTYPE)
+	i = 0
+	for cluster_index, rc in enumerate(grid.resource_clusters):
+		for resource in rc.resources:
+			resources[i] = resource.position + (cluster_index, resource.amount)
+			i += 1
+
+	seed = getattr(grid, "seed", None)
+	header = HEADER.pack(MAGIC, FORMAT_VERSION, HAS_SEED if seed is not None else 0,
+		grid.xm, grid.ym, start_x, start_y, grid.resource_clusters.index(start_cell.cluster),
+		len(resources), len(grid.resource_clusters), seed or 0)
+	with open(path, "wb") as f:
+		f.write(header)
+		f.write(kinds.tobytes())
+		f.write(resources.tobytes())
+
+def unpack_header(data, path):
+	fields = HEADER.unpack_from(data)
+	magic, version = fields[:2]
+	if magic != MAGIC:
+		raise ValueError("{0} is not a map file".format(path))
+	if version != FORMAT_VERSION:
+		raise ValueError("Unsupported map format version {0}".format(version))
+	return fields
+
+def read_seed(path):
+	#Seed the map was generated from, None if it was saved without one. Only reads the header.
+	with open(path, "rb") as f:
+		fields = unpack_header(f.read(HEADER.size), path)
+	flags, seed = fields[2], fields[-1]
+	return seed if flags & HAS_SEED else None
+
+def load_grid(path, grid_class = array_grid.ArrayGrid):
+	with open(path, "rb") as f:
+		#Copy on write, the file stays untouched when the game changes the grid
+		data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_COPY)
+	magic, version, flags, xm, ym, start_x, start_y, start_cluster, resource_count, cluster_count, seed = unpack_header(data, path)
+
+	shape = (ym + 1, xm + 1)
+	kinds = np.frombuffer(data, dtype = np.uint8, count = shape[0] * shape[1], offset = HEADER.size).reshape(shape)
+	resources = np.frombuffer(data, dtype = RESOURCE_DTYPE, count = resource_count, offset = HEADER.size + kinds.size)
+
+	grid = grid_class(xm, ym)
+	if isinstance(grid, array_grid.ArrayGrid):
+		grid._attach_kinds(kinds)
+	else:
+		for y, x in zip(*np.nonzero(kinds == ROCK)):
+			grid._set_tile((int(x), int(y)), game_map.ROCK_TILE)
+
+	clusters = [game_map.ResourceCluster() for _ in range(cluster_count)]
+	for x, y, cluster_index, amount in resources.tolist():
+		rc = clusters[cluster_index]
+		resource = game_map.Resource((x, y), amount, rc)
+		rc.add_resource(resource)
+		grid._set_tile((x, y), resource)
+
+	start_location = (start_x, start_y)
+	starting_cell = game_map.ResourceCell(start_location, clusters[start_cluster])
+	grid._set_tile(start_location, starting_cell)
+	grid.start_location = start_location
+	grid.seed = seed if flags & HAS_SEED else None
+	return grid
+
+if __name__=="__main__":
+	#usage: python map_format.py path xm ym [seed]
+	path, xm, ym = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+	seed = int(sys.argv[4]) if len(sys.argv) > 4 else None
+	save_map(game_map.get_grid(xm, ym, array_grid.ArrayGrid, seed = seed), path)
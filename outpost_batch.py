@@ -0,0 +1,49 @@
+import heapq
+
+import numpy as np
+
+#Batched replacement for calling Outpost.update_self on every outpost, one at a time, see OutpostStore.update
+
+def step_outposts(energy, health, withering, wither_energy, counts, parameters):
+	#Vectorized Outpost.update_self, returns new arrays and the dead mask
+	energy = energy + 1
+	now_withering = counts < parameters.outpost_required_support
+	#Recovering outposts start withering from scratch next time
+	wither_energy = np.where(withering & ~now_withering, 0, wither_energy)
+	wither_energy = wither_energy + now_withering
+	wither_cost = parameters.outpost_wither_energy_cost
+	lose_health = now_withering & (wither_energy >= wither_cost)
+	wither_energy = wither_energy - lose_health * wither_cost
+	health = health - lose_health
+	dead = health < 1
+	energy = np.where(dead, 0, energy)
+	return energy, health, now_withering, wither_energy, dead
+
+def apply_removal_order(grid, xs, ys, old, new, counts, dead, parameters):
+	#Outposts used to be removed as soon as they died, so later outposts in the same tick
+	#saw one supporting neighbour fewer. Replay that for the few outposts next to a death.
+	#Position -> index of the outpost there, sized by the outposts rather than the map
+	order = {pt: i for i, pt in enumerate(zip(xs.tolist(), ys.tolist()))}
+	def neighbour_indices(i):
+		x, y = int(xs[i]), int(ys[i])
+		for pt in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+			j = order.get(pt)
+			if j is not None and grid.in_grid(pt):
+				yield j
+
+	candidates = [int(i) for i in np.flatnonzero(dead)]
+	heapq.heapify(candidates)
+	seen = set(candidates)
+	while candidates:
+		i = heapq.heappop(candidates)
+		removed_before = sum(1 for j in neighbour_indices(i) if j < i and dead[j])
+		if removed_before:
+			counts[i] -= removed_before
+			result = step_outposts(*[column[i:i + 1] for column in old], counts[i:i + 1], parameters)
+			for column, value in zip(new + (dead,), result):
+				column[i] = value[0]
+		if dead[i]:
+			for j in neighbour_indices(i):
+				if j > i and j not in seen:
+					seen.add(j)
+					heapq.heappush(candidates, j)
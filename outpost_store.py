@@ -0,0 +1,169 @@
+import numpy as np
+
+import instrumentation
+import outpost_batch
+
+#Outpost state as numpy columns, one row per slot.
+#A slot is stable while its outpost lives and is reused after it dies. Iteration and ticks follow
+#the order outposts were added, like the list this replaces. Outpost objects are thin views on a slot.
+
+COLUMN_TYPES = {
+	"energy": np.int64,
+	"health": np.int64,
+	"withering": np.bool_,
+	"wither_energy": np.int64,
+	"supporting_neighbour_count": np.int64,
+	"can_remove": np.bool_,
+}
+
+class OutpostStore(object):
+	def __init__(self, capacity = 64):
+		self.capacity = 0
+		self.xs = np.zeros(0, dtype = np.int64)
+		self.ys = np.zeros(0, dtype = np.int64)
+		self.alive = np.zeros(0, dtype = np.bool_)
+		#Sequence number of the append, orders the live slots
+		self.order = np.zeros(0, dtype = np.int64)
+		self.columns = {name: np.zeros(0, dtype = dtype) for name, dtype in COLUMN_TYPES.items()}
+		self.views = []
+		self.free_slots = []
+		self.count = 0
+		self.next_order = 0
+		#Live slots in order, rebuilt lazily after appends
+		self._ordered = np.zeros(0, dtype = np.int64)
+		#outpost_timers.OutpostTimers when ticks are event scheduled
+		self.timers = None
+		self._grow(capacity)
+
+	def _grow(self, capacity):
+		def grown(array):
+			new_array = np.zeros(capacity, dtype = array.dtype)
+			new_array[:self.capacity] = array
+			return new_array
+		self.xs = grown(self.xs)
+		self.ys = grown(self.ys)
+		self.alive = grown(self.alive)
+		self.order = grown(self.order)
+		self.columns = {name: grown(column) for name, column in self.columns.items()}
+		self.views.extend([None] * (capacity - self.capacity))
+		self.capacity = capacity
+		if self.timers is not None:
+			self.timers._grow(capacity)
+
+	def append(self, outpost):
+		if self.free_slots:
+			slot = self.free_slots.pop()
+		else:
+			#No gaps, every slot below count is taken
+			slot = self.count
+			if slot >= self.capacity:
+				self._grow(self.capacity * 2)
+		x,y = outpost.position
+		self.xs[slot] = x
+		self.ys[slot] = y
+		self.alive[slot] = True
+		self.order[slot] = self.next_order
+		self.next_order += 1
+		for name, column in self.columns.items():
+			column[slot] = outpost.detached[name]
+		outpost.attach(self, slot)
+		self.views[slot] = outpost
+		self.count += 1
+		self._ordered = None
+		if self.timers is not None:
+			self.timers.added(slot)
+
+	def remove(self, outpost):
+		self.remove_many([outpost])
+
+	def remove_many(self, outposts):
+		#Bulk removal, each outpost keeps its last values after it leaves the store
+		slots = np.array([outpost.slot for outpost in outposts], dtype = np.int64)
+		if self.timers is not None:
+			self.timers.materialize(slots)
+			self.timers.removed(slots)
+		for outpost in outposts:
+			self.views[outpost.slot] = None
+			outpost.detach()
+		self.alive[slots] = False
+		self.free_slots.extend(slots.tolist())
+		self.count -= len(slots)
+		if self._ordered is not None:
+			self._ordered = self._ordered[self.alive[self._ordered]]
+
+	def ordered_slots(self):
+		if self._ordered is None:
+			slots = np.flatnonzero(self.alive)
+			self._ordered = slots[np.argsort(self.order[slots], kind = "stable")]
+		return self._ordered
+
+	def __len__(self):
+		return self.count
+	def __iter__(self):
+		#Over a copy, so outposts may be removed while iterating
+		views = self.views
+		return iter([views[slot] for slot in self.ordered_slots().tolist()])
+	def __getitem__(self, index):
+		slots = self.ordered_slots()[index]
+		if isinstance(index, slice):
+			return [self.views[slot] for slot in slots.tolist()]
+		return self.views[int(slots)]
+	def __contains__(self, outpost):
+		return outpost.store is self
+
+	def nearest_distance(self, point):
+		#Manhattan distance from point to the nearest outpost
+		if not self.count:
+			return float("inf")
+		x,y = point
+		alive = self.alive
+		return int((np.abs(self.xs[alive] - x) + np.abs(self.ys[alive] - y)).min())
+
+	def materialize(self):
+		#Brings every column up to date, they can lag behind under event timers
+		if self.timers is not None:
+			self.timers.materialize_all()
+
+	def skip_idle_ticks(self, ticks):
+		#Ticks that can be skipped in one go and the income over them, only ever any under event timers
+		if self.timers is None:
+			return 0, 0
+		return self.timers.skip_idle_ticks(ticks)
+
+	def update(self, grid, parameters):
+		#One tick for every outpost, the batched Outpost.update_self plus income.
+		#Returns the number of income payouts, the outposts whose health changed and the dead outposts.
+		#Dead outposts are marked can_remove but stay in the store for the caller to remove.
+		if self.timers is not None:
+			return self.timers.update(grid)
+		slots = self.ordered_slots()
+		instrumentation.profiler.count("outposts_ticked", len(slots))
+		columns = self.columns
+		xs = self.xs[slots]
+		ys = self.ys[slots]
+		energy = columns["energy"][slots]
+		health = columns["health"][slots]
+		withering = columns["withering"][slots]
+		wither_energy = columns["wither_energy"][slots]
+		counts = np.asarray(grid.supporting_neighbour_counts(xs, ys), dtype = np.int64)
+
+		new_energy, new_health, new_withering, new_wither_energy, dead = outpost_batch.step_outposts(energy, health, withering, wither_energy, counts, parameters)
+		if dead.any():
+			outpost_batch.apply_removal_order(grid, xs, ys,
+				(energy, health, withering, wither_energy),
+				(new_energy, new_health, new_withering, new_wither_energy),
+				counts, dead, parameters)
+
+		incomes = new_energy >= parameters.outpost_money_gain_energy_cost
+		new_energy -= incomes * parameters.outpost_money_gain_energy_cost
+
+		columns["energy"][slots] = new_energy
+		columns["health"][slots] = new_health
+		columns["withering"][slots] = new_withering
+		columns["wither_energy"][slots] = new_wither_energy
+		columns["supporting_neighbour_count"][slots] = counts
+		columns["can_remove"][slots] |= dead
+		views = self.views
+		health_changed = [views[slot] for slot in slots[new_health != health].tolist()]
+		dead_outposts = [views[slot] for slot in slots[dead].tolist()]
+		return int(incomes.sum()), health_changed, dead_outposts
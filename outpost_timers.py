@@ -0,0 +1,211 @@
+import heapq
+
+import numpy as np
+
+import game_parameters
+import instrumentation
+import outpost_batch
+
+#Event scheduled outpost ticks, an alternative to stepping every outpost on every tick.
+#Between neighbourhood changes an outpost only does two things: its energy counts up to the next income and,
+#while withering, its wither energy counts up to the next health loss. Both are worked out on demand:
+#- Income: an outpost pays on every tick that is its phase modulo the income energy cost, so the payout
+#  of a tick is a lookup in a count of outposts per phase, and a run of idle ticks is a sum over that table.
+#- Health loss: withering outposts push their next loss onto a timer heap.
+#An outpost is only stepped on the ticks it has an event, or after a tile next to it changed. Its columns in the
+#store hold its values as of the tick it was last stepped, and are brought up to date whenever they are read.
+#Results are the same as OutpostStore.update on every tick.
+
+class OutpostTimers(object):
+	def __init__(self, grid, parameters):
+		self.grid = grid
+		self.store = grid.outposts
+		self.parameters = parameters
+		self.income_cost = parameters.outpost_money_gain_energy_cost
+		#Game ticks processed since the timers were enabled
+		self.tick = 0
+		self.synced = np.zeros(0, dtype = np.int64)
+		self.phase = np.zeros(0, dtype = np.int64)
+		self.generation = np.zeros(0, dtype = np.int64)
+		self.phase_counts = np.zeros(self.income_cost, dtype = np.int64)
+		#(tick, generation, slot) of the next health loss of withering outposts, stale once the generation moved on
+		self.heap = []
+		#Slots to step next tick whatever their events
+		self.changed = set()
+		self._grow(self.store.capacity)
+		self.store.timers = self
+		#Every tile change from now on is logged, so the outposts next to it can be stepped
+		grid.change_log = []
+		slots = self.store.ordered_slots()
+		energy = self.store.columns["energy"][slots]
+		self.phase[slots] = -energy % self.income_cost
+		np.add.at(self.phase_counts, self.phase[slots], 1)
+		#Counts and withering may be anything in a loaded store, step everything once to settle them
+		self.changed.update(slots.tolist())
+
+	def _grow(self, capacity):
+		def grown(array):
+			new_array = np.zeros(capacity, dtype = array.dtype)
+			new_array[:len(array)] = array
+			return new_array
+		self.synced = grown(self.synced)
+		self.phase = grown(self.phase)
+		self.generation = grown(self.generation)
+
+	def disable(self):
+		self.materialize_all()
+		self.store.timers = None
+		self.grid.change_log = None
+
+	def added(self, slot):
+		#Energy is below the income cost after any tick, so the phase is fixed for life
+		self.synced[slot] = self.tick
+		self.phase[slot] = (self.tick - self.store.columns["energy"][slot]) % self.income_cost
+		self.phase_counts[self.phase[slot]] += 1
+		self.generation[slot] += 1
+		self.changed.add(slot)
+
+	def removed(self, slots):
+		np.subtract.at(self.phase_counts, self.phase[slots], 1)
+		self.generation[slots] += 1
+		self.changed.difference_update(slots.tolist())
+
+	def touched(self, slot):
+		#A column was written from outside, energy may have moved the phase
+		self.phase_counts[self.phase[slot]] -= 1
+		self.added(slot)
+
+	def materialize(self, slots):
+		#Brings the columns of the given slots up to the current tick
+		elapsed = self.tick - self.synced[slots]
+		if not elapsed.any():
+			return
+		columns = self.store.columns
+		columns["energy"][slots] = (columns["energy"][slots] + elapsed) % self.income_cost
+		#Health losses are events, so the wither energy of a withering outpost never reaches the cost in between
+		columns["wither_energy"][slots] += elapsed * columns["withering"][slots]
+		self.synced[slots] = self.tick
+
+	def materialize_all(self):
+		self.materialize(self.store.ordered_slots())
+
+	def _due_slots(self, tick):
+		due = []
+		heap = self.heap
+		generation = self.generation
+		while heap and heap[0][0] <= tick:
+			event_tick, event_generation, slot = heapq.heappop(heap)
+			if event_generation == generation[slot]:
+				due.append(slot)
+		return due
+
+	def _drain_change_log(self):
+		grid = self.grid
+		store = self.store
+		slots = set()
+		for x, y in grid.change_log:
+			for pt in ((x, y), (x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+				if grid.in_grid(pt):
+					tile = grid.get_tile(pt)
+					if tile is not None and tile.type == "Outpost" and tile.store is store:
+						slots.add(tile.slot)
+		grid.change_log.clear()
+		return slots
+
+	def _later_neighbours(self, slots, dead):
+		#Outposts after a dead one in tick order see it gone in the same tick, so they are stepped with it
+		grid = self.grid
+		store = self.store
+		stepped = set(slots.tolist())
+		extra = set()
+		for slot in slots[dead].tolist():
+			x, y = int(store.xs[slot]), int(store.ys[slot])
+			for pt in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+				if grid.in_grid(pt):
+					tile = grid.get_tile(pt)
+					if (tile is not None and tile.type == "Outpost" and tile.store is store and tile.slot not in stepped
+							and store.order[tile.slot] > store.order[slot]):
+						extra.add(tile.slot)
+		return extra
+
+	def _step(self, slots):
+		#One ordinary tick for the given slots, from their values on the tick before
+		store = self.store
+		columns = store.columns
+		while True:
+			slots = slots[np.argsort(store.order[slots], kind = "stable")]
+			self.materialize(slots)
+			xs = store.xs[slots]
+			ys = store.ys[slots]
+			old = tuple(columns[name][slots] for name in ("energy", "health", "withering", "wither_energy"))
+			counts = np.asarray(self.grid.supporting_neighbour_counts(xs, ys), dtype = np.int64)
+			new = outpost_batch.step_outposts(*old, counts, self.parameters)
+			dead = new[-1]
+			if dead.any():
+				outpost_batch.apply_removal_order(self.grid, xs, ys, old, new[:-1], counts, dead, self.parameters)
+				extra = self._later_neighbours(slots, dead)
+				if extra:
+					slots = np.concatenate([slots, np.array(sorted(extra), dtype = np.int64)])
+					continue
+			return slots, old, new, counts
+
+	def update(self, grid):
+		#Same contract as OutpostStore.update
+		tick = self.tick + 1
+		income_count = int(self.phase_counts[tick % self.income_cost])
+		stepping = self.changed | self._drain_change_log()
+		stepping.update(self._due_slots(tick))
+		self.changed = set()
+		if not stepping:
+			self.tick = tick
+			return income_count, [], []
+		instrumentation.profiler.count("outposts_ticked", len(stepping))
+
+		slots, old, new, counts = self._step(np.array(sorted(stepping), dtype = np.int64))
+		energy, health, withering, wither_energy, dead = new
+		#Energy was already counted by phase, except that dying outposts lose theirs before it pays
+		income_count -= int((dead & (self.phase[slots] == tick % self.income_cost)).sum())
+		energy = energy % self.income_cost
+
+		columns = self.store.columns
+		columns["energy"][slots] = energy
+		columns["health"][slots] = health
+		columns["withering"][slots] = withering
+		columns["wither_energy"][slots] = wither_energy
+		columns["supporting_neighbour_count"][slots] = counts
+		columns["can_remove"][slots] |= dead
+		self.tick = tick
+		self.synced[slots] = tick
+		self.generation[slots] += 1
+		schedule = withering & ~dead
+		for slot, event_tick, event_generation in zip(slots[schedule].tolist(),
+				(tick + self.parameters.outpost_wither_energy_cost - wither_energy[schedule]).tolist(), self.generation[slots[schedule]].tolist()):
+			heapq.heappush(self.heap, (event_tick, event_generation, slot))
+
+		views = self.store.views
+		health_changed = [views[slot] for slot in slots[health != old[1]].tolist()]
+		dead_outposts = [views[slot] for slot in slots[dead].tolist()]
+		return income_count, health_changed, dead_outposts
+
+	def skip_idle_ticks(self, ticks):
+		#Advances up to ticks ticks in one go while nothing is due, returns the ticks skipped and the income over them.
+		#Stops short of the next tick that needs outposts stepped, the caller runs that one as a normal update.
+		if self.changed or self.grid.change_log:
+			return 0, 0
+		heap = self.heap
+		while heap and heap[0][1] != self.generation[heap[0][2]]:
+			heapq.heappop(heap)
+		if heap:
+			ticks = min(ticks, heap[0][0] - self.tick - 1)
+		if ticks <= 0:
+			return 0, 0
+		cycles, remainder = divmod(ticks, self.income_cost)
+		income_count = cycles * int(self.phase_counts.sum())
+		phases = np.arange(self.tick + 1, self.tick + 1 + remainder) % self.income_cost
+		income_count += int(self.phase_counts[phases].sum())
+		self.tick += ticks
+		return ticks, income_count
+
+def enable(grid, parameters = game_parameters.DEFAULT_PARAMETERS):
+	#Switches the grid's outposts to event scheduled ticks, under the parameters of the game they are in
+	return OutpostTimers(grid, parameters)
@@ -1,4 +1,7 @@
 import heapq
+from collections import OrderedDict
+
+import instrumentation
 
 class PriorityQueue:
 	def __init__(self):
@@ -13,10 +16,17 @@ class PriorityQueue:
 	def get(self):
 		return heapq.heappop(self.elements)[1]
 
-def heuristic(a, b):
+def heuristic(a, b, network_distance = float("inf")):
+	#Route costs are 1 for empty cells and 0 for resource cells and outposts.
+	#A path that avoids zero cost tiles pays for every step, so costs at least the manhattan distance.
+	#A path through them still pays every step after the last one, at least network_distance.
 	(x1, y1) = a
 	(x2, y2) = b
-	return 0#abs(x1 - x2) + abs(y1 - y2) - 1
+	return min(abs(x1 - x2) + abs(y1 - y2), network_distance)
+
+def network_distance(grid, goal):
+	#Manhattan distance from goal to the nearest zero cost tile, a resource cell or outpost
+	return min(grid.outposts.nearest_distance(goal), grid.registry.nearest_cell_distance(goal))
 
 def reconstruct_path(came_from, start, goal):
 	current = goal
@@ -31,28 +41,132 @@ def reconstruct_path(came_from, start, goal):
 	path.reverse() # optional
 	return path
 
-def a_star_search(grid, start, goal):
+class RouteSearch(object):
+	#Dijkstra tree rooted at start that persists between queries and is only expanded
+	#until the requested goal is settled. Only valid while the grid version is unchanged.
+	def __init__(self, grid, start):
+		self.grid = grid
+		self.start = start
+		self.version = grid.version
+		self.frontier = PriorityQueue()
+		self.frontier.put(start, 0)
+		self.came_from = {start: None}
+		self.cost_so_far = {start: 0}
+		self.settled = set()
+	
+	def is_current(self, grid, start):
+		return grid is self.grid and start == self.start and grid.version == self.version
+	
+	def search(self, goal):
+		grid = self.grid
+		frontier = self.frontier
+		came_from = self.came_from
+		cost_so_far = self.cost_so_far
+		settled = self.settled
+		settled_before = len(settled)
+		if not grid.is_route_allowed(goal):
+			#Never settled, no need to flood the map to find that out
+			return False, 123456
+		while goal not in settled and not frontier.empty():
+			current = frontier.get()
+			if current in settled:
+				continue
+			settled.add(current)
+			
+			allowed_next = grid.route_neighbours(current)
+			for next in allowed_next:
+				new_cost = cost_so_far[current] + grid.get_route_cost(next)
+				if next not in cost_so_far or new_cost < cost_so_far[next]:
+					cost_so_far[next] = new_cost
+					frontier.put(next, new_cost)
+					came_from[next] = current
+		
+		instrumentation.profiler.count("expanded", len(settled) - settled_before)
+		return reconstruct_path(came_from, self.start, goal), cost_so_far.get(goal, 123456)
+
+class PathCache(object):
+	#LRU cache of search results on one grid, keyed by (start, goal) and stamped with the grid version.
+	#When the grid has changed since an entry was stamped, the entry is still good unless
+	#a point on its path changed or some point anywhere became cheaper (a possible shortcut).
+	#Outposts withering away only make points dearer, so they only drop paths through them.
+	def __init__(self, grid, maxsize = 256):
+		self.grid = grid
+		self.maxsize = maxsize
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+	
+	def lookup(self, start, goal):
+		key = (start, goal)
+		entry = self.entries.get(key)
+		if entry is None or not self._is_valid(entry):
+			self.misses += 1
+			return None
+		entry[0] = self.grid.version
+		self.entries.move_to_end(key)
+		self.hits += 1
+		path, cost = entry[1], entry[2]
+		return (list(path) if path else path), cost
+	
+	def store(self, start, goal, path, cost):
+		key = (start, goal)
+		self.entries[key] = [self.grid.version, (list(path) if path else path), cost]
+		self.entries.move_to_end(key)
+		if len(self.entries) > self.maxsize:
+			self.entries.popitem(last = False)
+	
+	def _is_valid(self, entry):
+		version, path, cost = entry
+		grid = self.grid
+		if version == grid.version:
+			return True
+		if grid.shortcut_version > version:
+			return False
+		if path:
+			cell_versions = grid.cell_versions
+			return all(cell_versions.get(pt, 0) <= version for pt in path)
+		#No path before, and nothing opened up since
+		return True
+	
+	def get_stats(self):
+		return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+def a_star_search(grid, start, goal, stats = None):
+	#One off search for a single goal. Route previews move the goal a step at a time and use RouteSearch,
+	#which keeps its tree between goals and expands fewer points a step, see bench_pathfinding.
+	if not grid.is_route_allowed(goal):
+		return False, 123456
+	goal_network_distance = network_distance(grid, goal)
 	frontier = PriorityQueue()
-	frontier.put(start, 0)
+	frontier.put(start, (0, 0))
 	came_from = {}
 	cost_so_far = {}
 	came_from[start] = None
 	cost_so_far[start] = 0
+	closed = set()
 	
 	while not frontier.empty():
 		current = frontier.get()
+		#Skip stale entries left behind when a cheaper route to a point was found
+		if current in closed:
+			continue
+		closed.add(current)
 		
 		if current == goal:
 			break
 		
-		allowed_next = [n for n in grid.get_neighbouring_points(current) if grid.is_route_allowed(n)]
+		allowed_next = grid.route_neighbours(current)
 		for next in allowed_next:
 			new_cost = cost_so_far[current] + grid.get_route_cost(next)
 			if next not in cost_so_far or new_cost < cost_so_far[next]:
 				#print(grid.get_route_cost(next))
 				cost_so_far[next] = new_cost
-				priority = new_cost + heuristic(goal, next)
-				frontier.put(next, priority)
+				h = heuristic(goal, next, goal_network_distance)
+				#Equal f breaks towards the goal, then by point, so results are deterministic
+				frontier.put(next, (new_cost + h, h))
 				came_from[next] = current
 	
+	if stats is not None:
+		stats["expanded"] = stats.get("expanded", 0) + len(closed)
+	instrumentation.profiler.count("expanded", len(closed))
 	return reconstruct_path(came_from, start, goal), cost_so_far.get(goal, 123456)
\ No newline at end of file
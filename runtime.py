@@ -0,0 +1,136 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import input_retrieval
+import instrumentation
+import pathfinding
+import simulation
+from game_parameters import FPS
+
+#asyncio game loop. Input, ticks, rendering and route planning are separate tasks on one event loop.
+#Ticks keep to an absolute schedule and catch up after a stall, so game time never drifts with render speed.
+#Rendering drops the frames it is too late for instead of drawing them back to back.
+#Route previews are searched on a worker thread and only shown if the grid has not changed meanwhile.
+
+class GameRuntime(object):
+	def __init__(self, simulation, display, input_source, refresh, defer_route_search = True):
+		self.simulation = simulation
+		self.display = display
+		self.input_source = input_source
+		#Called after every frame to push it to the terminal
+		self.refresh = refresh
+		self.game_state = simulation.game_state
+		self.game_state.defer_route_search = defer_route_search
+		#Only ever used on the planner thread
+		self.route_search = None
+
+	def run(self):
+		asyncio.run(self._main())
+
+	async def _main(self):
+		loop = asyncio.get_running_loop()
+		self.render_event = asyncio.Event()
+		self.plan_event = asyncio.Event()
+		with ThreadPoolExecutor(max_workers = 1) as executor:
+			tasks = [
+				asyncio.create_task(self._input_task(loop)),
+				asyncio.create_task(self._tick_task(loop)),
+				asyncio.create_task(self._render_task(loop)),
+				asyncio.create_task(self._planner_task(loop, executor)),
+			]
+			#The input task returns on quit, any task failing also ends the game
+			done, pending = await asyncio.wait(tasks, return_when = asyncio.FIRST_COMPLETED)
+			for task in pending:
+				task.cancel()
+			await asyncio.gather(*pending, return_exceptions = True)
+			for task in done:
+				task.result()
+
+	async def _input_task(self, loop):
+		input_event = asyncio.Event()
+		fileno = getattr(self.input_source, "fileno", None)
+		if fileno is not None:
+			loop.add_reader(fileno(), input_event.set)
+		try:
+			while True:
+				if fileno is not None:
+					await input_event.wait()
+					input_event.clear()
+				else:
+					await asyncio.sleep(input_retrieval.POLL_INTERVAL)
+				with instrumentation.profiler.phase("input"):
+					ops = [op for op in self.input_source.get_input_ops() if op != input_retrieval.NOP]
+				if input_retrieval.QUIT in ops:
+					self.simulation.apply_ops(ops[:ops.index(input_retrieval.QUIT)])
+					return
+				if ops:
+					with instrumentation.profiler.phase("update"):
+						self.simulation.apply_ops(ops)
+					self._request_plan()
+					self.render_event.set()
+		finally:
+			if fileno is not None:
+				loop.remove_reader(fileno())
+
+	async def _tick_task(self, loop):
+		clock = simulation.RealTimeClock(self.game_state.parameters.tick_rate, loop.time())
+		while True:
+			await asyncio.sleep(max(clock.time_until_next_tick(loop.time()), 0))
+			with instrumentation.profiler.phase("update"):
+				for _ in range(clock.due_ticks(loop.time())):
+					self.simulation.step()
+			#A tick may have changed the grid under a pending search
+			self._request_plan()
+
+	async def _render_task(self, loop):
+		frame_length = 1. / FPS
+		next_frame = loop.time()
+		while True:
+			timeout = next_frame - loop.time()
+			if timeout > 0:
+				try:
+					await asyncio.wait_for(self.render_event.wait(), timeout)
+				except asyncio.TimeoutError:
+					pass
+			self.render_event.clear()
+			profiler = instrumentation.profiler
+			profiler.start_frame()
+			with profiler.phase("render"):
+				self.display.display_update()
+				self.refresh()
+			profiler.end_frame()
+
+			now = loop.time()
+			if now >= next_frame:
+				next_frame += frame_length
+				if next_frame < now:
+					dropped = int((now - next_frame) / frame_length) + 1
+					profiler.count("frames_dropped", dropped)
+					next_frame += dropped * frame_length
+			#Let the other tasks run even when frames are due back to back
+			await asyncio.sleep(0)
+
+	def _request_plan(self):
+		if self.game_state.pending_route is not None:
+			self.plan_event.set()
+
+	async def _planner_task(self, loop, executor):
+		while True:
+			await self.plan_event.wait()
+			self.plan_event.clear()
+			request = self.game_state.pending_route
+			if request is None:
+				continue
+			start, goal, version = request
+			route = await loop.run_in_executor(executor, self._search, start, goal)
+			if self.game_state.resolve_route(request, route):
+				self.render_event.set()
+			else:
+				self.plan_event.set()
+
+	def _search(self, start, goal):
+		#Runs on the planner thread. The grid may change meanwhile, resolve_route then throws the result away.
+		grid = self.game_state.game_map
+		if self.route_search is None or not self.route_search.is_current(grid, start):
+			self.route_search = pathfinding.RouteSearch(grid, start)
+		return self.route_search.search(goal)
@@ -0,0 +1,88 @@
+import array_grid
+import game_map
+import game_parameters
+import game_state
+import input_constants
+import instrumentation
+import map_format
+
+#Headless simulation core, importable without curses or msvcrt
+
+def create_game_state(xm, ym, grid_class = array_grid.ArrayGrid, seed = None, parameters = None, rules = game_parameters.DEFAULT_PARAMETERS):
+	#parameters shape the map, rules are the game_parameters.GameParameters the game is played under
+	grid = game_map.get_grid(xm, ym, grid_class, seed, parameters)
+	cursor = grid.player_cells[0].position
+	return game_state.GameState(cursor, grid, rules)
+
+def load_game_state(map_path, grid_class = array_grid.ArrayGrid, rules = game_parameters.DEFAULT_PARAMETERS):
+	#New game on a map saved with map_format.save_map
+	grid = map_format.load_grid(map_path, grid_class)
+	cursor = grid.player_cells[0].position
+	return game_state.GameState(cursor, grid, rules)
+
+class Simulation(object):
+	def __init__(self, game_state, journal = None):
+		self.game_state = game_state
+		self.tick_count = 0
+		self.observers = []
+		#Records every applied op when set, see journal.Journal
+		self.journal = journal
+	def add_observer(self, observer, every_ticks = 1):
+		#observer is called with this simulation after every every_ticks ticks
+		self.observers.append((observer, every_ticks))
+	def remove_observer(self, observer):
+		self.observers = [(o, every_ticks) for o, every_ticks in self.observers if o != observer]
+	def apply_ops(self, ops):
+		#Ops take effect straight away, recorded against the tick about to run.
+		#Nothing else changes the state between ticks, so this replays the same as passing them to step.
+		with instrumentation.profiler.phase("ops"):
+			for op in ops:
+				if self.journal is not None:
+					self.journal.record(self.tick_count, op)
+				self.game_state.handle_op(op)
+	def step(self, ops = ()):
+		#Apply every op that arrived during this tick, then advance game time by one tick
+		self.apply_ops(ops)
+		with instrumentation.profiler.phase("tick"):
+			self.game_state.tick()
+		self.tick_count += 1
+		for observer, every_ticks in self.observers:
+			if self.tick_count % every_ticks == 0:
+				observer(self)
+	def advance(self, ticks, ops = ()):
+		#ops supplies one op per tick, ticks past its end get NOP
+		ops = iter(ops)
+		for _ in range(ticks):
+			self.step((next(ops, input_constants.NOP),))
+	def fast_forward(self, ticks):
+		#Same as advance with no ops, as few real ticks as the game state needs.
+		#Observers still see every tick they asked for.
+		end = self.tick_count + ticks
+		while self.tick_count < end:
+			span = end - self.tick_count
+			for observer, every_ticks in self.observers:
+				span = min(span, every_ticks - self.tick_count % every_ticks)
+			with instrumentation.profiler.phase("tick"):
+				self.game_state.fast_forward(span)
+			self.tick_count += span
+			for observer, every_ticks in self.observers:
+				if self.tick_count % every_ticks == 0:
+					observer(self)
+	def run(self, ops):
+		#One tick per op until ops is exhausted
+		for op in ops:
+			self.step((op,))
+
+class RealTimeClock(object):
+	#Fixed timestep driver, tells a real time loop how many ticks are due
+	def __init__(self, tick_rate, start_time):
+		self.tick_length = 1. / tick_rate
+		self.next_tick_time = start_time
+	def due_ticks(self, now):
+		ticks = 0
+		while now >= self.next_tick_time:
+			self.next_tick_time += self.tick_length
+			ticks += 1
+		return ticks
+	def time_until_next_tick(self, now):
+		return self.next_tick_time - now
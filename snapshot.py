@@ -0,0 +1,287 @@
+import os
+import json
+import struct
+
+import numpy as np
+
+import array_grid
+import game_map
+import game_parameters
+import game_state
+import map_format
+from array_grid import EMPTY, ROCK
+
+#Save games as flat tables instead of pickled tile objects.
+#A full snapshot carries the kinds of every point and every entity. An incremental one carries only what changed
+#since its base full snapshot: the kinds of changed points, the resources and cells at them and the resources
+#whose amount changed. Entities at changed points that are not in it were removed. Outpost columns move on every
+#tick, so both carry the whole outpost table.
+#Layout, little endian: header, state json, kinds or patch, resources, resource cells, outposts.
+
+MAGIC = b"PSSV"
+#2: incremental snapshots only carry changed resources and cells
+FORMAT_VERSION = 2
+FULL = 0
+INCREMENTAL = 1
+
+#magic, format version, kind, xm, ym, grid version, base version,
+#state length, resource count, cluster count, cell count, outpost count, patch count
+HEADER = struct.Struct("<4sHHIIQQIIIIII")
+RESOURCE_DTYPE = map_format.RESOURCE_DTYPE
+CELL_DTYPE = np.dtype([("x", "<u4"), ("y", "<u4"), ("cluster", "<u4")])
+OUTPOST_DTYPE = np.dtype([("x", "<u4"), ("y", "<u4"), ("energy", "<i4"), ("health", "<i4"),
+	("wither_energy", "<i4"), ("support", "u1"), ("withering", "u1"), ("can_remove", "u1")])
+#Table field and OutpostStore column
+OUTPOST_COLUMNS = [("energy", "energy"), ("health", "health"), ("wither_energy", "wither_energy"),
+	("support", "supporting_neighbour_count"), ("withering", "withering"), ("can_remove", "can_remove")]
+PATCH_DTYPE = np.dtype([("x", "<u4"), ("y", "<u4"), ("kind", "u1")])
+
+def _position(tile):
+	return None if tile is None else list(tile.position)
+
+def _state_fields(gs):
+	grid = gs.game_map
+	return {
+		"cursor": gs.cursor,
+		"state_type": gs.state_type,
+		"last_op": gs.last_op,
+		"action_desc": gs.action_desc,
+		"money": gs.money,
+		"neighbouring_resource": _position(gs.neighbouring_resource),
+		"selected": _position(gs.selected),
+		"route_attempts": [[list(tile.position) for tile in ra.attempt_tiles] for ra in gs.route_attempts],
+		#A deferred route search is saved as the request, the grid version it was made at is not kept
+		"pending_route": None if gs.pending_route is None else [list(pt) for pt in gs.pending_route[:2]],
+		"start_location": getattr(grid, "start_location", None),
+		"seed": getattr(grid, "seed", None),
+		"parameters": gs.parameters.as_dict(),
+	}
+
+def _changed_points(grid, base_version):
+	#Points whose tile changed since base_version, and resources whose amount may have.
+	#Entity changes at base_version itself may have come before the base was taken, so they are kept.
+	changed = set(pt for pt, version in grid.cell_versions.items() if version > base_version)
+	changed.update(pt for pt, version in grid.entity_versions.items() if version >= base_version)
+	return changed
+
+def _entity_tables(grid, changed = None):
+	#Every resource and cell, or only those at the changed points
+	cluster_indices = {id(rc): i for i, rc in enumerate(grid.resource_clusters)}
+	resources = np.array([resource.position + (cluster_index, resource.amount)
+		for cluster_index, rc in enumerate(grid.resource_clusters) for resource in rc.resources
+		if changed is None or resource.position in changed], dtype = RESOURCE_DTYPE)
+	cells = np.array([cell.position + (cluster_indices[id(cell.cluster)],)
+		for cell in grid.player_cells if changed is None or cell.position in changed], dtype = CELL_DTYPE)
+
+	#Outpost columns are copied straight out of the store
+	store = grid.outposts
+	store.materialize()
+	slots = store.ordered_slots()
+	table = np.zeros(len(slots), dtype = OUTPOST_DTYPE)
+	table["x"] = store.xs[slots]
+	table["y"] = store.ys[slots]
+	for field, name in OUTPOST_COLUMNS:
+		table[field] = store.columns[name][slots]
+	return resources, cells, table
+
+def _patch(grid, base_version):
+	changed = [pt for pt, version in grid.cell_versions.items() if version > base_version]
+	patch = np.zeros(len(changed), dtype = PATCH_DTYPE)
+	for i, pt in enumerate(changed):
+		tile = grid.get_tile(pt)
+		kind = EMPTY if tile is None else array_grid.KIND_BY_TYPE.get(tile.type, array_grid.OTHER)
+		patch[i] = pt + (kind,)
+	return patch
+
+def encode_snapshot(gs, base_version = None):
+	#Full snapshot, or an incremental one against the full snapshot taken at grid version base_version
+	grid = gs.game_map
+	state = json.dumps(_state_fields(gs)).encode("utf-8")
+	if base_version is None:
+		kind, layer, patch_count = FULL, map_format.grid_kinds(grid), 0
+		resources, cells, outposts = _entity_tables(grid)
+	else:
+		kind = INCREMENTAL
+		layer = _patch(grid, base_version)
+		patch_count = len(layer)
+		resources, cells, outposts = _entity_tables(grid, _changed_points(grid, base_version))
+	header = HEADER.pack(MAGIC, FORMAT_VERSION, kind, grid.xm, grid.ym, grid.version, base_version or 0,
+		len(state), len(resources), len(grid.resource_clusters), len(cells), len(outposts), patch_count)
+	return b"".join([header, state, layer.tobytes(), resources.tobytes(), cells.tobytes(), outposts.tobytes()])
+
+def _read_header(data):
+	fields = HEADER.unpack_from(data)
+	if fields[0] != MAGIC:
+		raise ValueError("Not a snapshot")
+	if fields[1] != FORMAT_VERSION:
+		raise ValueError("Unsupported snapshot format version {0}".format(fields[1]))
+	return fields[2:]
+
+def _read_table(data, dtype, count, offset):
+	return np.frombuffer(data, dtype = dtype, count = count, offset = offset), offset + count * dtype.itemsize
+
+def _read_tables(data):
+	kind, xm, ym, version, base_version, state_length, resource_count, cluster_count, cell_count, outpost_count, patch_count = _read_header(data)
+	offset = HEADER.size
+	state = json.loads(bytes(data[offset:offset + state_length]).decode("utf-8"))
+	offset += state_length
+	if kind == FULL:
+		shape = (ym + 1, xm + 1)
+		layer, offset = _read_table(data, np.dtype(np.uint8), shape[0] * shape[1], offset)
+		layer = layer.reshape(shape)
+	else:
+		layer, offset = _read_table(data, PATCH_DTYPE, patch_count, offset)
+	resources, offset = _read_table(data, RESOURCE_DTYPE, resource_count, offset)
+	cells, offset = _read_table(data, CELL_DTYPE, cell_count, offset)
+	outposts, offset = _read_table(data, OUTPOST_DTYPE, outpost_count, offset)
+	return kind, xm, ym, version, base_version, state, layer, resources, cluster_count, cells, outposts
+
+def _merge_entities(base_resources, base_cells, resources, cells, patch):
+	#Base rows at changed points were removed or have a row in the incremental tables.
+	#Resources whose amount changed keep their place, so clusters draw them down in the same order.
+	#Cluster indices follow the registry's cluster order, which only drops clusters whose last resource went and
+	#appends new ones, so the base clusters that still have a resource keep their order at the front.
+	changed = set(zip(patch["x"].tolist(), patch["y"].tolist()))
+	rows = {pt: i for i, pt in enumerate(zip(base_resources["x"].tolist(), base_resources["y"].tolist()))}
+	kept_resources = [i for pt, i in rows.items() if pt not in changed]
+	kept_cells = [i for i, pt in enumerate(zip(base_cells["x"].tolist(), base_cells["y"].tolist())) if pt not in changed]
+	cluster_map = np.full(int(base_resources["cluster"].max()) + 1 if len(base_resources) else 0, -1, dtype = np.int64)
+	for new_index, old_index in enumerate(np.unique(base_resources["cluster"][kept_resources])):
+		cluster_map[old_index] = new_index
+	merged_resources = base_resources.copy()
+	added = []
+	for row in resources:
+		pt = (int(row["x"]), int(row["y"]))
+		if pt in rows and pt not in changed:
+			merged_resources["amount"][rows[pt]] = row["amount"]
+		else:
+			added.append(row)
+	merged_resources = merged_resources[kept_resources]
+	merged_resources["cluster"] = cluster_map[merged_resources["cluster"]]
+	merged_cells = base_cells[kept_cells]
+	if (cluster_map[merged_cells["cluster"]] < 0).any():
+		raise ValueError("Snapshot cell belongs to a cluster with no resources")
+	merged_cells["cluster"] = cluster_map[merged_cells["cluster"]]
+	return (np.concatenate([merged_resources, np.array(added, dtype = RESOURCE_DTYPE)]),
+		np.concatenate([merged_cells, cells]))
+
+def decode_snapshot(data, base_data = None, grid_class = array_grid.ArrayGrid):
+	#Incremental snapshots need the bytes of their base full snapshot
+	kind, xm, ym, version, base_version, state, layer, resources, cluster_count, cells, outposts = _read_tables(data)
+	changed_resources = np.zeros(0, dtype = RESOURCE_DTYPE)
+	if kind == FULL:
+		kinds = layer
+		patch = np.zeros(0, dtype = PATCH_DTYPE)
+	else:
+		if base_data is None:
+			raise ValueError("Incremental snapshot needs its base snapshot")
+		base_kind, base_xm, base_ym, base_grid_version, _, _, kinds, base_resources, _, base_cells, _ = _read_tables(base_data)
+		if base_kind != FULL or (base_xm, base_ym, base_grid_version) != (xm, ym, base_version):
+			raise ValueError("Snapshot was not taken against this base")
+		patch = layer
+		changed_resources = resources
+		resources, cells = _merge_entities(base_resources, base_cells, resources, cells, patch)
+	#Snapshots from before game parameters were saved were played under the defaults
+	parameters = game_parameters.GameParameters.from_dict(state.get("parameters", {}))
+
+	#Entities are placed from their tables below, only rocks come from the kinds
+	terrain = np.where(kinds == ROCK, ROCK, EMPTY).astype(np.uint8)
+	terrain[patch["y"], patch["x"]] = np.where(patch["kind"] == ROCK, ROCK, EMPTY)
+	grid = grid_class(xm, ym)
+	if isinstance(grid, array_grid.ArrayGrid):
+		grid._attach_kinds(terrain)
+	else:
+		for y, x in zip(*np.nonzero(terrain == ROCK)):
+			grid._set_tile((int(x), int(y)), game_map.ROCK_TILE)
+
+	clusters = [game_map.ResourceCluster() for _ in range(cluster_count)]
+	for x, y, cluster_index, amount in resources.tolist():
+		rc = clusters[cluster_index]
+		resource = game_map.Resource((x, y), amount, rc)
+		rc.add_resource(resource)
+		grid._set_tile((x, y), resource)
+	for x, y, cluster_index in cells.tolist():
+		cell = game_map.ResourceCell((x, y), clusters[cluster_index])
+		grid._set_tile((x, y), cell)
+	for x, y, energy, health, wither_energy, support, withering, can_remove in outposts.tolist():
+		outpost = game_map.Outpost((x, y), parameters)
+		outpost.energy = energy
+		outpost.health = health
+		outpost.wither_energy = wither_energy
+		outpost.supporting_neighbour_count = support
+		outpost.withering = bool(withering)
+		outpost.can_remove = bool(can_remove)
+		grid._set_tile((x, y), outpost)
+
+	#Later incremental snapshots against the same base still need to see the patched points
+	grid.version = version
+	grid.shortcut_version = version
+	for x, y in zip(patch["x"].tolist(), patch["y"].tolist()):
+		grid.cell_versions[(x, y)] = version
+	for x, y in zip(changed_resources["x"].tolist(), changed_resources["y"].tolist()):
+		grid.entity_versions[(x, y)] = version
+	if state["start_location"] is not None:
+		grid.start_location = tuple(state["start_location"])
+	grid.seed = state["seed"]
+	return _restore_state(grid, state, parameters)
+
+def _restore_state(grid, state, parameters):
+	gs = game_state.GameState(tuple(state["cursor"]), grid, parameters)
+	gs.state_type = state["state_type"]
+	last_op = state["last_op"]
+	gs.last_op = tuple(last_op) if isinstance(last_op, list) else last_op
+	gs.action_desc = state["action_desc"]
+	gs.money = state["money"]
+	if state["neighbouring_resource"] is not None:
+		gs.neighbouring_resource = grid.get_tile(tuple(state["neighbouring_resource"]))
+	if state["selected"] is not None:
+		gs.selected = grid.get_tile(tuple(state["selected"]))
+	gs.route_attempts = [game_map.RouteAttempt([game_map.RouteAttemptTile(tuple(pt)) for pt in points])
+		for points in state["route_attempts"]]
+	if state.get("pending_route") is not None:
+		start, goal = state["pending_route"]
+		gs.pending_route = (tuple(start), tuple(goal), grid.version)
+	return gs
+
+def _write_file(path, data):
+	#Write beside the target and swap it in, so a crash mid save keeps the old file
+	temp_path = path + ".tmp"
+	with open(temp_path, "wb") as f:
+		f.write(data)
+	os.replace(temp_path, path)
+
+def save_snapshot(gs, path, base_version = None):
+	_write_file(path, encode_snapshot(gs, base_version))
+
+def load_snapshot(path, base_path = None, grid_class = array_grid.ArrayGrid):
+	with open(path, "rb") as f:
+		data = f.read()
+	base_data = None
+	if base_path is not None:
+		with open(base_path, "rb") as f:
+			base_data = f.read()
+	return decode_snapshot(data, base_data, grid_class)
+
+class Autosaver(object):
+	#Simulation observer. Writes a full snapshot every full_every saves and incremental ones in between.
+	def __init__(self, directory, full_every = 10):
+		self.full_path = os.path.join(directory, "autosave_full.snap")
+		self.incremental_path = os.path.join(directory, "autosave.snap")
+		self.full_every = full_every
+		self.saves = 0
+		self.base_version = None
+	def __call__(self, simulation):
+		gs = simulation.game_state
+		if self.base_version is None or self.saves % self.full_every == 0:
+			#The old incremental snapshot goes first, it would not match the new base
+			if os.path.exists(self.incremental_path):
+				os.remove(self.incremental_path)
+			save_snapshot(gs, self.full_path)
+			self.base_version = gs.game_map.version
+		else:
+			save_snapshot(gs, self.incremental_path, self.base_version)
+		self.saves += 1
+	def load(self, grid_class = array_grid.ArrayGrid):
+		if os.path.exists(self.incremental_path):
+			return load_snapshot(self.incremental_path, self.full_path, grid_class)
+		return load_snapshot(self.full_path, grid_class = grid_class)
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import random
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import game_parameters
+import journal
+import outpost_timers
+import simulation
+from input_constants import *
+
+#Parameter sweeps for balancing. Every combination of the swept game parameters is played on every seed,
+#headless with a scripted op stream, spread over a process pool.
+#Results stream into a directory as they come in, one column per file: name.bin holds the raw little endian
+#values of every game so far, one row per game in the order they finished. schema.json gives the dtype and
+#shape of each column, the row count and the sweep settings. Read it back with load_results.
+
+SCHEMA_FILE = "schema.json"
+
+#Scripts are generators of (tick, ops) in tick order, ticks without ops are fast forwarded.
+#They are resumed after their ops ran, so they can look at the game state to pick the next ones.
+BUILD_INTERVAL = 100
+TARGET_ATTEMPTS = 20
+
+def _moves(start, goal):
+	(x1, y1), (x2, y2) = start, goal
+	return [E if x2 > x1 else W] * abs(x2 - x1) + [S if y2 > y1 else N] * abs(y2 - y1)
+
+def builder_script(gs, seed, ticks):
+	#Every BUILD_INTERVAL ticks, builds a route from the starting cell to a random empty point
+	rng = random.Random(seed)
+	grid = gs.game_map
+	start = grid.player_cells[0].position
+	for tick in range(BUILD_INTERVAL, ticks, BUILD_INTERVAL):
+		for _ in range(TARGET_ATTEMPTS):
+			target = (rng.randrange(grid.xm), rng.randrange(grid.ym))
+			if grid.get_tile(target) is None:
+				break
+		else:
+			continue
+		#Cancel backs out when there was no route to confirm
+		yield tick, _moves(gs.cursor, start) + [SELECT, OPTION_1] + _moves(start, target) + [SELECT, CANCEL]
+
+SCRIPTS = {"builder": builder_script}
+
+def journal_script(path):
+	#A recorded game's ops, played again under other parameters
+	recorded = journal.Journal.load(path)
+	entries = [(tick, ops) for tick, ops in enumerate(recorded.ops_by_tick()) if ops]
+	return recorded, entries
+
+def play_game(job):
+	#Runs in a worker process, returns one result row
+	start = time.perf_counter()
+	rules = game_parameters.GameParameters.from_dict(job["parameters"])
+	gs = simulation.create_game_state(job["xm"], job["ym"], seed = job["seed"], rules = rules)
+	outpost_timers.enable(gs.game_map, rules)
+	sim = simulation.Simulation(gs)
+	money = []
+	outposts = []
+	def sample(sim):
+		money.append(sim.game_state.money)
+		outposts.append(len(sim.game_state.game_map.outposts))
+	sim.add_observer(sample, job["sample_every"])
+
+	entries = job["entries"]
+	if entries is None:
+		entries = SCRIPTS[job["script"]](gs, job["seed"], job["ticks"])
+	for tick, ops in entries:
+		if tick >= job["ticks"]:
+			break
+		sim.fast_forward(tick - sim.tick_count)
+		sim.step(ops)
+	sim.fast_forward(job["ticks"] - sim.tick_count)
+
+	store = gs.game_map.outposts
+	row = {"game": job["index"], "seed": job["seed"]}
+	row.update(job["parameters"])
+	row.update({
+		"final_money": gs.money,
+		#Outposts only ever leave the store by dying
+		"outposts_built": store.next_order,
+		"outposts_lost": store.next_order - len(store),
+		"money": money,
+		"outposts": outposts,
+		"seconds": time.perf_counter() - start,
+	})
+	return row
+
+class ColumnWriter(object):
+	#One file per column, each row is appended to every file as it comes in
+	def __init__(self, directory, columns, settings):
+		#columns: (name, dtype, shape of one row) in file order
+		os.makedirs(directory, exist_ok = True)
+		self.directory = directory
+		self.columns = [(name, np.dtype(dtype).newbyteorder("<"), tuple(shape)) for name, dtype, shape in columns]
+		self.settings = settings
+		self.rows = 0
+		self.files = {name: open(os.path.join(directory, name + ".bin"), "wb") for name, dtype, shape in self.columns}
+		self._write_schema()
+
+	def _write_schema(self):
+		schema = {
+			"rows": self.rows,
+			"columns": [{"name": name, "dtype": dtype.str, "shape": list(shape)} for name, dtype, shape in self.columns],
+			"settings": self.settings,
+		}
+		temp_path = os.path.join(self.directory, SCHEMA_FILE + ".tmp")
+		with open(temp_path, "w") as f:
+			json.dump(schema, f, indent = 1)
+		os.replace(temp_path, os.path.join(self.directory, SCHEMA_FILE))
+
+	def write(self, row):
+		for name, dtype, shape in self.columns:
+			f = self.files[name]
+			f.write(np.asarray(row[name], dtype = dtype).reshape(shape).tobytes())
+			f.flush()
+		self.rows += 1
+		self._write_schema()
+
+	def close(self):
+		for f in self.files.values():
+			f.close()
+		self._write_schema()
+
+def load_results(directory):
+	#name -> array with one row per game, also reads a sweep that is still running
+	with open(os.path.join(directory, SCHEMA_FILE)) as f:
+		schema = json.load(f)
+	results = {}
+	for column in schema["columns"]:
+		dtype = np.dtype(column["dtype"])
+		shape = tuple(column["shape"])
+		values = np.fromfile(os.path.join(directory, column["name"] + ".bin"), dtype = dtype)
+		results[column["name"]] = values[:schema["rows"] * int(np.prod(shape))].reshape((schema["rows"],) + shape)
+	return results
+
+def parse_values(text):
+	values = []
+	for value in text.split(","):
+		try:
+			values.append(int(value))
+		except ValueError:
+			values.append(float(value))
+	return values
+
+def make_jobs(swept, seeds, xm, ym, ticks, sample_every, script, entries):
+	#Every combination of the swept values on every seed, everything else at its default
+	names = sorted(swept)
+	jobs = []
+	for values in itertools.product(*[swept[name] for name in names]):
+		parameters = game_parameters.DEFAULT_PARAMETERS.replace(**dict(zip(names, values))).as_dict()
+		for seed in seeds:
+			jobs.append({
+				"index": len(jobs), "parameters": parameters, "seed": seed, "xm": xm, "ym": ym, "ticks": ticks,
+				"sample_every": sample_every, "script": script, "entries": entries,
+			})
+	return jobs
+
+def result_columns(jobs, samples):
+	columns = [("game", np.int64, ()), ("seed", np.int64, ())]
+	for name in game_parameters.PARAMETER_NAMES:
+		columns.append((name, np.int64, ()))
+	columns += [
+		("final_money", np.int64, ()),
+		("outposts_built", np.int64, ()),
+		("outposts_lost", np.int64, ()),
+		("money", np.int64, (samples,)),
+		("outposts", np.int64, (samples,)),
+		("seconds", np.float64, ()),
+	]
+	return columns
+
+def run_sweep(directory, jobs, settings, workers = None):
+	samples = settings["ticks"] // settings["sample_every"]
+	writer = ColumnWriter(directory, result_columns(jobs, samples), settings)
+	try:
+		with ProcessPoolExecutor(max_workers = workers) as executor:
+			futures = [executor.submit(play_game, job) for job in jobs]
+			for done, future in enumerate(as_completed(futures), 1):
+				row = future.result()
+				writer.write(row)
+				print("{}/{} game {} seed {} money {} lost {} ({:.1f}s)".format(done, len(jobs), row["game"], row["seed"],
+					row["final_money"], row["outposts_lost"], row["seconds"]))
+	finally:
+		writer.close()
+
+if __name__=="__main__":
+	parser = argparse.ArgumentParser(description = "Play headless games over a grid of game parameters")
+	parser.add_argument("directory", help = "where to write the result columns")
+	parser.add_argument("--set", action = "append", default = [], metavar = "NAME=V1,V2,...",
+		help = "sweep a game parameter over these values, one of: " + ", ".join(game_parameters.PARAMETER_NAMES))
+	parser.add_argument("--seeds", type = int, default = 8, help = "map seeds 0 to SEEDS - 1 for every combination")
+	parser.add_argument("--size", default = "90x20", help = "map size as XMxYM")
+	parser.add_argument("--ticks", type = int, default = 6000)
+	parser.add_argument("--sample-every", type = int, default = 100, help = "ticks between money and outpost samples")
+	parser.add_argument("--script", choices = sorted(SCRIPTS), default = "builder")
+	parser.add_argument("--journal", help = "play the ops of this recorded game instead, on its map")
+	parser.add_argument("--workers", type = int, help = "worker processes, all cores by default")
+	args = parser.parse_args()
+
+	swept = {}
+	for setting in args.set:
+		name, _, values = setting.partition("=")
+		if name not in game_parameters.PARAMETER_NAMES:
+			parser.error("unknown game parameter " + name)
+		try:
+			swept[name] = [getattr(game_parameters.DEFAULT_PARAMETERS.replace(**{name: value}), name)
+				for value in parse_values(values)]
+		except ValueError as e:
+			parser.error(str(e))
+	xm, ym = [int(v) for v in args.size.lower().split("x")]
+	seeds = list(range(args.seeds))
+	script = args.script
+	entries = None
+	if args.journal is not None:
+		recorded, entries = journal_script(args.journal)
+		xm, ym, seeds, script = recorded.xm, recorded.ym, [recorded.seed], "journal"
+	settings = {
+		"swept": swept, "seeds": seeds, "xm": xm, "ym": ym, "ticks": args.ticks,
+		"sample_every": args.sample_every, "script": script, "journal": args.journal,
+	}
+	jobs = make_jobs(swept, seeds, xm, ym, args.ticks, args.sample_every, script, entries)
+	run_sweep(args.directory, jobs, settings, args.workers)
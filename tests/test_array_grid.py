@@ -0,0 +1,19 @@
+import array_grid
+import game_map
+
+def expected_route_neighbours(grid, pt):
+	return [n for n in game_map.Grid.get_neighbouring_points(grid, pt) if grid.is_route_allowed(n)]
+
+def test_route_neighbours_follow_tiles_being_set():
+	grid = game_map.get_grid(40, 15, array_grid.ArrayGrid, 5)
+	open_points = [pt for pt in grid.points() if grid.in_grid(pt) and grid.is_route_allowed(pt)]
+	rocks = [pt for pt in grid.points() if grid.in_grid(pt) and not grid.is_route_allowed(pt)]
+	for pt in open_points[::7]:
+		grid._set_tile(pt, game_map.ROCK_TILE)
+	for pt in rocks[::5]:
+		grid._set_tile(pt, None)
+	#Points on the edge of the arrays are outside in_grid, setting them must not open routes along the border
+	grid._set_tile((grid.xm, 3), None)
+	grid._set_tile((4, grid.ym), None)
+	for pt in grid.points():
+		assert grid.route_neighbours(pt) == expected_route_neighbours(grid, pt)
@@ -0,0 +1,79 @@
+import sys
+import threading
+from collections import deque
+
+import pytest
+
+import chunked_grid
+import pathfinding
+
+def unreachable(grid, start, x0, y0, x1, y1):
+	#Open points of the box that no route from start inside the box gets to
+	reached = set([start])
+	queue = deque([start])
+	while queue:
+		for n in grid.route_neighbours(queue.popleft()):
+			if n not in reached and x0 <= n[0] < x1 and y0 <= n[1] < y1:
+				reached.add(n)
+				queue.append(n)
+	return [(x, y) for y in range(y0, y1) for x in range(x0, x1)
+		if grid.in_grid((x, y)) and grid.is_route_allowed((x, y)) and (x, y) not in reached]
+
+#World sizes that cut the last row and column of chunks short
+@pytest.mark.parametrize("xm, ym, seed", [(300, 170, 2), (45, 21, 3), (97, 64, 4)])
+def test_every_open_point_of_a_small_world_is_reachable(xm, ym, seed):
+	grid = chunked_grid.ChunkedGrid.create(xm, ym, seed = seed)
+	assert unreachable(grid, grid.start_location, 0, 0, xm, ym) == []
+
+def test_chunks_around_the_start_have_no_pockets():
+	#Every chunk is joined up through its own gates, so a block of chunks is too without leaving it
+	grid = chunked_grid.ChunkedGrid.create(100000, 100000, seed = 1)
+	x, y = grid.start_location
+	x0 = (x >> chunked_grid.CHUNK_SHIFT << chunked_grid.CHUNK_SHIFT) - 4 * chunked_grid.CHUNK_SIZE
+	y0 = (y >> chunked_grid.CHUNK_SHIFT << chunked_grid.CHUNK_SHIFT) - 4 * chunked_grid.CHUNK_SIZE
+	assert unreachable(grid, grid.start_location, x0, y0, x0 + 8 * chunked_grid.CHUNK_SIZE, y0 + 8 * chunked_grid.CHUNK_SIZE) == []
+
+def test_route_search_reaches_open_points_without_flooding_the_world():
+	grid = chunked_grid.ChunkedGrid.create(100000, 100000, seed = 1)
+	x, y = grid.start_location
+	search = pathfinding.RouteSearch(grid, grid.start_location)
+	for dx, dy in ((60, 0), (-60, 40), (0, -90), (90, 90)):
+		goal = (x + dx, y + dy)
+		while not grid.is_route_allowed(goal):
+			goal = (goal[0] + 1, goal[1])
+		path, cost = search.search(goal)
+		assert path and path[-1] == goal
+	assert grid.chunks_generated < 100
+
+def test_threads_reading_unloaded_chunks_load_each_chunk_once():
+	#The runtime's planner thread searches while the main thread ticks and draws
+	grid = chunked_grid.ChunkedGrid(100000, 100000, seed = 4)
+	keys = [(100 + i % 8, 200 + i // 8) for i in range(40)]
+	def read(keys):
+		for cx, cy in keys:
+			for dy in range(0, chunked_grid.CHUNK_SIZE, 3):
+				for dx in range(0, chunked_grid.CHUNK_SIZE, 3):
+					pt = ((cx << chunked_grid.CHUNK_SHIFT) + dx, (cy << chunked_grid.CHUNK_SHIFT) + dy)
+					grid.get_tile(pt)
+					grid.route_neighbours(pt)
+	threads = [threading.Thread(target = read, args = (order,)) for order in (keys, keys[::-1], keys[1::2] + keys[::2])]
+	#Switch threads as often as possible, so they meet inside chunk loads
+	interval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)
+	try:
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+	finally:
+		sys.setswitchinterval(interval)
+
+	loaded = list(grid.chunks.values()) + list(grid.pinned_chunks.values())
+	assert grid.chunks_generated == len(loaded)
+	assert len(grid.resource_clusters) == sum(len(chunk.clusters) for chunk in loaded)
+	#Tiles are the ones a single thread sees
+	alone = chunked_grid.ChunkedGrid(100000, 100000, seed = 4)
+	def kinds(grid):
+		return [None if tile is None else (tile.type, getattr(tile, "amount", None))
+			for chunk in sorted(loaded, key = lambda chunk: chunk.key) for tile in grid._chunk(chunk.key).tiles]
+	assert kinds(grid) == kinds(alone)
@@ -0,0 +1,18 @@
+import pytest
+
+import game_parameters
+
+def test_whole_number_floats_are_taken_as_ints():
+	parameters = game_parameters.DEFAULT_PARAMETERS.replace(outpost_wither_interval = 5.0)
+	assert parameters.outpost_wither_interval == 5
+	assert isinstance(parameters.outpost_wither_interval, int)
+
+@pytest.mark.parametrize("name, value", [
+	("outpost_money_gain_interval", 3.5),
+	("outpost_wither_interval", 4.5),
+	("tick_rate", "10"),
+	("outpost_max_health", True),
+])
+def test_fractions_and_other_types_are_rejected(name, value):
+	with pytest.raises(ValueError):
+		game_parameters.GameParameters.from_dict({name: value})
@@ -0,0 +1,29 @@
+import simulation
+from input_constants import *
+from state_constants import *
+
+def construction_spot(gs):
+	#An empty point next to a resource, where a resource cell can be built
+	grid = gs.game_map
+	for pt in grid.points():
+		if grid.in_grid(pt) and grid.get_tile(pt) is None and grid.neighbouring_resource(pt) is not None:
+			return pt
+
+def test_building_twice_on_the_same_point_is_ignored():
+	gs = simulation.create_game_state(90, 20, seed = 1)
+	gs.cursor = construction_spot(gs)
+	gs.update(NOP)
+	gs.handle_op(N)
+	gs.handle_op(S)
+	assert gs.state_type == STANDARD_CONSTRUCTION_AVAILABLE
+	cluster = gs.neighbouring_resource.cluster
+	cells = len(gs.game_map.player_cells)
+	amount = cluster.get_total_amount()
+
+	gs.update(OPTION_1)
+	assert len(gs.game_map.player_cells) == cells + 1
+	assert cluster.get_total_amount() == amount - gs.parameters.resource_cell_resource_cost
+
+	gs.update(OPTION_1)
+	assert len(gs.game_map.player_cells) == cells + 1
+	assert cluster.get_total_amount() == amount - gs.parameters.resource_cell_resource_cost
@@ -0,0 +1,27 @@
+import sys
+import threading
+
+import instrumentation
+
+def test_counts_from_another_thread_are_not_lost_between_frames():
+	#The runtime's planner thread counts expanded points while the main thread ends frames
+	profiler = instrumentation.FrameProfiler(window = 100000)
+	counts_per_thread = 20000
+	interval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)
+	try:
+		threads = [threading.Thread(target = lambda: [profiler.count("expanded") for _ in range(counts_per_thread)])
+			for _ in range(2)]
+		for thread in threads:
+			thread.start()
+		while any(thread.is_alive() for thread in threads):
+			profiler.start_frame()
+			with profiler.phase("render"):
+				pass
+			profiler.end_frame()
+		for thread in threads:
+			thread.join()
+	finally:
+		sys.setswitchinterval(interval)
+	profiler.end_frame()
+	assert sum(profiler.counts["expanded"]) == 2 * counts_per_thread
@@ -0,0 +1,35 @@
+import sys
+
+import pytest
+
+import array_grid
+import game
+import game_map
+import journal
+import map_format
+
+def test_journals_from_before_the_rules_checksum_are_refused():
+	data = bytearray(journal.Journal(1, 90, 20).encode())
+	journal.HEADER.pack_into(data, 0, journal.MAGIC, 1, 0, 1, 90, 20, 0, 0)
+	with pytest.raises(ValueError, match = "before game rules"):
+		journal.Journal.decode(bytes(data))
+
+def test_negative_seeds_round_trip():
+	#Map files keep negative seeds, so games on them can be journaled
+	decoded = journal.Journal.decode(journal.Journal(-12345, 90, 20).encode())
+	assert decoded.seed == -12345
+
+def test_journaling_a_map_saved_without_a_seed_is_refused_at_startup(tmp_path, monkeypatch, capsys):
+	grid = game_map.get_grid(30, 12, array_grid.ArrayGrid)
+	grid.seed = None
+	path = str(tmp_path / "unseeded.map")
+	map_format.save_map(grid, path)
+	monkeypatch.setattr(sys, "argv", ["game.py", path, "--journal", str(tmp_path / "game.journal")])
+	with pytest.raises(SystemExit):
+		game.startGame()
+	assert "saved without one" in capsys.readouterr().err
+
+def test_read_seed_gives_the_seed_a_map_was_saved_with(tmp_path):
+	path = str(tmp_path / "seeded.map")
+	map_format.save_map(game_map.get_grid(30, 12, array_grid.ArrayGrid, seed = 7), path)
+	assert map_format.read_seed(path) == 7
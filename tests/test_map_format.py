@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+import array_grid
+import game_map
+import map_format
+
+@pytest.mark.parametrize("seed", [-12345, -(1 << 63), (1 << 63) - 1])
+def test_seeds_round_trip(tmp_path, seed):
+	grid = game_map.get_grid(30, 12, array_grid.ArrayGrid, seed = seed)
+	path = str(tmp_path / "seeded.map")
+	map_format.save_map(grid, path)
+	assert map_format.read_seed(path) == seed
+	loaded = map_format.load_grid(path)
+	assert loaded.seed == seed
+	assert np.array_equal(map_format.grid_kinds(loaded), map_format.grid_kinds(grid))
@@ -0,0 +1,37 @@
+import pytest
+
+import journal
+import outpost_timers
+import simulation
+import snapshot
+import sweep
+
+#Event scheduled outposts with fast forwarding have to play the same game as ticking every outpost every tick
+
+XM = 90
+YM = 20
+TICKS = 3000
+
+def play(seed, timers):
+	gs = simulation.create_game_state(XM, YM, seed = seed)
+	if timers:
+		outpost_timers.enable(gs.game_map, gs.parameters)
+	sim = simulation.Simulation(gs)
+	hashes = []
+	for tick, ops in sweep.builder_script(gs, seed, TICKS):
+		if timers:
+			sim.fast_forward(tick - sim.tick_count)
+		else:
+			for _ in range(tick - sim.tick_count):
+				sim.step()
+		sim.step(ops)
+		hashes.append(journal.state_hash(gs))
+	return gs, hashes
+
+@pytest.mark.parametrize("seed", range(6))
+def test_timers_play_the_same_game(seed):
+	ticked, ticked_hashes = play(seed, False)
+	timed, timed_hashes = play(seed, True)
+	assert len(ticked.game_map.outposts)
+	assert timed_hashes == ticked_hashes
+	assert snapshot.encode_snapshot(timed) == snapshot.encode_snapshot(ticked)
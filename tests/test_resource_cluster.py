@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+import game_map
+
+def per_step_remove_amount(amounts, amount_to_remove):
+	#remove_amount before the heap, max() over the resources for every step
+	if amount_to_remove > sum(amounts):
+		return False
+	left = amount_to_remove
+	while left > 0:
+		step = 10 if left > 10 else left
+		left -= 10
+		while step > 0:
+			highest = max(range(len(amounts)), key = lambda i: amounts[i])
+			taken = min(step, amounts[highest])
+			amounts[highest] -= taken
+			step -= taken
+	return True
+
+def make_cluster(rng, size):
+	cluster = game_map.ResourceCluster()
+	for i in range(size):
+		cluster.add_resource(game_map.Resource((i, 0), rng.choice([rng.randrange(100), rng.randrange(10), 99, 50, rng.randrange(5000)]), cluster))
+	return cluster
+
+def state(cluster):
+	return [resource.amount for resource in cluster.resources], cluster.get_total_amount(), sorted(cluster._heap)
+
+@pytest.mark.parametrize("seed", range(20))
+def test_bulk_withdrawal_matches_sequential_withdrawals(seed):
+	rng = random.Random(seed)
+	size = rng.choice([1, 2, 5, 40, 300])
+	bulk = make_cluster(random.Random(seed), size)
+	sequential = make_cluster(random.Random(seed), size)
+	amounts = [resource.amount for resource in sequential.resources]
+	for _ in range(5):
+		constructions = [rng.choice([0, 1, 7, 10, 11, 20, 150, rng.randrange(400)]) for _ in range(rng.randrange(1, 30))]
+		results = bulk.remove_amounts(constructions)
+		assert results == [sequential.remove_amount(amount) for amount in constructions]
+		assert results == [per_step_remove_amount(amounts, amount) for amount in constructions]
+		assert state(bulk) == state(sequential)
+		assert state(bulk)[0] == amounts
+		assert bulk.get_total_amount() == sum(amounts)
+
+def test_constructions_that_can_not_be_paid_leave_the_cluster_alone():
+	cluster = make_cluster(random.Random(1), 10)
+	total = cluster.get_total_amount()
+	before = state(cluster)
+	assert cluster.remove_amounts([total + 1, total + 50]) == [False, False]
+	assert state(cluster) == before
+	assert cluster.remove_amounts([total + 1, total, 1]) == [False, True, False]
+	assert cluster.get_total_amount() == 0